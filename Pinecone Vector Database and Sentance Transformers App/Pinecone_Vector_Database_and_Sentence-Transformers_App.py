@@ -1,26 +1,39 @@
 import os
-import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, Index, ServerlessSpec  # Import Pinecone and Index
-import json
-from tqdm import tqdm  # For progress bars
 from typing import List, Dict  # For type hinting
 import tkinter as tk
-from tkinter import filedialog, Text, Scrollbar, RIGHT, Y, BOTTOM, X, TOP, NONE
+from tkinter import filedialog
 import threading
+import sys
+
+# Make the shared docsearch package importable when the app is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docsearch.engine import PineconeEngine
+from docsearch.models import warm_models
 
 # --- Configuration ---
 PINECONE_API_KEY = 'YOUR_API_KEY'  # Replace with your Pinecone API key
 PINECONE_ENVIRONMENT = 'us-west1-gcp'  # Replace with your Pinecone environment
 INDEX_NAME = 'document-index'
 DEFAULT_LLM_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_BATCH_SIZE = 32  # Number of texts sent to the encoder per call
+EXTRACTION_WORKERS = None  # Worker processes used to extract documents (None uses one per CPU core)
+EXTRACTION_TIMEOUT = 300  # Seconds a single file may take before it is skipped
+OCR_CONFIG = {'language': 'eng', 'dpi': 300, 'page_workers': 2}  # OCR of images and scanned PDFs; see docsearch/ocr.py
+UPSERT_BATCH_SIZE = 100  # Vectors per upsert request
+UPSERT_MAX_PAYLOAD_BYTES = 2 * 1024 * 1024 - 64 * 1024  # Stay below Pinecone's 2 MB request limit
+UPSERT_WORKERS = 8  # Upsert requests sent concurrently
+CHUNK_TOKENS = None  # Tokens per chunk of page text (None uses the model's maximum input length)
+CHUNK_OVERLAP = 32  # Tokens shared by consecutive chunks
+POOLING = 'max'  # Rank documents by their best chunk ('max') or the mean of their best POOL_SIZE chunks ('topn')
+POOL_SIZE = 3
+# Use the in-process fake index instead of Pinecone (for testing without an API key); offline runs keep no state file
+PINECONE_OFFLINE = False
+SYNC_STATE_FILE = f"pinecone_sync_{INDEX_NAME}.json"  # Files and vector IDs already uploaded to the index
 # ---------------------
 
 # --- Global Variables ---
-index = None  # Initialize Pinecone index globally
-model = SentenceTransformer(DEFAULT_LLM_MODEL)  # Load default LLM model
+engine = None  # Search engine of the selected model, created on first use
+selected_model = DEFAULT_LLM_MODEL  # Loaded on first use by the shared model registry
 
 # --- UI Functions ---
 def select_document_directory():
@@ -37,16 +50,14 @@ def process_documents():
     """Loads, processes, and indexes documents in a separate thread."""
     def thread_function():
         try:
-            update_status("Loading documents...")
+            update_status("Indexing changed documents...")
             document_directory = document_directory_entry.get()
-            documents = load_documents(document_directory)
-
-            update_status("Creating index...")
-            global index
-            index = initialize_pinecone()
-            create_index(index, documents)
+            indexed, deleted, skipped_files = create_index(initialize_pinecone(), document_directory)
 
-            update_status("Indexing complete!")
+            message = f"Indexing complete! {indexed} documents updated, {deleted} stale vectors removed."
+            if skipped_files:
+                message += f" Skipped due to errors: {', '.join(skipped_files)}"
+            update_status(message)
         except Exception as e:
             update_status(f"Error: {e}")
 
@@ -58,7 +69,13 @@ def search_documents():
     if query:
         try:
             search_results.delete("1.0", tk.END)
-            search_index(index, query)
+            results = search_index(initialize_pinecone(), query)
+            if results:
+                for result in results:
+                    search_results.insert(tk.END, f"Filename: {result['filename']} (page {result['page']})\n")
+                    search_results.insert(tk.END, f"Score: {result['score']:.4f} ({result['hits']} matching passages)\n\n")
+            else:
+                search_results.insert(tk.END, "No matching documents found.\n")
         except Exception as e:
             search_results.insert(tk.END, f"Error: {e}")
 
@@ -67,124 +84,81 @@ def select_llm_model(model_name: str):
     global selected_model
     selected_model = model_name
 
-# --- Document Loading Functions ---
-def load_documents(directory: str) -> List[Dict]:
-    """Loads documents from the specified directory, handling various file types."""
-    documents = []
-    for filename in tqdm(os.listdir(directory), desc="Loading Documents"):
-        filepath = os.path.join(directory, filename)
-        if filename.endswith('.pdf'):
-            documents.append(load_pdf(filepath))
-        elif filename.endswith(('.png', '.jpg', '.jpeg')):
-            documents.append(load_image(filepath))
-        elif filename.endswith('.txt'):
-            documents.append(load_text_file(filepath))
-    return documents
-
-def load_pdf(filepath: str) -> Dict:
-    """Loads and processes a PDF file."""
-    doc = fitz.open(filepath)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-def load_image(filepath: str) -> Dict:
-    """Loads and processes an image file."""
-    image = Image.open(filepath)
-    text = pytesseract.image_to_string(image)
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-def load_text_file(filepath: str) -> Dict:
-    """Loads and processes a text file."""
-    with open(filepath, 'r') as file:
-        text = file.read()
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-def get_metadata(filepath: str) -> Dict:
-    """Extracts metadata from a file."""
-    return {
-        'filename': os.path.basename(filepath),
-        'size': os.path.getsize(filepath),
-        'creation_date': os.path.getctime(filepath)
-    }
-
 # --- Pinecone Index Management ---
-def initialize_pinecone():
-    """Initializes the Pinecone connection."""
-    pinecone = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)  # Create Pinecone instance
-    if INDEX_NAME not in pinecone.list_indexes():
-        pinecone.create_index(INDEX_NAME, dimension=len(model.encode("test text")),
-                              spec=ServerlessSpec(cloud="aws", region="us-east-1"))
-    return pinecone.Index(INDEX_NAME)  # Get the index object
-
-def create_index(index: Index, documents: List[Dict]):
-    """Creates or updates the Pinecone index with document embeddings."""
-    for i, doc in enumerate(tqdm(documents, desc="Creating Index")):
-        metadata = json.dumps(doc['metadata'])
-        index.upsert([(str(i), doc['embedding'].tolist(), {'metadata': metadata})])
-
-# --- Search Functionality (Modified to update UI) ---
-def search_index(index, query_str: str, top_k: int = 5) -> None:
-    """Searches the Pinecone index and updates the search results text area."""
-    query_embedding = model.encode(query_str).tolist()
-    
-    # Correct the query call here:
-    results = index.query(vector=query_embedding, top_k=top_k, include_metadata=True) 
-
-    if results['matches']:
-        for result in results['matches']:
-            metadata = json.loads(result['metadata']['metadata'])
-            score = result['score']
-            search_results.insert(tk.END, f"Filename: {metadata['filename']}\n")
-            search_results.insert(tk.END, f"Score: {score:.4f}\n\n")
-    else:
-        search_results.insert(tk.END, "No matching documents found.\n")
+def initialize_pinecone() -> PineconeEngine:
+    """Returns the search engine of the selected model.
+
+    The engine connects to Pinecone (creating the index if needed) on first use.
+    """
+    global engine
+    if engine is None or engine.model_name != selected_model:
+        engine = PineconeEngine(selected_model, INDEX_NAME, api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT,
+                                state_path=SYNC_STATE_FILE, offline=PINECONE_OFFLINE, workers=EXTRACTION_WORKERS,
+                                timeout=EXTRACTION_TIMEOUT, pooling=POOLING, pool_size=POOL_SIZE,
+                                embedding_batch_size=EMBEDDING_BATCH_SIZE, upsert_batch_size=UPSERT_BATCH_SIZE,
+                                max_payload_bytes=UPSERT_MAX_PAYLOAD_BYTES, upsert_workers=UPSERT_WORKERS,
+                                chunk_tokens=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP, ocr=OCR_CONFIG)
+    return engine
+
+def create_index(engine: PineconeEngine, document_directory: str):
+    """Brings the Pinecone index up to date with the documents in document_directory.
+
+    Only new or changed files (according to SYNC_STATE_FILE) are embedded and
+    upserted, and the vectors of changed and removed files are deleted.
+    Returns (indexed documents, deleted vectors, skipped_files).
+    """
+    report = engine.index(document_directory)
+    return report['indexed'], report['deleted'], report['skipped_files']
+
+# --- Search Functionality ---
+def search_index(engine: PineconeEngine, query_str: str, top_k: int = 5) -> List[Dict]:
+    """Searches the Pinecone index and returns the matches as {'filename', 'score', ...} dicts, best first."""
+    return engine.search(query_str, top_k)
 
 # --- Tinker Integration (Example) - Not implemented in UI ---
 # ... (Code from previous response)
 
 # --- UI Setup ---
-root = tk.Tk()
-root.title("Document Search App")
+# Only built when run as a script, so extraction worker processes can import this module
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.title("Document Search App")
 
-# --- Document Directory Selection ---
-document_directory_label = tk.Label(root, text="Document Directory:")
-document_directory_label.grid(row=0, column=0, padx=5, pady=5)
+    # --- Document Directory Selection ---
+    document_directory_label = tk.Label(root, text="Document Directory:")
+    document_directory_label.grid(row=0, column=0, padx=5, pady=5)
 
-document_directory_entry = tk.Entry(root, width=50)
-document_directory_entry.grid(row=0, column=1, padx=5, pady=5)
+    document_directory_entry = tk.Entry(root, width=50)
+    document_directory_entry.grid(row=0, column=1, padx=5, pady=5)
 
-document_directory_button = tk.Button(root, text="Browse", command=select_document_directory)
-document_directory_button.grid(row=0, column=2, padx=5, pady=5)
+    document_directory_button = tk.Button(root, text="Browse", command=select_document_directory)
+    document_directory_button.grid(row=0, column=2, padx=5, pady=5)
 
-# --- Process Documents Button ---
-process_button = tk.Button(root, text="Process Documents", command=process_documents)
-process_button.grid(row=1, column=0, columnspan=3, padx=5, pady=10)
+    # --- Process Documents Button ---
+    process_button = tk.Button(root, text="Process Documents", command=process_documents)
+    process_button.grid(row=1, column=0, columnspan=3, padx=5, pady=10)
 
-# --- Status Label ---
-status_label = tk.Label(root, text="Ready")
-status_label.grid(row=2, column=0, columnspan=3, padx=5, pady=5)
+    # --- Status Label ---
+    status_label = tk.Label(root, text="Ready")
+    status_label.grid(row=2, column=0, columnspan=3, padx=5, pady=5)
 
-# --- Search Bar ---
-search_label = tk.Label(root, text="Search:")
-search_label.grid(row=3, column=0, padx=5, pady=5)
+    # --- Search Bar ---
+    search_label = tk.Label(root, text="Search:")
+    search_label.grid(row=3, column=0, padx=5, pady=5)
 
-search_entry = tk.Text(root, height=2, width=50)
-search_entry.grid(row=3, column=1, padx=5, pady=5)
+    search_entry = tk.Text(root, height=2, width=50)
+    search_entry.grid(row=3, column=1, padx=5, pady=5)
 
-search_button = tk.Button(root, text="Search", command=search_documents)
-search_button.grid(row=3, column=2, padx=5, pady=5)
+    search_button = tk.Button(root, text="Search", command=search_documents)
+    search_button.grid(row=3, column=2, padx=5, pady=5)
 
-# --- Search Results ---
-search_results_label = tk.Label(root, text="Search Results:")
-search_results_label.grid(row=4, column=0, padx=5, pady=5)
+    # --- Search Results ---
+    search_results_label = tk.Label(root, text="Search Results:")
+    search_results_label.grid(row=4, column=0, padx=5, pady=5)
 
-search_results = tk.Text(root, wrap=tk.WORD, height=10, width=70)
-search_results.grid(row=5, column=0, columnspan=3, padx=5, pady=5)
+    search_results = tk.Text(root, wrap=tk.WORD, height=10, width=70)
+    search_results.grid(row=5, column=0, columnspan=3, padx=5, pady=5)
 
-# --- Run the UI ---
-root.mainloop()
+    # --- Run the UI ---
+    warm_models([selected_model])  # Load the model while the window opens
+    root.mainloop()
@@ -1,14 +1,13 @@
 import os
-import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
-from tqdm import tqdm
 import tkinter as tk
 from tkinter import filedialog, Text, messagebox
 import shutil
+import sys
+
+# Make the shared docsearch package importable when the app is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docsearch.engine import FaissEngine, HybridEngine
+from docsearch.models import warm_models
 
 # LLM Model Options
 MODEL_OPTIONS = [
@@ -20,120 +19,164 @@ MODEL_OPTIONS = [
     # Add more models here...
 ]
 
-# Function to load and embed a single document
-def load_and_embed_document(filepath, model):
-    if filepath.endswith('.pdf'):
-        return load_pdf(filepath, model)
-    elif filepath.endswith(('.png', '.jpg', '.jpeg')):
-        return load_image(filepath, model)
-    elif filepath.endswith('.txt'):
-        return load_text_file(filepath, model)
-    else:
-        return None
-
-# Load functions for different document types
-def load_pdf(filepath, model):
-    doc = fitz.open(filepath)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-def load_image(filepath, model):
-    image = Image.open(filepath)
-    text = pytesseract.image_to_string(image)
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-def load_text_file(filepath, model):
-    with open(filepath, 'r', encoding='utf-8') as file:
-        text = file.read()
-    embedding = model.encode(text)
-    return {'text': text, 'embedding': embedding, 'metadata': get_metadata(filepath)}
-
-# Function to extract metadata from a file
-def get_metadata(filepath):
-    return {
-        'filename': os.path.basename(filepath),
-        'size': os.path.getsize(filepath),
-        'creation_date': os.path.getctime(filepath)
-    }
-
-# Function to create a Faiss index from document embeddings
-def create_index(documents):
-    dimension = len(documents[0]['embedding'])
-    index = faiss.IndexFlatL2(dimension)
-    embeddings = np.array([doc['embedding'] for doc in documents])
-    index.add(embeddings)
-    return index
-
-# Function to search the Faiss index for similar documents
-def search_index(index, query_embedding, metadata, top_k=5):
-    distances, indices = index.search(np.array([query_embedding]), top_k)
-    results = []
-    for i in range(top_k):
-        result = metadata[indices[0][i]]
-        result['distance'] = distances[0][i]
-        results.append(result)
-    return results
-
-# --- Tkinter UI ---
-def browse_directory():
-    directory = filedialog.askdirectory()
-    directory_entry.delete(0, tk.END)
-    directory_entry.insert(0, directory)
-
-def browse_destination():
-    directory = filedialog.askdirectory()
-    destination_entry.delete(0, tk.END)
-    destination_entry.insert(0, directory)
-
-def run_search():
-    query = query_entry.get("1.0", tk.END).strip()
-    selected_model = model_var.get()
-    destination_folder = destination_entry.get()
-
-    if not query or not directory_entry.get() or not destination_folder:
-        result_text.delete("1.0", tk.END)
-        result_text.insert(tk.END, "Please enter a query, select source directory, and destination folder.")
-        return
-
-    # Load Model
-    model = SentenceTransformer(selected_model)
-
-    # Load Documents with Progress Bar
-    document_directory = directory_entry.get()
-    filepaths = [os.path.join(document_directory, filename) for filename in os.listdir(document_directory)]
-    documents = []
-    for fp in tqdm(filepaths, desc="Loading Documents"):
-        doc = load_and_embed_document(fp, model)
-        if doc:
-            documents.append(doc)
-
-    # Create Index
-    index = create_index(documents)
-    metadata = [doc['metadata'] for doc in documents]
-
-    # Search
-    query_embedding = model.encode(query)
-    results = search_index(index, query_embedding, metadata)
-
-    # Display Results and Copy Files
-    result_text.delete("1.0", tk.END)
-    for result in results:
-        result_text.insert(tk.END, f"Filename: {result['filename']}\n")
-        result_text.insert(tk.END, f"Distance: {result['distance']:.4f}\n\n")
-
-        # Copy the file to the destination folder
-        source_filepath = os.path.join(document_directory, result['filename'])
-        destination_filepath = os.path.join(destination_folder, result['filename'])
-        try:
-            shutil.copy2(source_filepath, destination_filepath)  # Copy with metadata
-        except Exception as e:
-            messagebox.showerror("Error Copying File", f"Could not copy {result['filename']}: {str(e)}")
+# Number of texts sent to the encoder per call
+EMBEDDING_BATCH_SIZE = 32
+
+# Worker processes used to extract documents (None uses one per CPU core) and the
+# number of seconds a single file may take before it is skipped
+EXTRACTION_WORKERS = None
+EXTRACTION_TIMEOUT = 300
+
+# OCR of images and of scanned PDF pages without a text layer: images are scaled to 'dpi', turned
+# to grayscale and binarized first, blank ones are skipped, and 'page_workers' pages of a scanned
+# PDF are OCR'd at a time. See DEFAULT_OCR_CONFIG in docsearch/ocr.py for all settings
+OCR_CONFIG = {
+    'language': 'eng',
+    'dpi': 300,
+    'page_workers': 2,
+}
+
+# Persistent index directory; each model gets its own subdirectory inside it
+INDEX_DIRECTORY = "faiss_indexdir"
+
+# Faiss index settings: index_type is one of 'flat', 'ivf_flat', 'ivf_pq' or 'hnsw' and metric
+# is 'l2' or 'cosine'. storage 'float16' or 'int8' keeps the index vectors quantized at half or a
+# quarter of the memory; the best candidates are then rescored with the full-precision vectors on
+# disk. See DEFAULT_INDEX_CONFIG in docsearch/faiss_store.py for all settings and run
+# "python -m docsearch.benchmarks.ann" to compare them on your own corpus
+INDEX_CONFIG = {
+    'index_type': 'flat',
+    'metric': 'l2',
+    'storage': 'float16',
+}
+
+# Hybrid search also keeps a Whoosh keyword index of the same pages, built in the same extraction
+# pass, and fuses both result lists: 'rrf' (reciprocal rank fusion) or 'weighted' (normalised scores)
+KEYWORD_INDEX_DIRECTORY = "whoosh_indexdir"
+HYBRID_FUSION = 'rrf'
+HYBRID_WEIGHTS = {'whoosh': 1.0, 'faiss': 1.0}
+
+# Pages are split into chunks of CHUNK_TOKENS tokens (None uses the model's maximum input length)
+# that overlap by CHUNK_OVERLAP tokens. The chunks matching a query are pooled per document:
+# 'max' ranks a document by its best chunk, 'topn' by the mean of its best POOL_SIZE chunks
+CHUNK_TOKENS = None
+CHUNK_OVERLAP = 32
+POOLING = 'max'
+POOL_SIZE = 3
+
+# Create the search engine of a model; indexing and searching live in docsearch/engine.py
+# Documents are streamed page by page: each chunk becomes one vector, and its text is dropped
+# as soon as it has been embedded
+def create_engine(model_name, hybrid=False, index_directory=INDEX_DIRECTORY):
+    if hybrid:
+        return HybridEngine(KEYWORD_INDEX_DIRECTORY, index_directory, model_name, INDEX_CONFIG, fusion=HYBRID_FUSION,
+                            weights=HYBRID_WEIGHTS, batch_size=EMBEDDING_BATCH_SIZE, workers=EXTRACTION_WORKERS,
+                            timeout=EXTRACTION_TIMEOUT, chunk_tokens=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP,
+                            pooling=POOLING, pool_size=POOL_SIZE, ocr=OCR_CONFIG)
+    return FaissEngine(index_directory, model_name, INDEX_CONFIG, batch_size=EMBEDDING_BATCH_SIZE,
+                       workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT, chunk_tokens=CHUNK_TOKENS,
+                       chunk_overlap=CHUNK_OVERLAP, pooling=POOLING, pool_size=POOL_SIZE,
+                       ocr=OCR_CONFIG)
+
+# Engines are kept per model and mode, so indexing runs and searches reuse their thread pools
+engines = {}
+
+def get_engine(model_name, hybrid=False):
+    if (model_name, hybrid) not in engines:
+        engines[(model_name, hybrid)] = create_engine(model_name, hybrid)
+    return engines[(model_name, hybrid)]
 
 def main():
+    # --- Tkinter UI ---
+    def browse_directory():
+        directory = filedialog.askdirectory()
+        directory_entry.delete(0, tk.END)
+        directory_entry.insert(0, directory)
+
+    def browse_destination():
+        directory = filedialog.askdirectory()
+        destination_entry.delete(0, tk.END)
+        destination_entry.insert(0, directory)
+
+    # Build (or rebuild) the persistent index for the selected model
+    def start_indexing():
+        document_directory = directory_entry.get()
+        selected_model = model_var.get()
+        if not document_directory:
+            messagebox.showwarning("No Source Directory", "Please select a source directory to index.")
+            return
+
+        report = get_engine(selected_model, hybrid_var.get()).index(document_directory)
+        skipped_files = report['skipped_files']
+        messagebox.showinfo("Indexing Complete", f"Indexed {report['indexed']} documents with {selected_model}.")
+
+        if skipped_files:
+            error_message = "The following files were skipped due to errors:\n\n" + "\n".join(skipped_files)
+            messagebox.showwarning("Skipped Files", error_message)
+
+    # Search the persistent index and copy matching files to the destination folder
+    def run_search():
+        query = query_entry.get("1.0", tk.END).strip()
+        selected_model = model_var.get()
+        destination_folder = destination_entry.get()
+
+        if not query or not destination_folder:
+            result_text.delete("1.0", tk.END)
+            result_text.insert(tk.END, "Please enter a query and select a destination folder.")
+            return
+
+        # Optional metadata filters, e.g. "pdf, txt" and "2024-01-31"
+        filters = {
+            'types': [t.strip() for t in types_entry.get().split(',') if t.strip()] or None,
+            'created_after': created_after_entry.get().strip() or None,
+        }
+        filters = {key: value for key, value in filters.items() if value is not None}
+        if filters and hybrid_var.get():
+            messagebox.showwarning("Filters Not Supported", "Filters only apply to semantic search.")
+            return
+
+        engine = get_engine(selected_model, hybrid_var.get())
+        latency_ms = None
+        try:
+            if hybrid_var.get():
+                response = engine.hybrid_search(query)
+                results, latency_ms = response['results'], response['latency_ms']
+            else:
+                results = engine.search(query, filters=filters)
+            document_directory = engine.source_directory
+        except ValueError as e:  # An unreadable date
+            messagebox.showwarning("Invalid Filter", str(e))
+            return
+        except FileNotFoundError as e:
+            result_text.delete("1.0", tk.END)
+            result_text.insert(tk.END, str(e))
+            return
+
+        # Display Results and Copy Files
+        result_text.delete("1.0", tk.END)
+        if latency_ms is not None:
+            timings = ", ".join(f"{leg} {ms:.1f} ms" for leg, ms in latency_ms.items())
+            result_text.insert(tk.END, f"Latency: {timings}\n\n")
+        copied = set()
+        for result in results:
+            result_text.insert(tk.END, f"Filename: {result['filename']} (page {result['page']})\n")
+            if 'distance' in result:
+                result_text.insert(tk.END, f"Distance: {result['distance']:.4f} ({result['hits']} matching passages)\n\n")
+            else:
+                ranks = ", ".join(f"{leg} #{leg_result['rank']}" for leg, leg_result in result['legs'].items())
+                result_text.insert(tk.END, f"Score: {result['score']:.4f} ({ranks})\n\n")
+
+            # Copy the file to the destination folder, once even if several of its pages matched
+            if result['path'] in copied:
+                continue
+            copied.add(result['path'])
+            source_filepath = os.path.join(document_directory, result['path'])
+            destination_filepath = os.path.join(destination_folder, result['filename'])
+            try:
+                shutil.copy2(source_filepath, destination_filepath)  # Copy with metadata
+            except Exception as e:
+                messagebox.showerror("Error Copying File", f"Could not copy {result['filename']}: {str(e)}")
+
     # Create main window
     root = tk.Tk()
     root.title("Semantic Document Search")
@@ -168,25 +211,53 @@ def main():
     model_dropdown = tk.OptionMenu(root, model_var, *MODEL_OPTIONS)
     model_dropdown.grid(row=2, column=1, padx=5, pady=5)
 
+    # Load the selected model in the background so the first search or indexing run doesn't wait for it
+    model_var.trace_add("write", lambda *args: warm_models([model_var.get()]))
+
+    # Hybrid keyword + semantic search
+    hybrid_var = tk.BooleanVar(root, value=False)
+    hybrid_checkbox = tk.Checkbutton(root, text="Hybrid (keyword + semantic)", variable=hybrid_var)
+    hybrid_checkbox.grid(row=2, column=2, padx=5, pady=5)
+
+    # Index Button
+    index_button = tk.Button(root, text="Index Documents", command=start_indexing)
+    index_button.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
+
     # Query Input
     query_label = tk.Label(root, text="Enter your query:")
-    query_label.grid(row=3, column=0, padx=5, pady=5)
+    query_label.grid(row=4, column=0, padx=5, pady=5)
 
     query_entry = tk.Text(root, height=3)
-    query_entry.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+    query_entry.grid(row=5, column=0, columnspan=3, padx=5, pady=5)
+
+    # Metadata Filters
+    types_label = tk.Label(root, text="File types (e.g. pdf, txt):")
+    types_label.grid(row=6, column=0, padx=5, pady=5)
+
+    types_entry = tk.Entry(root, width=50)
+    types_entry.grid(row=6, column=1, padx=5, pady=5)
+
+    created_after_label = tk.Label(root, text="Created after (YYYY-MM-DD):")
+    created_after_label.grid(row=7, column=0, padx=5, pady=5)
+
+    created_after_entry = tk.Entry(root, width=50)
+    created_after_entry.grid(row=7, column=1, padx=5, pady=5)
 
     # Search Button
     search_button = tk.Button(root, text="Search", command=run_search)
-    search_button.grid(row=5, column=0, columnspan=3, padx=5, pady=5)
+    search_button.grid(row=8, column=0, columnspan=3, padx=5, pady=5)
 
     # Results
     result_label = tk.Label(root, text="Search Results:")
-    result_label.grid(row=6, column=0, padx=5, pady=5)
+    result_label.grid(row=9, column=0, padx=5, pady=5)
 
     result_text = tk.Text(root, wrap=tk.WORD)
-    result_text.grid(row=7, column=0, columnspan=3, padx=5, pady=5)
+    result_text.grid(row=10, column=0, columnspan=3, padx=5, pady=5)
 
+    warm_models([model_var.get()])
     root.mainloop()
+    for engine in engines.values():
+        engine.close()
 
 if __name__ == "__main__":
     main()
@@ -1,92 +1,82 @@
 import os
-import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
-from whoosh.index import create_in, open_dir
-from whoosh.fields import Schema, TEXT, ID, STORED
-from whoosh.analysis import StemmingAnalyzer
-from whoosh.qparser import QueryParser
-from tqdm import tqdm
 import tkinter as tk
 from tkinter import filedialog, Text, END
 import shutil
-
-# Load documents from a directory, handling different file types (PDF, image, text)
-def load_documents(directory):
-    documents = []
-    skipped_files = []  # Store files that caused errors
-    for filename in tqdm(os.listdir(directory), desc="Loading Documents"):
-        filepath = os.path.join(directory, filename)
-        try:
-            if filename.endswith('.pdf'):
-                documents.append(load_pdf(filepath))
-            elif filename.endswith(('.png', '.jpg', '.jpeg')):
-                documents.append(load_image(filepath))
-            elif filename.endswith('.txt'):
-                documents.append(load_text_file(filepath))
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-            skipped_files.append(filename)  # Add problematic file to the list
-    return documents, skipped_files
-
-# Load and process a PDF file, extracting its text content
-def load_pdf(filepath):
-    doc = fitz.open(filepath)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return {'text': text, 'metadata': get_metadata(filepath)}
-
-# Load and process an image file, extracting text using OCR (pytesseract)
-def load_image(filepath):
-    image = Image.open(filepath)
-    text = pytesseract.image_to_string(image)
-    return {'text': text, 'metadata': get_metadata(filepath)}
-
-# Load and process a text file, reading its content
-def load_text_file(filepath):
-    with open(filepath, 'r') as file:
-        text = file.read()
-    return {'text': text, 'metadata': get_metadata(filepath)}
-
-# Extract metadata from a file, including filename, size, and creation date
-def get_metadata(filepath):
-    return {
-        'filename': os.path.basename(filepath),
-        'size': os.path.getsize(filepath),
-        'creation_date': os.path.getctime(filepath)
-    }
-
-# Create an index from the loaded documents using Whoosh
-def create_index(directory, documents):
-    schema = Schema(filename=ID(stored=True),
-                    size=STORED,
-                    creation_date=STORED,
-                    content=TEXT(analyzer=StemmingAnalyzer()))
-
-    if not os.path.exists(directory):
-        os.mkdir(directory)
-
-    index = create_in(directory, schema)
-    writer = index.writer()
-
-    for doc in tqdm(documents, desc="Indexing"):
-        writer.add_document(filename=doc['metadata']['filename'],
-                            size=doc['metadata']['size'],
-                            creation_date=doc['metadata']['creation_date'],
-                            content=doc['text'])
-    writer.commit()
-
-# Search the index for a given query string and return matching documents' filenames
-def search_index(directory, query_str):
-    index = open_dir(directory)
-    query = QueryParser("content", index.schema).parse(query_str)
-    with index.searcher() as searcher:
-        results = searcher.search(query)
-        return [{'filename': result['filename']} for result in results]  # Return only filenames
+import sys
+import threading
+
+# Make the shared docsearch package importable when the app is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docsearch.engine import WhooshEngine
+from docsearch.watch import watch_directory
+
+# Worker processes used to extract documents (None uses one per CPU core) and the
+# number of seconds a single file may take before it is skipped
+EXTRACTION_WORKERS = None
+EXTRACTION_TIMEOUT = 300
+
+# OCR of images and of scanned PDF pages without a text layer: images are scaled to 'dpi', turned
+# to grayscale and binarized first, blank ones are skipped, and 'page_workers' pages of a scanned
+# PDF are OCR'd at a time. See DEFAULT_OCR_CONFIG in docsearch/ocr.py for all settings
+OCR_CONFIG = {
+    'language': 'eng',
+    'dpi': 300,
+    'page_workers': 2,
+}
+
+# Directory of the Whoosh index and the number of pages returned per search
+INDEX_DIRECTORY = "indexdir"
+SEARCH_LIMIT = 10
+
+# Index writer settings: WRITER_PROCS processes (None uses one per CPU core) analyse pages in
+# parallel, each buffering up to WRITER_LIMITMB MB. With WRITER_MULTISEGMENT their segments are
+# not merged at commit. Merging them into one rewrites the whole index, so it is off by default:
+# OPTIMIZE_AFTER_REBUILD merges them after a full (non-incremental) re-index, and with
+# OPTIMIZE_SEGMENT_LIMIT set they are merged once an update leaves more segments than that
+WRITER_PROCS = None
+WRITER_LIMITMB = 128
+WRITER_MULTISEGMENT = True
+OPTIMIZE_AFTER_REBUILD = False
+OPTIMIZE_SEGMENT_LIMIT = None
+
+# With "Watch for changes" checked, files created, changed or deleted in the source folder are
+# applied to the index WATCH_DEBOUNCE seconds after the last change, without re-indexing the folder
+WATCH_DEBOUNCE = 2.0
+
+# Create the search engine; indexing and searching live in docsearch/whoosh_index.py
+def create_engine(incremental=True):
+    return WhooshEngine(INDEX_DIRECTORY, incremental=incremental, workers=EXTRACTION_WORKERS,
+                        timeout=EXTRACTION_TIMEOUT, procs=WRITER_PROCS, limitmb=WRITER_LIMITMB,
+                        multisegment=WRITER_MULTISEGMENT, ocr=OCR_CONFIG)
 
 # Main function to set up the GUI and handle user interactions
 def main():
+    watcher = {'stop_event': None, 'thread': None}
+
+    # Stop watching the source folder, waiting for an update in progress to finish
+    def stop_watching():
+        if watcher['stop_event'] is not None:
+            watcher['stop_event'].set()
+            watcher['thread'].join()
+            watcher['stop_event'] = watcher['thread'] = None
+
+    # Keep the index up to date with the source folder in a background thread; small updates use one writer process
+    def start_watching(document_directory):
+        stop_watching()
+        engine = WhooshEngine(INDEX_DIRECTORY, workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT, ocr=OCR_CONFIG)
+        watcher['stop_event'] = threading.Event()
+        watcher['thread'] = threading.Thread(target=watch_directory, args=(engine, document_directory),
+                                             kwargs={'debounce': WATCH_DEBOUNCE, 'stop_event': watcher['stop_event']},
+                                             daemon=True)
+        watcher['thread'].start()
+
+    def toggle_watching():
+        document_directory = source_folder_entry.get()
+        if watch_var.get() and document_directory:
+            start_watching(document_directory)
+        else:
+            stop_watching()
+
     # Select source folder for documents
     def select_source_folder():
         folder_selected = filedialog.askdirectory()
@@ -102,9 +92,15 @@ def main():
     # Start indexing process
     def start_indexing():
         document_directory = source_folder_entry.get()
-        index_directory = "indexdir"
-        documents, skipped_files = load_documents(document_directory)
-        create_index(index_directory, documents)
+        stop_watching()  # Only one writer may update the index at a time
+        incremental = incremental_var.get()
+        engine = create_engine(incremental=incremental)
+        skipped_files = engine.index(document_directory)['skipped_files']
+        if (OPTIMIZE_AFTER_REBUILD and not incremental
+                or OPTIMIZE_SEGMENT_LIMIT is not None and engine.segment_count() > OPTIMIZE_SEGMENT_LIMIT):
+            engine.optimize()
+        if watch_var.get():
+            start_watching(document_directory)
 
         if skipped_files:
             error_message = "The following files were skipped due to errors:\n\n" + "\n".join(skipped_files)
@@ -113,16 +109,19 @@ def main():
     # Search the index and copy matching documents to the destination folder
     def search_and_copy():
         document_directory = source_folder_entry.get()
-        index_directory = "indexdir"
         destination_directory = destination_folder_entry.get()
         query = search_entry.get("1.0", END).strip()
 
-        results = search_index(index_directory, query)
+        results = create_engine().search(query, SEARCH_LIMIT)
+        copied = set()
         for result in results:
-            source_path = os.path.join(document_directory, result['filename'])
+            print(f"{result['filename']} (page {result['page']}, score {result['score']:.2f}): {result['highlights']}")
+            if result['path'] in copied:  # Several pages of the same file matched
+                continue
+            copied.add(result['path'])
+            source_path = os.path.join(document_directory, result['path'])
             destination_path = os.path.join(destination_directory, result['filename'])
             shutil.copy2(source_path, destination_path)
-            print(result)
 
     # --- GUI ---
     window = tk.Tk()
@@ -148,9 +147,17 @@ def main():
     destination_folder_button = tk.Button(window, text="Browse", command=select_destination_folder)
     destination_folder_button.grid(row=1, column=2, padx=5, pady=5)
 
-    # Index documents button
+    # Index documents button, with the option to only re-index files that changed
     index_button = tk.Button(window, text="Index Documents", command=start_indexing)
-    index_button.grid(row=2, column=0, columnspan=3, pady=10)
+    index_button.grid(row=2, column=0, columnspan=2, pady=10)
+
+    incremental_var = tk.BooleanVar(window, value=True)
+    incremental_checkbox = tk.Checkbutton(window, text="Only changed files", variable=incremental_var)
+    incremental_checkbox.grid(row=2, column=2, padx=5, pady=10)
+
+    watch_var = tk.BooleanVar(window, value=False)
+    watch_checkbox = tk.Checkbutton(window, text="Watch for changes", variable=watch_var, command=toggle_watching)
+    watch_checkbox.grid(row=3, column=2, padx=5, pady=5)
 
     # Search label and entry
     search_label = tk.Label(window, text="Search:")
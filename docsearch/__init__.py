@@ -0,0 +1,6 @@
+"""Shared building blocks for the document search apps.
+
+The Whoosh, Sentence-Transformers and Pinecone apps each live in their own
+folder and are run as scripts; they add the repository root to ``sys.path``
+so the modules in this package can be imported from any of them.
+"""
@@ -0,0 +1 @@
+"""Benchmarks for the document search pipelines; each module is runnable with ``python -m``."""
@@ -0,0 +1,131 @@
+"""Recall/latency benchmark for the FAISS index types in docsearch.faiss_store.
+
+Builds every index type over the same vectors and reports, for each search
+setting, recall@k against the exact flat index, p50/p99 single-query
+latency, build time and serialized index size. Vectors come either from an
+existing store or from a synthetic clustered dataset:
+
+    python -m docsearch.benchmarks.ann --store faiss_indexdir --model all-MiniLM-L6-v2
+    python -m docsearch.benchmarks.ann --synthetic 200000 --dimension 384 --output ann.json
+    python -m docsearch.benchmarks.ann --synthetic 200000 --storage int8
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from docsearch.faiss_store import (INDEX_TYPES, METRICS, STORAGE_TYPES, build_faiss_index, index_config, open_store,
+                                   prepare_vectors, set_search_params)
+
+# Search settings swept for each index type; the index is built once per type
+SEARCH_SWEEPS = {
+    'flat': [{}],
+    'ivf_flat': [{'nprobe': nprobe} for nprobe in (1, 4, 16, 64)],
+    'ivf_pq': [{'nprobe': nprobe} for nprobe in (4, 16, 64)],
+    'hnsw': [{'ef_search': ef_search} for ef_search in (16, 64, 256)],
+}
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Returns clustered random vectors, which behave more like text embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=count)]
+    vectors += 0.3 * rng.normal(size=(count, dimension)).astype(np.float32)
+    return vectors
+
+
+def sample_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Returns perturbed copies of random corpus vectors, so queries are near, but not equal to, stored vectors."""
+    rng = np.random.default_rng(seed)
+    queries = np.array(vectors[np.sort(rng.choice(len(vectors), min(count, len(vectors)), replace=False))],
+                       dtype=np.float32)
+    queries += 0.05 * float(np.std(queries)) * rng.normal(size=queries.shape).astype(np.float32)
+    return queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the true top-k neighbours that appear in the returned top-k, averaged over queries."""
+    hits = sum(len(np.intersect1d(row, true_row[true_row >= 0])) for row, true_row in zip(found, truth))
+    return hits / max(1, int(np.sum(truth >= 0)))
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 10, metric: str = 'l2',
+                  index_types=INDEX_TYPES, storage: str = 'float32') -> list:
+    """Benchmarks each index type and search setting, returning one result dict per setting."""
+    prepared_queries = prepare_vectors(queries, metric)
+    truth = None
+    if storage != 'float32':  # A quantized flat index is not exact, so the truth comes from a float32 one
+        _, truth = build_faiss_index(vectors, index_config(metric=metric)).search(prepared_queries, k)
+    results = []
+    for index_type in ('flat',) + tuple(t for t in index_types if t != 'flat'):
+        config = index_config(index_type=index_type, metric=metric, storage=storage)
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, config)
+        build_seconds = time.perf_counter() - start
+        memory_bytes = int(faiss.serialize_index(index).nbytes)
+        for params in SEARCH_SWEEPS[index_type]:
+            set_search_params(index, params.get('nprobe'), params.get('ef_search'))
+            latencies = []
+            found = np.empty((len(queries), k), dtype=np.int64)
+            for i in range(len(queries)):
+                start = time.perf_counter()
+                _, found[i:i + 1] = index.search(prepared_queries[i:i + 1], k)
+                latencies.append(time.perf_counter() - start)
+            if truth is None:  # The first setting is the exact flat index
+                truth = found.copy()
+            if index_type in index_types:
+                results.append({
+                    'index_type': index_type,
+                    'metric': metric,
+                    'storage': storage,
+                    'params': params,
+                    'vectors': len(vectors),
+                    f'recall@{k}': round(recall_at_k(found, truth), 4),
+                    'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+                    'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+                    'build_seconds': round(build_seconds, 3),
+                    'index_bytes': memory_bytes,
+                })
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--store', help="index directory of the Sentence-Transformers app (e.g. faiss_indexdir)")
+    source.add_argument('--synthetic', type=int, metavar='N', help="benchmark N synthetic vectors instead")
+    parser.add_argument('--model', help="model whose store to load with --store")
+    parser.add_argument('--dimension', type=int, default=384, help="dimension of synthetic vectors")
+    parser.add_argument('--metric', choices=METRICS, default='l2')
+    parser.add_argument('--index-types', nargs='+', choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument('--storage', choices=STORAGE_TYPES, default='float32',
+                        help="vector encoding of the flat, IVF-Flat and HNSW indexes")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.store:
+        if not args.model:
+            parser.error("--model is required with --store")
+        vectors = open_store(args.store, args.model).embeddings
+    else:
+        vectors = synthetic_vectors(args.synthetic, args.dimension)
+    results = run_benchmark(vectors, sample_queries(vectors, args.queries), args.k, args.metric, args.index_types,
+                            args.storage)
+
+    print(f"{'index':<10}{'params':<20}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}{'MiB':>10}")
+    for result in results:
+        params = ', '.join(f"{key}={value}" for key, value in result['params'].items())
+        print(f"{result['index_type']:<10}{params:<20}{result[f'recall@{args.k}']:>10.4f}"
+              f"{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['index_bytes'] / 2**20:>10.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Reproducible synthetic corpus of every supported document format.
+
+generate_corpus writes .txt files, text PDFs, scanned PDFs (pages that are
+only images of text, with no text layer), and .png and .jpg images of text.
+Documents draw their words from a fixed vocabulary and a per-document
+topic, so the same seed always produces the same files and queries built
+from topic words have known matches:
+
+    python -m docsearch.benchmarks.corpus corpus/ --documents 500 --pages 3
+"""
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+FORMATS = ('txt', 'pdf', 'scanned_pdf', 'png', 'jpg')
+DEFAULT_MIX = {'txt': 4, 'pdf': 3, 'scanned_pdf': 1, 'png': 1, 'jpg': 1}
+TOPICS = ('revenue', 'invoice', 'contract', 'holiday', 'engine', 'garden', 'vaccine', 'satellite',
+          'mortgage', 'football', 'recipe', 'telescope', 'election', 'glacier', 'software', 'orchestra')
+VOCABULARY = ('the', 'report', 'quarter', 'customer', 'project', 'meeting', 'annual', 'market', 'result',
+              'team', 'plan', 'review', 'budget', 'travel', 'summary', 'schedule', 'update', 'policy',
+              'service', 'support', 'account', 'product', 'office', 'system', 'network', 'record',
+              'document', 'analysis', 'growth', 'risk', 'quality', 'design', 'research', 'training')
+WORDS_PER_PAGE = 250
+IMAGE_SIZE = (1240, 1754)  # A4 at 150 DPI
+IMAGE_WORDS_PER_LINE = 10
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """Parses a format mix such as 'txt=4,pdf=3,png=1' into relative weights."""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in FORMATS:
+            raise ValueError(f"Unknown format '{name}'; expected one of {', '.join(FORMATS)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def page_text(rng: random.Random, topic: str, words: int = WORDS_PER_PAGE) -> str:
+    """Returns a page of filler text in which roughly one word in twenty is the topic."""
+    return ' '.join(topic if rng.random() < 0.05 else rng.choice(VOCABULARY) for _ in range(words))
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def render_text(text: str, size=IMAGE_SIZE, font_size: int = 28) -> Image.Image:
+    """Renders text as black lines on a white page, like a scanned document."""
+    image = Image.new('L', size, color=255)
+    draw = ImageDraw.Draw(image)
+    font = _font(font_size)
+    words = text.split()
+    y = 60
+    for start in range(0, len(words), IMAGE_WORDS_PER_LINE):
+        if y > size[1] - 60:
+            break
+        draw.text((60, y), ' '.join(words[start:start + IMAGE_WORDS_PER_LINE]), fill=0, font=font)
+        y += int(font_size * 1.6)
+    return image
+
+
+def _write_text_pdf(path: str, pages: List[str]) -> None:
+    document = fitz.open()
+    for text in pages:
+        page = document.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=10)
+    document.save(path)
+    document.close()
+
+
+def _write_scanned_pdf(path: str, pages: List[str]) -> None:
+    document = fitz.open()
+    for text in pages:
+        page = document.new_page()
+        image_path = path + '.page.png'
+        render_text(text).save(image_path)
+        page.insert_image(page.rect, filename=image_path)
+        os.remove(image_path)
+    document.save(path, deflate=True)
+    document.close()
+
+
+def generate_corpus(directory: str, documents: int = 100, pages: int = 3, mix: Dict[str, int] = None,
+                    seed: int = 0) -> List[Dict]:
+    """Writes the corpus to directory and returns one {'filename', 'format', 'topic', 'pages'} dict per file.
+
+    pages is the number of pages of PDFs and text files; images always have
+    a single page. Formats are assigned by the relative weights in mix.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    formats = [name for name in FORMATS if mix.get(name)]
+    weights = [mix[name] for name in formats]
+    files = []
+    for i in range(documents):
+        kind = rng.choices(formats, weights)[0]
+        topic = rng.choice(TOPICS)
+        page_count = 1 if kind in ('png', 'jpg') else pages
+        texts = [page_text(rng, topic) for _ in range(page_count)]
+        extension = 'pdf' if kind == 'scanned_pdf' else kind
+        filename = f"doc-{i:06d}-{kind}.{extension}"
+        path = os.path.join(directory, filename)
+        if kind == 'txt':
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('\n\n'.join(texts))
+        elif kind == 'pdf':
+            _write_text_pdf(path, texts)
+        elif kind == 'scanned_pdf':
+            _write_scanned_pdf(path, texts)
+        elif kind == 'jpg':
+            render_text(texts[0]).save(path, quality=85)
+        else:
+            render_text(texts[0]).save(path)
+        files.append({'filename': filename, 'format': kind, 'topic': topic, 'pages': page_count})
+    return files
+
+
+def sample_queries(count: int, seed: int = 0) -> List[str]:
+    """Returns count queries made of a topic word and a vocabulary word."""
+    rng = random.Random(seed)
+    return [f"{rng.choice(TOPICS)} {rng.choice(VOCABULARY)}" for _ in range(count)]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--pages', type=int, default=3, help="pages per PDF and text file")
+    parser.add_argument('--mix', default=','.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                        help="relative weights of the formats")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    files = generate_corpus(args.directory, args.documents, args.pages, parse_mix(args.mix), args.seed)
+    counts = {}
+    for file in files:
+        counts[file['format']] = counts.get(file['format'], 0) + 1
+    print(json.dumps({'directory': args.directory, 'documents': len(files), 'formats': counts}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
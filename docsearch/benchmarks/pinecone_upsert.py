@@ -0,0 +1,69 @@
+"""Offline benchmark of the Pinecone ingest path against docsearch.fake_pinecone.FakeIndex.
+
+Compares the old one-vector-per-request loop with batched, concurrent
+upserts under simulated request latency and throttling:
+
+    python -m docsearch.benchmarks.pinecone_upsert --vectors 20000 --latency 0.02 --throttle-rate 0.05
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from docsearch.fake_pinecone import FakeIndex
+from docsearch.pinecone_upsert import DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS, upsert_vectors, upsert_with_retry
+
+
+def make_vectors(count: int, dimension: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(count, dimension)).astype(np.float32)
+    return [(f"doc-{i}", values[i].tolist(), {'filename': f"doc-{i}.txt", 'size': i}) for i in range(count)]
+
+
+def run_benchmark(count: int, dimension: int, latency: float, throttle_rate: float,
+                  batch_size: int = DEFAULT_BATCH_SIZE, max_workers: int = DEFAULT_MAX_WORKERS,
+                  sequential_sample: int = 500) -> dict:
+    """Returns vectors/sec for sequential single-vector upserts (on a sample) and for batched upserts."""
+    vectors = make_vectors(count, dimension)
+
+    index = FakeIndex(dimension, latency=latency, throttle_rate=throttle_rate)
+    sample = vectors[:min(count, sequential_sample)]
+    start = time.perf_counter()
+    for vector in sample:
+        upsert_with_retry(index, [vector], backoff=0.01)
+    sequential_seconds = time.perf_counter() - start
+
+    index = FakeIndex(dimension, latency=latency, throttle_rate=throttle_rate)
+    start = time.perf_counter()
+    written = upsert_vectors(index, vectors, batch_size=batch_size, max_workers=max_workers)
+    batched_seconds = time.perf_counter() - start
+
+    return {
+        'vectors': count,
+        'dimension': dimension,
+        'latency_seconds': latency,
+        'throttle_rate': throttle_rate,
+        'sequential_vectors_per_second': round(len(sample) / sequential_seconds, 1),
+        'batched_vectors_per_second': round(written / batched_seconds, 1),
+        'batched_requests': index.requests,
+        'batched_throttled': index.throttled,
+        'stored_vectors': index.describe_index_stats()['total_vector_count'],
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vectors', type=int, default=20000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--latency', type=float, default=0.02, help="simulated seconds per request")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests rejected with 429")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS)
+    args = parser.parse_args(argv)
+    print(json.dumps(run_benchmark(args.vectors, args.dimension, args.latency, args.throttle_rate,
+                                   args.batch_size, args.workers), indent=2))
+
+
+if __name__ == '__main__':
+    main()
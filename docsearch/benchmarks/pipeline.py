@@ -0,0 +1,253 @@
+"""End-to-end benchmark of the ingestion and query pipelines of all three backends.
+
+Runs every pipeline stage over the same corpus: discovery, extraction
+(including OCR), embedding, and index build and queries for Whoosh, FAISS
+and Pinecone (against the in-process docsearch.fake_pinecone.FakeIndex).
+It reports docs/sec, p50/p99 query latency, the throughput of replaying
+the queries as one batch (with a cold and then a warm query cache), peak
+RSS and on-disk index size as JSON. By default a synthetic corpus is generated with
+docsearch.benchmarks.corpus, and each stage runs in its own process so its
+peak RSS is its own. The extraction cache is disabled, so every stage
+measures real extraction work:
+
+    python -m docsearch.benchmarks.pipeline --documents 500 --pages 3 --output pipeline.json
+    python -m docsearch.benchmarks.pipeline --corpus ~/documents --backends whoosh faiss
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from docsearch.benchmarks.corpus import DEFAULT_MIX, generate_corpus, parse_mix, sample_queries
+from docsearch.engine import DEFAULT_MODEL, create_engine
+from docsearch.extraction import DEFAULT_FILE_TIMEOUT, iter_documents, iter_extract
+from docsearch.query_cache import query_cache
+
+BACKENDS = ('whoosh', 'faiss', 'pinecone')
+
+
+def peak_rss() -> Dict[str, Optional[int]]:
+    """Returns the peak resident set size of this process and of its largest finished child, in bytes.
+
+    Both are None on platforms without the resource module (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return {'peak_rss_bytes': None, 'peak_child_rss_bytes': None}
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return {'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'peak_child_rss_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+def directory_bytes(path: str) -> int:
+    """Returns the total size of the files under path."""
+    total = 0
+    for root, _, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, filename)) for filename in filenames)
+    return total
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    return {
+        'queries': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+    }
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+def _filepaths(corpus: str) -> List[str]:
+    return [os.path.join(corpus, relpath) for relpath in iter_documents(corpus)]
+
+
+def discovery_stage(corpus: str) -> Dict:
+    """Times listing the supported files of the corpus."""
+    start = time.perf_counter()
+    count = len(_filepaths(corpus))
+    seconds = time.perf_counter() - start
+    return {'documents': count, 'seconds': round(seconds, 4)}
+
+
+def extraction_stage(corpus: str, workers: Optional[int], timeout: float) -> Dict:
+    """Times extracting every file in the worker pool without the cache."""
+    documents = pages = 0
+    errors = []
+    start = time.perf_counter()
+    for filepath, page, error in iter_extract(_filepaths(corpus), workers, timeout, cache_path=None):
+        if page is not None:
+            pages += 1
+        elif error is None:
+            documents += 1
+        else:
+            errors.append(os.path.basename(filepath))
+    seconds = time.perf_counter() - start
+    return {'documents': documents, 'pages': pages, 'errors': len(errors), 'seconds': round(seconds, 3),
+            'docs_per_second': _rate(documents, seconds), 'pages_per_second': _rate(pages, seconds)}
+
+
+def embedding_stage(corpus: str, model_name: str, workers: Optional[int], timeout: float) -> Dict:
+    """Times encoding the text of every extracted page; extraction itself is not timed here."""
+    from docsearch.embedding import embed_texts
+    from docsearch.models import get_model
+    texts = [page['text'] for _, page, _ in iter_extract(_filepaths(corpus), workers, timeout, cache_path=None)
+             if page is not None]
+    model = get_model(model_name)
+    start = time.perf_counter()
+    embed_texts(model, texts, show_progress=False)
+    seconds = time.perf_counter() - start
+    return {'model': model_name, 'pages': len(texts), 'seconds': round(seconds, 3),
+            'pages_per_second': _rate(len(texts), seconds)}
+
+
+def backend_stage(backend: str, corpus: str, work_directory: str, model_name: str, queries: List[str], k: int,
+                  workers: Optional[int], timeout: float) -> Dict:
+    """Times building the backend's index from the corpus and answering every query, one at a time and in a batch.
+
+    The query cache is cleared before the single queries and the first batch;
+    the batch is then replayed to measure the throughput of cached queries.
+    """
+    options = {'workers': workers, 'timeout': timeout, 'cache_path': None}
+    index_directory = os.path.join(work_directory, f"{backend}_index")
+    if backend == 'whoosh':
+        options.update(index_directory=index_directory, incremental=False)
+    elif backend == 'faiss':
+        options.update(index_directory=index_directory, model_name=model_name)
+    else:
+        options.update(model_name=model_name, offline=True)  # Keeps its sync state in a temporary directory
+    engine = create_engine(backend, **options)
+
+    start = time.perf_counter()
+    report = engine.index(corpus)
+    index_seconds = time.perf_counter() - start
+    documents = len(_filepaths(corpus)) - len(report['skipped_files'])
+
+    query_cache.clear()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.search(query, k)
+        latencies.append(time.perf_counter() - start)
+
+    batch_seconds = {}
+    query_cache.clear()
+    for run in ('batch', 'cached'):
+        start = time.perf_counter()
+        engine.batch_search(queries, k)
+        batch_seconds[run] = time.perf_counter() - start
+
+    # The fake Pinecone index lives in memory, so it has no size on disk
+    return dict({'backend': backend, 'documents': documents, 'skipped': len(report['skipped_files']),
+                 'index_seconds': round(index_seconds, 3), 'docs_per_second': _rate(documents, index_seconds),
+                 'index_bytes': directory_bytes(index_directory) if backend != 'pinecone' else None,
+                 'batch_queries_per_second': _rate(len(queries), batch_seconds['batch']),
+                 'cached_queries_per_second': _rate(len(queries), batch_seconds['cached'])},
+                **latency_summary(latencies))
+
+
+def _run_and_measure(stage: Callable, args: tuple, results) -> None:
+    try:
+        results.put(('ok', dict(stage(*args), **peak_rss())))
+    except Exception as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+
+
+def run_stage(stage: Callable, *args, isolate: bool = True) -> Dict:
+    """Runs a stage and returns its result with the peak RSS measured at its end.
+
+    With isolate=True the stage runs in a fresh process, so the peak RSS is
+    that of the stage alone rather than of everything that ran before it.
+    A stage that raises returns {'error': message}.
+    """
+    if not isolate:
+        try:
+            return dict(stage(*args), **peak_rss())
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_and_measure, args=(stage, args, results))
+    process.start()
+    while True:
+        try:
+            status, result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():  # Crashed without reporting back
+                status, result = 'error', f"Stage process exited with code {process.exitcode}"
+                break
+    process.join()
+    return result if status == 'ok' else {'error': result}
+
+
+def run_benchmark(corpus: str, work_directory: str, backends=BACKENDS, model_name: str = DEFAULT_MODEL,
+                  queries: int = 100, k: int = 10, workers: Optional[int] = None,
+                  timeout: float = DEFAULT_FILE_TIMEOUT, isolate: bool = True) -> Dict:
+    """Benchmarks every stage on corpus and returns the results as one dict."""
+    query_texts = sample_queries(queries)
+    results = {
+        'corpus': corpus,
+        'corpus_bytes': directory_bytes(corpus),
+        'workers': workers or os.cpu_count(),
+        'discovery': run_stage(discovery_stage, corpus, isolate=isolate),
+        'extraction': run_stage(extraction_stage, corpus, workers, timeout, isolate=isolate),
+    }
+    if any(backend != 'whoosh' for backend in backends):
+        results['embedding'] = run_stage(embedding_stage, corpus, model_name, workers, timeout, isolate=isolate)
+    results['backends'] = {backend: run_stage(backend_stage, backend, corpus, work_directory, model_name, query_texts,
+                                              k, workers, timeout, isolate=isolate)
+                           for backend in backends}
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="benchmark this directory instead of generating a corpus")
+    parser.add_argument('--documents', type=int, default=100, help="documents in the generated corpus")
+    parser.add_argument('--pages', type=int, default=3, help="pages per generated PDF and text file")
+    parser.add_argument('--mix', default=','.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                        help="relative weights of the generated formats")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--workers', type=int, help="extraction processes (default: one per CPU core)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_FILE_TIMEOUT)
+    parser.add_argument('--work-dir', help="keep the generated corpus and indexes here instead of a temporary directory")
+    parser.add_argument('--in-process', action='store_true',
+                        help="run all stages in this process (peak RSS then accumulates across stages)")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    work_directory = args.work_dir or tempfile.mkdtemp(prefix='docsearch-benchmark-')
+    try:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(work_directory, 'corpus')
+            generate_corpus(corpus, args.documents, args.pages, parse_mix(args.mix), args.seed)
+        results = run_benchmark(corpus, work_directory, args.backends, args.model, args.queries, args.k,
+                                args.workers, args.timeout, isolate=not args.in_process)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Content-addressed cache of extracted text, shared by all three apps.
+
+Entries are keyed by the SHA-256 of the file content plus a string that
+describes the extractor settings (e.g. the tesseract version, language and
+page segmentation mode), so a file is only OCR'd or parsed again when its
+content or the extraction settings change. The cache is a single SQLite
+file; several processes may read and write it at the same time. Text is
+stored zlib-compressed and the least recently used entries are evicted
+once the total size exceeds the configured limit.
+
+Lookups are plain reads and never wait for the write lock. The access times
+and hit/miss counters they update are kept in memory and written in one
+transaction every FLUSH_INTERVAL lookups, on the next put(), or on flush()
+and close(), so extraction workers only serialize on actual writes.
+"""
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Optional
+
+from docsearch.metrics import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get('DOCSEARCH_CACHE_DIR',
+                                                 os.path.join(os.path.expanduser('~'), '.cache', 'docsearch')),
+                                  'extraction_cache.sqlite3')
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB of compressed text
+FLUSH_INTERVAL = 64  # Lookups whose access times and counters are written together
+
+_COUNTERS = ('hits', 'misses', 'evictions', 'total_bytes')
+
+
+class ExtractionCache:
+    """Size-bounded LRU cache of extracted text stored in a SQLite file."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions so concurrent
+        # processes serialize their updates of the counters instead of overwriting each other
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                                 'key TEXT PRIMARY KEY, data BLOB NOT NULL, '
+                                 'size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._connection.executemany('INSERT OR IGNORE INTO counters VALUES (?, 0)', [(name,) for name in _COUNTERS])
+        self._accessed = {}  # Key -> time of its last lookup, not yet written
+        self._lookups = {'hits': 0, 'misses': 0}  # Not yet added to the counters
+
+    @staticmethod
+    def _key(content_hash: str, settings: str) -> str:
+        return f"{content_hash}:{settings}"
+
+    def _increment(self, name: str, amount: int = 1) -> None:
+        self._connection.execute('UPDATE counters SET value = value + ? WHERE name = ?', (amount, name))
+
+    def get(self, content_hash: str, settings: str) -> Optional[str]:
+        """Returns the cached text for a file content and extractor settings, or None on a miss."""
+        key = self._key(content_hash, settings)
+        row = self._connection.execute('SELECT data FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self._lookups['misses'] += 1
+        else:
+            self._lookups['hits'] += 1
+            self._accessed[key] = time.time()
+        if sum(self._lookups.values()) >= FLUSH_INTERVAL:
+            self.flush()
+        metrics.count('cache_misses_total' if row is None else 'cache_hits_total', cache='extraction')
+        return None if row is None else zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, content_hash: str, settings: str, text: str) -> None:
+        """Stores extracted text, evicting least recently used entries if the cache grows too large."""
+        data = zlib.compress(text.encode('utf-8'))
+        if len(data) > self.max_bytes:
+            return
+        key = self._key(content_hash, settings)
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self._connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                                     (key, data, len(data), time.time()))
+            self._increment('total_bytes', len(data) - (row[0] if row else 0))
+            self._write_lookups()  # So eviction sees the latest access times
+            self._evict()
+            self._connection.execute('COMMIT')
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def _write_lookups(self) -> None:
+        self._connection.executemany('UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?',
+                                     [(accessed, key) for key, accessed in self._accessed.items()])
+        for name, amount in self._lookups.items():
+            if amount:
+                self._increment(name, amount)
+        self._accessed = {}
+        self._lookups = {'hits': 0, 'misses': 0}
+
+    def flush(self) -> None:
+        """Writes the access times and hit/miss counts of the lookups made since the last write."""
+        if not self._accessed and not any(self._lookups.values()):
+            return
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._write_lookups()
+            self._connection.execute('COMMIT')
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self) -> None:
+        total = self._connection.execute("SELECT value FROM counters WHERE name = 'total_bytes'").fetchone()[0]
+        while total > self.max_bytes:
+            oldest = self._connection.execute('SELECT key, size FROM entries ORDER BY last_access LIMIT 64').fetchall()
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._increment('total_bytes', -size)
+                self._increment('evictions')
+                total -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cumulative hit, miss and eviction counters plus the current entry count and size."""
+        self.flush()
+        stats = dict(self._connection.execute('SELECT name, value FROM counters').fetchall())
+        stats['entries'] = self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return stats
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
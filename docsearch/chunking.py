@@ -0,0 +1,122 @@
+"""Token-aware chunking of page text and pooling of chunk hits into document results.
+
+Sentence-transformers models truncate their input after max_seq_length
+tokens (256 for all-MiniLM-L6-v2), so a long page embedded as one text is
+only represented by its beginning. A Chunker splits text into windows of at
+most max_tokens tokens of the model's own tokenizer, overlapping by
+`overlap` tokens so a sentence cut at a window edge still appears whole in
+one of them; each chunk becomes its own vector. Tokenizers without offset
+mappings (and models without a tokenizer) fall back to whitespace words,
+counted at WORDS_PER_TOKEN words per token.
+
+pool_scores aggregates the scores of chunk hits per document (or page) with
+vectorized NumPy operations: 'max' keeps the best chunk, 'topn' averages
+the best pool_size chunks.
+"""
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_CHUNK_OVERLAP = 32
+WORDS_PER_TOKEN = 0.75  # Rough ratio for English text with WordPiece/BPE tokenizers
+POOLING_METHODS = ('max', 'topn')
+DEFAULT_POOLING = 'max'
+DEFAULT_POOL_SIZE = 3
+CANDIDATE_FACTOR = 10  # Chunk hits fetched per requested result before pooling
+
+_WORD = re.compile(r'\S+')
+
+
+class Chunker:
+    """Splits text into overlapping windows of at most max_tokens tokens."""
+
+    def __init__(self, tokenizer=None, max_tokens: int = DEFAULT_MAX_TOKENS, overlap: int = DEFAULT_CHUNK_OVERLAP):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError(f"overlap must be between 0 and max_tokens - 1, got {overlap} for max_tokens {max_tokens}")
+        self.tokenizer = tokenizer if getattr(tokenizer, 'is_fast', False) else None  # Offsets need a fast tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def _token_spans(self, text: str) -> List[Tuple[int, int]]:
+        if self.tokenizer is not None:
+            encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                      return_attention_mask=False, return_token_type_ids=False, verbose=False)
+            return encoding['offset_mapping']
+        return [match.span() for match in _WORD.finditer(text)]
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """Returns the (start, end) character offsets of the chunks of text."""
+        if self.tokenizer is not None:
+            size, overlap = self.max_tokens, self.overlap
+        else:
+            size = max(1, int(self.max_tokens * WORDS_PER_TOKEN))
+            overlap = min(size - 1, int(self.overlap * WORDS_PER_TOKEN))
+        tokens = self._token_spans(text)
+        spans = []
+        for start in range(0, len(tokens), size - overlap):
+            end = min(start + size, len(tokens))
+            spans.append((tokens[start][0], tokens[end - 1][1]))
+            if end == len(tokens):
+                break
+        return spans
+
+    def chunks(self, text: str) -> List[str]:
+        """Returns the chunks of text; text without any tokens has no chunks."""
+        return [text[start:end] for start, end in self.spans(text)]
+
+
+def chunker_for_model(model, max_tokens: Optional[int] = None, overlap: int = DEFAULT_CHUNK_OVERLAP) -> Chunker:
+    """Returns a chunker using the model's tokenizer, with windows that fit its max_seq_length by default."""
+    tokenizer = getattr(model, 'tokenizer', None)
+    if max_tokens is None:
+        max_tokens = getattr(model, 'max_seq_length', None) or DEFAULT_MAX_TOKENS
+        if hasattr(tokenizer, 'num_special_tokens_to_add'):  # [CLS] and [SEP] count towards the limit
+            max_tokens -= tokenizer.num_special_tokens_to_add()
+    return Chunker(tokenizer, max_tokens, min(overlap, max_tokens - 1))
+
+
+def chunk_pages(events: Iterable[Tuple[str, Optional[Dict], Optional[str]]],
+                chunker: Chunker) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """Splits the pages of an extraction stream into chunks, keeping the stream's (path, page, error) form.
+
+    Each page is replaced by one page dict per chunk, with the chunk text
+    and its number within the page under 'chunk'; pages without text are
+    dropped. End-of-file markers pass through unchanged, so the result can
+    be fed to docsearch.embedding.embed_extracted.
+    """
+    for path, page, error in events:
+        if page is None:
+            yield path, page, error
+            continue
+        for number, text in enumerate(chunker.chunks(page['text'])):
+            yield path, dict(page, text=text, chunk=number), None
+
+
+def pool_scores(groups: np.ndarray, scores: np.ndarray, pooling: str = DEFAULT_POOLING,
+                pool_size: int = DEFAULT_POOL_SIZE) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Pools chunk hit scores (higher is better) per group, e.g. per document.
+
+    Returns (groups, pooled scores, index of each group's best hit, hits per
+    group), ordered by pooled score, best first.
+    """
+    if pooling not in POOLING_METHODS:
+        raise ValueError(f"Unknown pooling '{pooling}'; expected one of {', '.join(POOLING_METHODS)}")
+    groups = np.asarray(groups)
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(groups) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return groups, scores, empty, empty
+    order = np.lexsort((-scores, groups))  # By group, best hit first within each group
+    sorted_groups, sorted_scores = groups[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    if pooling == 'max':
+        pooled = sorted_scores[starts]
+    else:
+        rank = np.arange(len(order)) - np.repeat(starts, counts)
+        keep = rank < pool_size
+        pooled = np.add.reduceat(np.where(keep, sorted_scores, 0.0), starts) / np.minimum(counts, pool_size)
+    ranking = np.argsort(-pooled, kind='stable')
+    return sorted_groups[starts][ranking], pooled[ranking], order[starts][ranking], counts[ranking]
@@ -0,0 +1,265 @@
+"""Command line interface to the search engines; every command prints JSON to stdout.
+
+    python -m docsearch.cli --backend whoosh --procs 4 --multisegment index ~/documents
+    python -m docsearch.cli --backend whoosh optimize
+    python -m docsearch.cli --backend hybrid --fusion weighted --weights whoosh=1,faiss=0.5 search "INV-2231"
+    python -m docsearch.cli --backend faiss --model all-MiniLM-L6-v2 search -k 5 "quarterly report"
+    python -m docsearch.cli --backend whoosh search --queries-file queries.txt
+    python -m docsearch.cli --backend faiss search --types pdf,txt --created-after 2024-01-01 "contract"
+    python -m docsearch.cli --backend faiss --exclude 'drafts/*' watch ~/documents
+    python -m docsearch.cli --backend faiss --metrics metrics.prom --profile index.pstats index ~/documents
+
+Documents are found recursively; --include and --exclude select them by
+glob (a pattern with '/' matches the relative path, otherwise the name).
+watch keeps the index up to date as files change and prints one JSON line
+per update until interrupted. Images, and PDF pages without a text layer,
+are OCR'd with tesseract after preprocessing, as set by the --ocr-* options
+(see docsearch.ocr).
+
+The queries of a search (e.g. a query log given with --queries-file) are
+answered as one batch: the faiss and pinecone backends encode them in one
+pass and cache query embeddings and results, unless --no-query-cache.
+
+--metrics FILE writes the stage timings, counters and cache hit rates
+recorded by docsearch.metrics at the end of the command (and after every
+update of watch), as Prometheus text if FILE ends in .prom and as JSON
+otherwise. --profile FILE runs the command under cProfile, writes the raw
+stats to FILE and prints the top functions to stderr; --trace-memory adds
+tracemalloc's peak and top allocation sites. Profile with --workers 0 to
+include extraction, which otherwise runs in worker processes.
+
+Progress bars and extraction errors go to stderr. Pinecone reads its API
+key and environment from PINECONE_API_KEY and PINECONE_ENVIRONMENT unless
+--api-key and --environment are given.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+from docsearch.chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_POOL_SIZE, DEFAULT_POOLING, POOLING_METHODS
+from docsearch.engine import (BACKENDS, DEFAULT_CANDIDATES, DEFAULT_FAISS_DIRECTORY, DEFAULT_FUSION, DEFAULT_MODEL,
+                              DEFAULT_PINECONE_INDEX, DEFAULT_RRF_K, DEFAULT_TOP_K, DEFAULT_WHOOSH_DIRECTORY,
+                              FUSION_METHODS, create_engine)
+from docsearch.discovery import DEFAULT_EXCLUDE
+from docsearch.extraction import DEFAULT_FILE_TIMEOUT
+from docsearch.metrics import metrics, profile
+from docsearch.ocr import DEFAULT_OCR_CONFIG, ocr_config
+from docsearch.watch import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, watch_directory
+
+
+def parse_weights(text) -> dict:
+    """Parses 'whoosh=1,faiss=0.5' into {'whoosh': 1.0, 'faiss': 0.5}."""
+    weights = {}
+    for item in text.split(',') if text else []:
+        leg, _, weight = item.partition('=')
+        weights[leg] = float(weight)
+    return weights
+
+
+def exclude_patterns(args) -> list:
+    """Returns the exclude globs: the defaults (hidden and lock files) plus any --exclude patterns."""
+    return list(DEFAULT_EXCLUDE) + (args.exclude or [])
+
+
+def ocr_options(args) -> dict:
+    """Returns the OCR settings (see docsearch.ocr) from the parsed arguments."""
+    return ocr_config(language=args.ocr_language, psm=args.ocr_psm, dpi=args.ocr_dpi,
+                      page_workers=args.ocr_page_workers, binarize=not args.no_binarize, pdf_ocr=not args.no_pdf_ocr)
+
+
+def engine_options(args) -> dict:
+    """Returns the create_engine options of the selected backend from the parsed arguments."""
+    options = {'workers': args.workers, 'timeout': args.timeout, 'include': args.include,
+               'exclude': exclude_patterns(args), 'ocr': ocr_options(args)}
+    chunk_options = {'chunk_tokens': args.chunk_tokens, 'chunk_overlap': args.chunk_overlap,
+                     'pooling': args.pooling, 'pool_size': args.pool_size}
+    whoosh_options = {'incremental': not args.rebuild, 'procs': args.procs, 'limitmb': args.limitmb,
+                      'multisegment': args.multisegment}
+    config = {'index_type': args.index_type, 'metric': args.metric, 'storage': args.storage}
+    if args.rescore_factor is not None:
+        config['rescore_factor'] = args.rescore_factor
+    faiss_options = dict(chunk_options, model_name=args.model, config=config, cache_queries=not args.no_query_cache)
+    if args.backend == 'whoosh':
+        options.update(whoosh_options, index_directory=args.index_dir or DEFAULT_WHOOSH_DIRECTORY)
+    elif args.backend == 'faiss':
+        options.update(faiss_options, index_directory=args.index_dir or DEFAULT_FAISS_DIRECTORY)
+    elif args.backend == 'hybrid':
+        # Both indexes live in their usual directories, or side by side under --index-dir
+        options.update(whoosh_options, **faiss_options,
+                       whoosh_directory=os.path.join(args.index_dir, 'whoosh') if args.index_dir
+                       else DEFAULT_WHOOSH_DIRECTORY,
+                       faiss_directory=os.path.join(args.index_dir, 'faiss') if args.index_dir
+                       else DEFAULT_FAISS_DIRECTORY,
+                       fusion=args.fusion, weights=parse_weights(args.weights), rrf_k=args.rrf_k,
+                       candidates=args.candidates)
+    else:
+        options.update(chunk_options, model_name=args.model, index_name=args.pinecone_index, api_key=args.api_key,
+                       environment=args.environment, state_path=args.state_file,
+                       cache_queries=not args.no_query_cache)
+    return options
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=list(BACKENDS), default='whoosh')
+    parser.add_argument('--index-dir', help=f"index directory (default: {DEFAULT_WHOOSH_DIRECTORY} for whoosh, "
+                                            f"{DEFAULT_FAISS_DIRECTORY} for faiss)")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="sentence-transformers model (faiss, pinecone)")
+    parser.add_argument('--index-type', default='flat', help="FAISS index type: flat, ivf_flat, ivf_pq or hnsw")
+    parser.add_argument('--metric', default='l2', help="FAISS metric: l2 or cosine")
+    parser.add_argument('--storage', default='float32', help="FAISS vector encoding: float32, float16 or int8")
+    parser.add_argument('--rescore-factor', type=int,
+                        help="candidates per hit rescored in full precision for quantized indexes (0: off)")
+    parser.add_argument('--no-query-cache', action='store_true',
+                        help="encode and search every query, without the query embedding and result cache")
+    parser.add_argument('--chunk-tokens', type=int,
+                        help="tokens per embedded chunk of page text (default: the model's maximum input length)")
+    parser.add_argument('--chunk-overlap', type=int, default=DEFAULT_CHUNK_OVERLAP,
+                        help="tokens shared by consecutive chunks")
+    parser.add_argument('--pooling', choices=POOLING_METHODS, default=DEFAULT_POOLING,
+                        help="how chunk hits are pooled per document: best chunk or mean of the best --pool-size")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help="chunks averaged by topn pooling")
+    parser.add_argument('--fusion', choices=FUSION_METHODS, default=DEFAULT_FUSION, help="hybrid rank fusion")
+    parser.add_argument('--weights', help="hybrid leg weights, e.g. whoosh=1,faiss=0.5")
+    parser.add_argument('--rrf-k', type=int, default=DEFAULT_RRF_K, help="reciprocal rank fusion constant")
+    parser.add_argument('--candidates', type=int, default=DEFAULT_CANDIDATES, help="results per hybrid leg")
+    parser.add_argument('--pinecone-index', default=DEFAULT_PINECONE_INDEX, help="Pinecone index name")
+    parser.add_argument('--api-key', help="Pinecone API key")
+    parser.add_argument('--environment', help="Pinecone environment")
+    parser.add_argument('--state-file', help="Pinecone sync state file")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="only index documents matching this glob; repeatable")
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="skip documents and directories matching this glob; repeatable")
+    parser.add_argument('--workers', type=int, help="extraction processes (default: one per CPU core)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_FILE_TIMEOUT, help="seconds allowed per file")
+    parser.add_argument('--ocr-language', default=DEFAULT_OCR_CONFIG['language'],
+                        help="tesseract language(s), e.g. eng or eng+deu")
+    parser.add_argument('--ocr-psm', type=int, default=DEFAULT_OCR_CONFIG['psm'], help="tesseract page segmentation mode")
+    parser.add_argument('--ocr-dpi', type=int, default=DEFAULT_OCR_CONFIG['dpi'],
+                        help="resolution images are scaled to and scanned PDF pages rendered at before OCR")
+    parser.add_argument('--ocr-page-workers', type=int, default=DEFAULT_OCR_CONFIG['page_workers'],
+                        help="scanned pages of a PDF OCR'd in parallel")
+    parser.add_argument('--no-binarize', action='store_true', help="OCR grayscale images without thresholding them")
+    parser.add_argument('--no-pdf-ocr', action='store_true', help="only read the text layer of PDFs, never OCR pages")
+    parser.add_argument('--procs', type=int, default=1, help="Whoosh writer processes (0: one per CPU core)")
+    parser.add_argument('--limitmb', type=int, help="Whoosh indexing memory per writer process, in MB")
+    parser.add_argument('--multisegment', action='store_true',
+                        help="keep the Whoosh writer processes' segments unmerged (run optimize afterwards)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write stage timings and counters to FILE (Prometheus text for .prom, else JSON)")
+    parser.add_argument('--profile', metavar='FILE', help="profile the command with cProfile, saving the stats to FILE")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="trace memory allocations with tracemalloc while profiling")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help="index the documents in a directory")
+    index_parser.add_argument('directory')
+    index_parser.add_argument('--rebuild', action='store_true', help="rebuild the Whoosh index from scratch")
+
+    search_parser = commands.add_parser('search', help="search the index")
+    search_parser.add_argument('queries', nargs='*')
+    search_parser.add_argument('--queries-file', help="file with one query per line")
+    search_parser.add_argument('-k', type=int, default=DEFAULT_TOP_K)
+    search_parser.add_argument('--page', type=int, help="return this page of k results (whoosh only)")
+    search_parser.add_argument('--types', help="only files of these comma-separated types, e.g. pdf,txt (faiss, pinecone)")
+    search_parser.add_argument('--created-after', help="only files created on or after this ISO date or time")
+    search_parser.add_argument('--created-before', help="only files created on or before this ISO date or time")
+    search_parser.add_argument('--min-size', type=int, help="only files of at least this many bytes")
+    search_parser.add_argument('--max-size', type=int, help="only files of at most this many bytes")
+
+    commands.add_parser('optimize', help="merge the Whoosh index (of the whoosh or hybrid backend) into one segment")
+
+    watch_parser = commands.add_parser('watch', help="index a directory and keep the index up to date as files change")
+    watch_parser.add_argument('directory')
+    watch_parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                              help="seconds without further changes before an update")
+    watch_parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                              help="seconds between scans when watchdog is not installed")
+    args = parser.parse_args(argv)
+
+    profiling = (profile(args.profile, args.trace_memory) if args.profile or args.trace_memory
+                 else contextlib.nullcontext({}))
+    try:
+        with profiling as profiled:
+            status = run_command(parser, args)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics)
+    if 'profile' in profiled:
+        print(profiled['profile'], file=sys.stderr)
+    if 'memory' in profiled:
+        memory = profiled['memory']
+        print(f"Traced memory: {memory['current_bytes']} bytes current, {memory['peak_bytes']} bytes peak",
+              file=sys.stderr)
+        print('\n'.join(memory['top']), file=sys.stderr)
+    return status
+
+
+def run_command(parser: argparse.ArgumentParser, args) -> int:
+    """Runs the parsed command and prints its JSON output; returns the exit status."""
+    if args.command != 'index':
+        args.rebuild = False
+    engine = create_engine(args.backend, **engine_options(args))
+    if args.command == 'optimize':
+        if not hasattr(engine, 'optimize'):
+            parser.error("optimize is only supported by the whoosh and hybrid backends")
+        try:
+            output = dict(engine.optimize(), backend=args.backend)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 1
+    elif args.command == 'index':
+        output = dict(engine.index(args.directory), backend=args.backend, source_directory=args.directory)
+    elif args.command == 'watch':
+        def on_update(paths, report):
+            json.dump(dict(report, backend=args.backend, paths=paths), sys.stdout)
+            sys.stdout.write('\n')
+            sys.stdout.flush()
+            if args.metrics:
+                metrics.write(args.metrics)
+
+        try:
+            watch_directory(engine, args.directory, exclude_patterns(args), debounce=args.debounce,
+                            poll_interval=args.poll_interval, on_update=on_update)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    else:
+        queries = list(args.queries)
+        if args.queries_file:
+            with open(args.queries_file, encoding='utf-8') as file:
+                queries.extend(line.strip() for line in file if line.strip())
+        if not queries:
+            parser.error("no queries given")
+        if args.page is not None and args.backend != 'whoosh':
+            parser.error("--page is only supported by the whoosh backend")
+        filters = {'types': args.types.split(',') if args.types else None, 'created_after': args.created_after,
+                   'created_before': args.created_before, 'min_size': args.min_size, 'max_size': args.max_size}
+        filters = {key: value for key, value in filters.items() if value is not None}
+        if filters and args.backend not in ('faiss', 'pinecone'):
+            parser.error("filters are only supported by the faiss and pinecone backends")
+        try:
+            if args.page is not None:
+                results = [engine.search_page(query, args.page, args.k) for query in queries]
+            elif args.backend == 'hybrid':
+                results = [engine.hybrid_search(query, args.k) for query in queries]
+                results = [{'matches': result['results'], 'latency_ms': result['latency_ms']} for result in results]
+            elif filters:
+                results = [{'matches': matches} for matches in engine.batch_search(queries, args.k, filters)]
+            else:
+                results = [{'matches': matches} for matches in engine.batch_search(queries, args.k)]
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 1
+        output = {'backend': args.backend, 'source_directory': engine.source_directory,
+                  'results': [dict(result, query=query) for query, result in zip(queries, results)]}
+    json.dump(output, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Recursive, streaming discovery of the documents under a directory.
+
+iter_files walks the tree with os.scandir and yields the relative path of
+every file with one of the given extensions as soon as its directory has
+been read, so extraction can start on the first files while the rest of
+the tree is still being listed (docsearch.extraction.iter_documents does
+this for the supported document types). Symbolic links to directories are
+not followed.
+
+Include and exclude globs select the files. A pattern containing '/' is
+matched against the whole relative path (with '/' separators, where '*'
+also matches across directories), any other pattern against the file or
+directory name alone. Exclude patterns also prune whole directories.
+Hidden files and directories and Office lock files are excluded by default.
+"""
+import fnmatch
+import os
+import sys
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_EXCLUDE = ('.*', '~$*')
+
+
+def _matches(relpath: str, name: str, patterns: Sequence[str]) -> bool:
+    posix_path = relpath.replace(os.sep, '/')
+    return any(fnmatch.fnmatch(posix_path if '/' in pattern else name, pattern) for pattern in patterns)
+
+
+def is_included(relpath: str, include: Optional[Sequence[str]] = None,
+                exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                extensions: Optional[Tuple[str, ...]] = None) -> bool:
+    """Returns whether iter_files would yield the file at relpath (which need not exist)."""
+    name = os.path.basename(relpath)
+    if extensions and not name.endswith(extensions):
+        return False
+    if exclude:
+        parts = relpath.split(os.sep)
+        for depth in range(1, len(parts) + 1):  # The file itself or any directory above it
+            if _matches(os.sep.join(parts[:depth]), parts[depth - 1], exclude):
+                return False
+    return not include or _matches(relpath, name, include)
+
+
+def iter_entries(directory: str, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 extensions: Optional[Tuple[str, ...]] = None, start: str = '') -> Iterator[Tuple[str, os.DirEntry]]:
+    """Yields (relative path, os.DirEntry) for every included file under directory, streaming.
+
+    If extensions is given, only files ending in one of them are included.
+    With start, only the subdirectory start (relative to directory) is
+    walked. Directories that cannot be read are reported on stderr and
+    skipped.
+    """
+    stack = [start]
+    while stack:
+        relative_directory = stack.pop()
+        try:
+            with os.scandir(os.path.join(directory, relative_directory)) as scan:
+                entries = sorted(scan, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error listing {os.path.join(directory, relative_directory)}: {e}", file=sys.stderr)
+            continue
+        subdirectories = []
+        for entry in entries:
+            relpath = os.path.join(relative_directory, entry.name) if relative_directory else entry.name
+            if exclude and _matches(relpath, entry.name, exclude):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(relpath)
+            elif ((not extensions or entry.name.endswith(extensions))
+                  and (not include or _matches(relpath, entry.name, include))):
+                yield relpath, entry
+        stack.extend(reversed(subdirectories))  # Depth first, in name order
+
+
+def iter_files(directory: str, include: Optional[Sequence[str]] = None,
+               exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+               extensions: Optional[Tuple[str, ...]] = None) -> Iterator[str]:
+    """Yields the path, relative to directory, of every included file under it, as they are found."""
+    for relpath, _ in iter_entries(directory, include, exclude, extensions):
+        yield relpath
+
+
+def is_under(path: str, parents: Iterable[str]) -> bool:
+    """Returns whether path is one of parents or inside one of them (all relative paths)."""
+    return any(path == parent or path.startswith(parent + os.sep) for parent in parents)
+
+
+def resolve_changes(directory: str, relpaths: Iterable[str], include: Optional[Sequence[str]] = None,
+                    exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                    extensions: Optional[Tuple[str, ...]] = None) -> Tuple[List[str], List[str]]:
+    """Splits changed paths, e.g. from a file watcher, into (files to index, paths to clear).
+
+    Existing directories are expanded to the included files under them. The
+    paths to clear are the directories, paths that no longer exist (which
+    may have been a file or a whole directory) and files that are no longer
+    included: callers should drop everything indexed at or under them that
+    is not among the files to index (see is_under), such as the files
+    deleted from a directory that still exists.
+    """
+    files, cleared = set(), set()
+    for relpath in relpaths:
+        path = os.path.join(directory, relpath)
+        if os.path.isdir(path):
+            files.update(file for file, _ in iter_entries(directory, include, exclude, extensions, start=relpath)
+                         if is_included(file, include, exclude, extensions))
+            cleared.add(relpath)
+        elif os.path.isfile(path) and is_included(relpath, include, exclude, extensions):
+            files.add(relpath)
+        else:
+            cleared.add(relpath)
+    return sorted(files), sorted(cleared)
@@ -0,0 +1,91 @@
+"""Batched embedding stage shared by the FAISS and Pinecone apps.
+
+Every encoder batch is timed as encode_seconds in docsearch.metrics, with
+the number of texts and characters encoded.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from docsearch.metrics import metrics
+
+DEFAULT_BATCH_SIZE = 32
+WINDOW_BATCHES = 8  # Batches of page text collected before sorting and encoding them
+
+
+def embed_texts(model, texts, batch_size: int = DEFAULT_BATCH_SIZE, show_progress: bool = True) -> np.ndarray:
+    """Encodes texts in batches and returns one float32 matrix, row i being texts[i].
+
+    Texts are fed to the encoder sorted by length so that each batch pads to a
+    similar sequence length; the results are scattered back into their
+    original rows of a matrix allocated once up front.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    dimension = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    order = np.argsort([len(text) for text in texts], kind='stable')
+    for start in tqdm(range(0, len(texts), batch_size), desc="Embedding Documents", disable=not show_progress):
+        batch = order[start:start + batch_size]
+        batch_texts = [texts[i] for i in batch]
+        with metrics.timer('encode_seconds', stage='index'):
+            embeddings[batch] = model.encode(batch_texts,
+                                             batch_size=len(batch),
+                                             convert_to_numpy=True,
+                                             show_progress_bar=False)
+        metrics.count('encode_texts_total', len(batch_texts), stage='index')
+        metrics.count('encode_chars_total', sum(len(text) for text in batch_texts), stage='index')
+    return embeddings
+
+
+def embed_extracted(model, events: Iterable[Tuple[str, Optional[Dict], Optional[str]]],
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    window_size: Optional[int] = None) -> Iterator[Tuple[str, Optional[List[Dict]], Optional[np.ndarray], Optional[str]]]:
+    """Embeds the pages streamed by docsearch.extraction, yielding one result per finished file.
+
+    Page texts are collected into windows of window_size pages (by default
+    WINDOW_BATCHES batches), encoded with embed_texts and then dropped, so
+    only a window of text is held in memory at a time. Yields
+    (path, pages, embeddings, error): pages are the page dicts without their
+    text and row i of embeddings belongs to pages[i]. Files that failed to
+    extract are yielded as (path, None, None, error).
+    """
+    window_size = window_size or batch_size * WINDOW_BATCHES
+    dimension = model.get_sentence_embedding_dimension()
+    window = []  # (path, text) pairs waiting to be encoded
+    files = {}  # path -> {'pages', 'vectors', 'pending', 'done'} for files still in flight
+
+    def encode_window():
+        vectors = embed_texts(model, [text for _, text in window], batch_size, show_progress=False)
+        for (path, _), vector in zip(window, vectors):
+            if path in files:  # Otherwise the file failed after these pages were read
+                files[path]['vectors'].append(vector)
+                files[path]['pending'] -= 1
+        window.clear()
+
+    def finished_files():
+        for path, state in list(files.items()):
+            if state['done'] and state['pending'] == 0:
+                del files[path]
+                embeddings = np.vstack(state['vectors']) if state['vectors'] else np.empty((0, dimension), np.float32)
+                yield path, state['pages'], embeddings, None
+
+    for path, page, error in events:
+        if page is not None:
+            state = files.setdefault(path, {'pages': [], 'vectors': [], 'pending': 0, 'done': False})
+            state['pages'].append({key: value for key, value in page.items() if key != 'text'})
+            state['pending'] += 1
+            window.append((path, page['text']))
+            if len(window) >= window_size:
+                encode_window()
+                yield from finished_files()
+        elif error is not None:
+            files.pop(path, None)
+            yield path, None, None, error
+        else:
+            files.setdefault(path, {'pages': [], 'vectors': [], 'pending': 0, 'done': False})['done'] = True
+            yield from finished_files()
+    if window:
+        encode_window()
+    yield from finished_files()
@@ -0,0 +1,583 @@
+"""Headless search engines with one interface for the Whoosh, FAISS and Pinecone backends.
+
+HybridEngine combines the Whoosh and FAISS engines into one with rank fusion.
+
+Each engine indexes a document directory with index(directory) and answers
+queries with search(query, k) and batch_search(queries, k), without any UI,
+so the same code runs from the Tk apps, from the command line
+(python -m docsearch.cli) and from batch jobs or benchmarks. Results are
+dicts with 'path' (relative to the indexed directory), 'filename', 'page'
+and 'score', where a higher score is always a better match. The FAISS and
+Pinecone engines embed pages in overlapping token windows (see
+docsearch.chunking) and pool the chunk hits of each document into one
+result, whose 'page' is that of its best chunk. Their search() also takes
+a metadata filter on file type, creation date and size (see
+docsearch.filters).
+
+Documents are discovered recursively, filtered by include and exclude
+globs (see docsearch.discovery). update(directory, paths) applies the
+changes to the given paths only, e.g. as reported by a file watcher (see
+docsearch.watch), re-extracting and re-embedding only new and changed
+files.
+
+Whoosh and FAISS are imported when their engine is created, and the
+pinecone client when the first connection is made, so a server that only
+uses one backend only needs that backend installed.
+
+The FAISS and Pinecone engines answer batch_search() with one encoder
+pass over all the queries, then one matrix search of the FAISS index or
+concurrent Pinecone queries. Query embeddings and results are kept in the
+shared docsearch.query_cache LRU, keyed by model, index version and the
+FAISS store's search params (nprobe, ef_search) and invalidated when the
+index changes, so repeated queries skip both the encoder and the search.
+
+Indexing and searches record their latency in docsearch.metrics, as
+search_seconds and batch_search_seconds per backend and
+encode_seconds{stage="query"}.
+"""
+import abc
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from docsearch import pinecone_sync
+from docsearch.cache import DEFAULT_CACHE_PATH
+from docsearch.chunking import (DEFAULT_CHUNK_OVERLAP, DEFAULT_POOL_SIZE, DEFAULT_POOLING, chunk_pages,
+                                chunker_for_model)
+from docsearch.discovery import DEFAULT_EXCLUDE
+from docsearch.embedding import DEFAULT_BATCH_SIZE, embed_extracted
+from docsearch.extraction import DEFAULT_FILE_TIMEOUT, stream_documents
+from docsearch.fake_pinecone import FakeIndex
+from docsearch.manifest import load_manifest
+from docsearch.metrics import metrics
+from docsearch.models import get_model, model_dimension
+from docsearch.query_cache import QueryCache, cached_search, encode_queries, filters_key, query_cache
+
+DEFAULT_TOP_K = 5
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_WHOOSH_DIRECTORY = 'indexdir'
+DEFAULT_FAISS_DIRECTORY = 'faiss_indexdir'
+DEFAULT_PINECONE_INDEX = 'document-index'
+FUSION_METHODS = ('rrf', 'weighted')
+DEFAULT_FUSION = 'rrf'
+DEFAULT_RRF_K = 60  # Damping constant from the original reciprocal rank fusion paper
+DEFAULT_CANDIDATES = 50  # Results fetched from each leg of a hybrid search before fusion
+
+
+def embed_queries(model_name: str, queries: List[str], cache: Optional[QueryCache]):
+    """Returns the embeddings of queries as a matrix, encoding those not in cache in one pass."""
+    model = get_model(model_name)
+    if cache is None:
+        return encode_queries(model, queries)
+    return cache.encode(model, model_name, queries)
+
+
+class SearchEngine(abc.ABC):
+    """Interface shared by all backends; a backend missing index(), search() or source_directory cannot be created."""
+
+    name = None
+
+    @abc.abstractmethod
+    def index(self, directory: str) -> Dict:
+        """Brings the index up to date with directory and returns a report with at least 'skipped_files'."""
+
+    def update(self, directory: str, paths: Optional[Iterable[str]] = None) -> Dict:
+        """Like index(), but only rescans paths (relative to directory, files or directories) if given.
+
+        Backends without incremental updates index the whole directory.
+        """
+        return self.index(directory)
+
+    @abc.abstractmethod
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Dict]:
+        """Returns the k best matches for query, best first."""
+
+    def batch_search(self, queries: Iterable[str], k: int = DEFAULT_TOP_K) -> List[List[Dict]]:
+        """Returns the results of search(query, k) for every query, in order."""
+        return [self.search(query, k) for query in queries]
+
+    @property
+    @abc.abstractmethod
+    def source_directory(self) -> Optional[str]:
+        """The document directory the index was built from, or None if nothing has been indexed."""
+
+    def close(self) -> None:
+        """Releases the threads and other resources the engine holds; it must not be used afterwards."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class WhooshEngine(SearchEngine):
+    """Keyword search over pages with Whoosh; scores are BM25F.
+
+    procs, limitmb and multisegment configure the index writer (see
+    docsearch.whoosh_index); optimize() merges the segments afterwards.
+    include and exclude are the glob patterns that select the documents,
+    and ocr the OCR settings of images and scanned PDFs (see docsearch.ocr).
+    """
+
+    name = 'whoosh'
+
+    def __init__(self, index_directory: str = DEFAULT_WHOOSH_DIRECTORY, incremental: bool = True,
+                 workers: Optional[int] = None, timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, procs: Optional[int] = 1,
+                 limitmb: Optional[int] = None, multisegment: bool = False,
+                 include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 ocr: Optional[Dict] = None):
+        from docsearch import whoosh_index
+        self._whoosh = whoosh_index
+        self.index_directory = index_directory
+        self.incremental = incremental
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.procs = procs
+        self.limitmb = limitmb or whoosh_index.DEFAULT_LIMITMB
+        self.multisegment = multisegment
+        self.include = include
+        self.exclude = exclude
+        self.ocr = ocr
+
+    def index(self, directory: str) -> Dict:
+        return self.update(directory)
+
+    def update(self, directory: str, paths: Optional[Iterable[str]] = None) -> Dict:
+        return self._whoosh.update_index(self.index_directory, directory, incremental=self.incremental,
+                                         workers=self.workers, timeout=self.timeout, cache_path=self.cache_path,
+                                         procs=self.procs, limitmb=self.limitmb, multisegment=self.multisegment,
+                                         include=self.include, exclude=self.exclude, paths=paths, ocr=self.ocr)
+
+    def begin_update(self, directory: str, paths: Optional[Iterable[str]] = None):
+        """Starts an index update fed by the caller; see docsearch.whoosh_index.IndexUpdate."""
+        return self._whoosh.IndexUpdate(self.index_directory, directory, incremental=self.incremental,
+                                        procs=self.procs, limitmb=self.limitmb, multisegment=self.multisegment,
+                                        include=self.include, exclude=self.exclude, paths=paths)
+
+    def optimize(self) -> Dict:
+        """Merges the index into a single segment and returns {'segments_before', 'segments_after', 'seconds'}."""
+        return self._whoosh.optimize_index(self.index_directory)
+
+    def segment_count(self) -> int:
+        """The number of segments of the index, e.g. to decide whether optimize() is worth it."""
+        return self._whoosh.segment_count(self.index_directory)
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Dict]:
+        """Returns the k best pages; each result also has 'highlights' with the matched terms in upper case."""
+        with metrics.timer('search_seconds', backend=self.name):
+            return self._whoosh.search_index(self.index_directory, query, top_k=k)
+
+    def search_page(self, query: str, pagenum: int = 1, pagelen: int = DEFAULT_TOP_K) -> Dict:
+        """Returns page pagenum (from 1) of the results as {'pagenum', 'pagecount', 'total', 'results'}."""
+        return self._whoosh.search_index_page(self.index_directory, query, pagenum, pagelen)
+
+    @property
+    def source_directory(self) -> Optional[str]:
+        return self._whoosh.index_source_directory(self.index_directory)
+
+
+class FaissEngine(SearchEngine):
+    """Semantic search over chunks of pages with a persistent FAISS store per model.
+
+    Pages are split into windows of chunk_tokens tokens (by default the
+    model's maximum sequence length) overlapping by chunk_overlap, and each
+    chunk is one vector. Search pools the chunk hits of every document (or
+    of every page, with group_by='page') with max or top-n mean pooling.
+    The score is the cosine similarity for the cosine metric and the
+    negated squared L2 distance for the l2 metric; the raw 'distance' and
+    the number of matching chunks ('hits') are kept in the results as well.
+
+    index() rebuilds the store; update() embeds only new and changed files
+    and appends them to it (see docsearch.faiss_store.StoreUpdate). ocr
+    configures the OCR of images and scanned PDFs (see docsearch.ocr).
+    With cache_queries, query embeddings and results are cached in the
+    shared query cache until the store changes.
+    """
+
+    name = 'faiss'
+
+    def __init__(self, index_directory: str = DEFAULT_FAISS_DIRECTORY, model_name: str = DEFAULT_MODEL,
+                 config: Optional[Dict] = None, batch_size: Optional[int] = None,
+                 workers: Optional[int] = None, timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, chunk_tokens: Optional[int] = None,
+                 chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, pooling: str = DEFAULT_POOLING,
+                 pool_size: int = DEFAULT_POOL_SIZE, group_by: str = 'file',
+                 include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 ocr: Optional[Dict] = None, cache_queries: bool = True):
+        from docsearch import faiss_store
+        self._faiss_store = faiss_store
+        self.index_directory = index_directory
+        self.model_name = model_name
+        self.config = faiss_store.index_config(config)
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.pooling = pooling
+        self.pool_size = pool_size
+        self.group_by = group_by
+        self.include = include
+        self.exclude = exclude
+        self.ocr = ocr
+        self.query_cache = query_cache if cache_queries else None
+
+    def index(self, directory: str) -> Dict:
+        """Rebuilds the store from every document in directory, streaming pages through the encoder.
+
+        Files are extracted as they are discovered, each chunk of a page
+        becomes one vector, and chunk text is dropped as soon as it has been
+        embedded.
+        """
+        return self.update_pages(self.begin_update(directory, incremental=False))
+
+    def update(self, directory: str, paths: Optional[Iterable[str]] = None) -> Dict:
+        """Updates the store with the new, changed and removed files; rebuilds it if it was built differently."""
+        return self.update_pages(self.begin_update(directory, paths))
+
+    def begin_update(self, directory: str, paths: Optional[Iterable[str]] = None, incremental: bool = True):
+        """Starts a store update; see docsearch.faiss_store.StoreUpdate."""
+        return self._faiss_store.StoreUpdate(self.index_directory, self.model_name, model_dimension(self.model_name),
+                                             directory, self.config, incremental=incremental, include=self.include,
+                                             exclude=self.exclude, paths=paths)
+
+    def update_pages(self, update, pages: Optional[Iterable] = None) -> Dict:
+        """Embeds the pages of the files in update.changed (every file when rebuilding) and commits the update.
+
+        pages is a page stream of at least those files (as from
+        stream_documents); by default they are extracted here.
+        """
+        if pages is None:
+            pages = stream_documents(update.source_directory, update.changed, workers=self.workers,
+                                     timeout=self.timeout, cache_path=self.cache_path, include=self.include,
+                                     exclude=self.exclude, ocr=self.ocr)
+        model = get_model(self.model_name)
+        chunks = chunk_pages(pages, chunker_for_model(model, self.chunk_tokens, self.chunk_overlap))
+        for path, file_chunks, embeddings, error in embed_extracted(model, chunks, batch_size=self.batch_size):
+            update.add(path, file_chunks, embeddings, error)
+        report = update.commit()
+        if self.query_cache is not None:
+            self.query_cache.invalidate(self._cache_namespace)
+        return report
+
+    def store(self):
+        """Returns the opened store of the model; raises FileNotFoundError if it has not been built."""
+        return self._faiss_store.open_store(self.index_directory, self.model_name)
+
+    @property
+    def _cache_namespace(self) -> tuple:
+        return (self.name, os.path.abspath(self.index_directory), self.model_name, self.group_by, self.pooling,
+                self.pool_size)
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K, filters: Optional[Dict] = None) -> List[Dict]:
+        """Returns the k best documents, only among the files that pass filters if given."""
+        with metrics.timer('search_seconds', backend=self.name):
+            return self._batch_search([query], k, filters)[0]
+
+    def batch_search(self, queries: Iterable[str], k: int = DEFAULT_TOP_K,
+                     filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Returns the results of search(query, k, filters) for every query, in order.
+
+        The queries that are not cached are encoded in one pass and searched
+        with a single index search.
+        """
+        with metrics.timer('batch_search_seconds', backend=self.name):
+            return self._batch_search(list(queries), k, filters)
+
+    def _batch_search(self, queries: List[str], k: int, filters: Optional[Dict]) -> List[List[Dict]]:
+        store = self.store()
+
+        def search(texts: List[str]) -> List[List[Dict]]:
+            embeddings = embed_queries(self.model_name, texts, self.query_cache)
+            with metrics.timer('faiss_search_seconds'):
+                hits = store.search_batch(embeddings, k, self.group_by, self.pooling, self.pool_size, filters)
+            return [[{'path': hit['path'], 'filename': hit['filename'], 'page': hit['page'], 'score': hit['score'],
+                      'distance': hit['distance'], 'hits': hit['hits']} for hit in query_hits]
+                    for query_hits in hits]
+
+        # Results also depend on the store's search params, which can be changed on the loaded store
+        return cached_search(self.query_cache, self._cache_namespace, store.version, queries,
+                             (k, filters_key(filters), store.search_params), search)
+
+    @property
+    def source_directory(self) -> Optional[str]:
+        try:
+            return self.store().source_directory
+        except FileNotFoundError:
+            return None
+
+
+class PineconeEngine(SearchEngine):
+    """Semantic search over chunked documents in a Pinecone index, kept in sync incrementally.
+
+    Chunk hits are pooled per document with `pooling` ('max' or 'topn', the
+    mean of the best pool_size chunks).
+
+    With offline=True an in-process FakeIndex is used instead of Pinecone;
+    it only lives as long as the engine, so its sync state is kept in a
+    temporary directory that lives as long too, and state_path is ignored.
+    The sync state of a real index is never touched by offline runs.
+
+    batch_search() sends up to query_workers queries concurrently. With
+    cache_queries, query embeddings and results are cached in the shared
+    query cache until this engine updates the index (the version is the
+    sync state's mtime, so updates made by other processes are only seen
+    once they sync).
+    """
+
+    name = 'pinecone'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, index_name: str = DEFAULT_PINECONE_INDEX,
+                 api_key: Optional[str] = None, environment: Optional[str] = None,
+                 state_path: Optional[str] = None, offline: bool = False,
+                 workers: Optional[int] = None, timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                 pooling: str = DEFAULT_POOLING, pool_size: int = DEFAULT_POOL_SIZE,
+                 query_workers: int = pinecone_sync.DEFAULT_QUERY_WORKERS, cache_queries: bool = True,
+                 **sync_options):
+        self.model_name = model_name
+        self.index_name = index_name
+        self.api_key = api_key if api_key is not None else os.environ.get('PINECONE_API_KEY')
+        self.environment = environment if environment is not None else os.environ.get('PINECONE_ENVIRONMENT')
+        self.offline = offline
+        if offline:
+            self._state_directory = tempfile.TemporaryDirectory(prefix='docsearch-offline-')
+            self.state_path = os.path.join(self._state_directory.name, 'pinecone_sync.json')
+        else:
+            self.state_path = state_path or f"pinecone_sync_{index_name}.json"
+        self.workers = workers
+        self.timeout = timeout
+        self.pooling = pooling
+        self.pool_size = pool_size
+        self.query_workers = query_workers
+        self.query_cache = query_cache if cache_queries else None
+        self.sync_options = sync_options  # Passed on to sync_directory (batch sizes, chunking, include/exclude, ocr...)
+        self._index = None
+
+    @property
+    def pinecone_index(self):
+        """The Pinecone index, connected (and created if needed) on first use."""
+        if self._index is None:
+            dimension = model_dimension(self.model_name)
+            if self.offline:
+                self._index = FakeIndex(dimension=dimension)
+            else:
+                self._index = pinecone_sync.connect_index(self.api_key, self.environment, self.index_name, dimension)
+        return self._index
+
+    def index(self, directory: str) -> Dict:
+        return self.update(directory)
+
+    def update(self, directory: str, paths: Optional[Iterable[str]] = None) -> Dict:
+        report = pinecone_sync.sync_directory(self.pinecone_index, get_model(self.model_name), directory,
+                                              self.state_path, self.model_name, workers=self.workers,
+                                              timeout=self.timeout, paths=paths, **self.sync_options)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(self._cache_namespace)
+        return report
+
+    @property
+    def _cache_namespace(self) -> tuple:
+        # A fake index only lives as long as its engine
+        index = id(self.pinecone_index) if self.offline else self.index_name
+        return (self.name, index, self.model_name, self.pooling, self.pool_size)
+
+    def _index_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.state_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K, filters: Optional[Dict] = None) -> List[Dict]:
+        """Returns the k best documents, only among the files that pass filters if given."""
+        with metrics.timer('search_seconds', backend=self.name):
+            return self._batch_search([query], k, filters)[0]
+
+    def batch_search(self, queries: Iterable[str], k: int = DEFAULT_TOP_K,
+                     filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Returns the results of search(query, k, filters) for every query, in order.
+
+        The queries that are not cached are encoded in one pass and sent to
+        Pinecone concurrently.
+        """
+        with metrics.timer('batch_search_seconds', backend=self.name):
+            return self._batch_search(list(queries), k, filters)
+
+    def _batch_search(self, queries: List[str], k: int, filters: Optional[Dict]) -> List[List[Dict]]:
+        def search(texts: List[str]) -> List[List[Dict]]:
+            embeddings = embed_queries(self.model_name, texts, self.query_cache)
+            return pinecone_sync.query_documents_batch(self.pinecone_index, embeddings, k, self.pooling,
+                                                       self.pool_size, filters, self.query_workers)
+
+        return cached_search(self.query_cache, self._cache_namespace, self._index_version(), queries,
+                             (k, filters_key(filters)), search)
+
+    @property
+    def source_directory(self) -> Optional[str]:
+        return load_manifest(self.state_path)['source_directory']
+
+
+class HybridEngine(SearchEngine):
+    """Keyword (Whoosh BM25F) and vector (FAISS) search over the same pages, with rank fusion.
+
+    index() and update() extract every document once and feed the pages to
+    both indexes. search() runs both legs concurrently, each returning its best
+    `candidates` pages, and fuses them per page with either reciprocal-rank
+    fusion (fusion='rrf': sum of weight / (rrf_k + rank)) or weighted score
+    fusion (fusion='weighted': sum of weight * min-max normalised score).
+    The vector leg pools its chunk hits per page, so both legs rank pages.
+    Keyword matches keep rare identifiers findable while the vector leg adds
+    semantic recall. Each result records its rank and score in every leg
+    under 'legs'; hybrid_search() also reports per-leg latency.
+    """
+
+    name = 'hybrid'
+    LEGS = ('whoosh', 'faiss')
+
+    def __init__(self, whoosh_directory: str = DEFAULT_WHOOSH_DIRECTORY, faiss_directory: str = DEFAULT_FAISS_DIRECTORY,
+                 model_name: str = DEFAULT_MODEL, config: Optional[Dict] = None, fusion: str = DEFAULT_FUSION,
+                 weights: Optional[Dict[str, float]] = None, rrf_k: int = DEFAULT_RRF_K,
+                 candidates: int = DEFAULT_CANDIDATES, incremental: bool = True, batch_size: Optional[int] = None,
+                 workers: Optional[int] = None, timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, chunk_tokens: Optional[int] = None,
+                 chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, pooling: str = DEFAULT_POOLING,
+                 pool_size: int = DEFAULT_POOL_SIZE, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE, ocr: Optional[Dict] = None,
+                 cache_queries: bool = True, **whoosh_options):
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion '{fusion}'; expected one of {', '.join(FUSION_METHODS)}")
+        self.keyword = WhooshEngine(whoosh_directory, incremental=incremental, workers=workers, timeout=timeout,
+                                    cache_path=cache_path, include=include, exclude=exclude, ocr=ocr, **whoosh_options)
+        self.vector = FaissEngine(faiss_directory, model_name, config, batch_size=batch_size, workers=workers,
+                                  timeout=timeout, cache_path=cache_path, chunk_tokens=chunk_tokens,
+                                  chunk_overlap=chunk_overlap, pooling=pooling, pool_size=pool_size, group_by='page',
+                                  include=include, exclude=exclude, ocr=ocr, cache_queries=cache_queries)
+        self.fusion = fusion
+        self.weights = dict({leg: 1.0 for leg in self.LEGS}, **(weights or {}))
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.include = include
+        self.exclude = exclude
+        self.ocr = ocr
+        self._executor = ThreadPoolExecutor(max_workers=len(self.LEGS), thread_name_prefix='hybrid-search')
+
+    def index(self, directory: str) -> Dict:
+        """Indexes directory with one extraction pass shared by both indexes.
+
+        The FAISS store is rebuilt from every page; the Whoosh index only
+        takes the pages of new or changed files unless it is rebuilt too.
+        """
+        return self._update(directory, self.keyword.begin_update(directory),
+                            self.vector.begin_update(directory, incremental=False))
+
+    def update(self, directory: str, paths: Optional[Iterable[str]] = None) -> Dict:
+        """Updates both indexes with the new, changed and removed files, extracting each changed file once."""
+        return self._update(directory, self.keyword.begin_update(directory, paths),
+                            self.vector.begin_update(directory, paths))
+
+    def _update(self, directory: str, keyword_update, vector_update) -> Dict:
+        keyword_changed = set(keyword_update.changed)
+        vector_changed = None if vector_update.changed is None else set(vector_update.changed)
+        # A rebuilding store takes every file, discovered while it is extracted
+        filenames = None if vector_changed is None else sorted(keyword_changed | vector_changed)
+
+        def pages():
+            for path, page, error in stream_documents(directory, filenames, workers=self.workers, timeout=self.timeout,
+                                                      cache_path=self.cache_path, include=self.include,
+                                                      exclude=self.exclude, ocr=self.ocr):
+                if path in keyword_changed:
+                    keyword_update.add(path, page, error)
+                if vector_changed is None or path in vector_changed:
+                    yield path, page, error
+
+        vector_report = self.vector.update_pages(vector_update, pages())
+        keyword_report = keyword_update.commit()
+        return {'indexed': vector_report['indexed'], 'removed': vector_report['removed'],
+                'vectors': vector_report['vectors'], 'keyword_indexed': keyword_report['indexed'],
+                'keyword_removed': keyword_report['removed'],
+                'skipped_files': sorted(set(vector_report['skipped_files']) | set(keyword_report['skipped_files']))}
+
+    def _timed_search(self, engine: SearchEngine, query: str, k: int):
+        start = time.perf_counter()
+        results = engine.search(query, k)
+        return results, time.perf_counter() - start
+
+    def _fuse(self, leg_results: Dict[str, List[Dict]], k: int) -> List[Dict]:
+        fused = {}  # (path, page) -> fused result
+        for leg, results in leg_results.items():
+            weight = self.weights.get(leg, 1.0)
+            if self.fusion == 'weighted' and results:
+                scores = [result['score'] for result in results]
+                low, span = min(scores), max(scores) - min(scores)
+            for rank, result in enumerate(results, start=1):
+                key = (result['path'], result['page'])
+                entry = fused.setdefault(key, {'path': result['path'], 'filename': result['filename'],
+                                               'page': result['page'], 'score': 0.0, 'legs': {}})
+                if self.fusion == 'rrf':
+                    entry['score'] += weight / (self.rrf_k + rank)
+                else:
+                    entry['score'] += weight * ((result['score'] - low) / span if span > 0 else 1.0)
+                entry['legs'][leg] = {'rank': rank, 'score': result['score']}
+                if 'highlights' in result:
+                    entry['highlights'] = result['highlights']
+        return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)[:k]
+
+    def hybrid_search(self, query: str, k: int = DEFAULT_TOP_K) -> Dict:
+        """Returns {'results', 'latency_ms'}, where latency_ms has the time of each leg, the fusion and the total."""
+        start = time.perf_counter()
+        depth = max(k, self.candidates)
+        futures = {leg: self._executor.submit(self._timed_search, engine, query, depth)
+                   for leg, engine in zip(self.LEGS, (self.keyword, self.vector))}
+        leg_results, latency_ms = {}, {}
+        for leg, future in futures.items():
+            leg_results[leg], seconds = future.result()
+            latency_ms[leg] = round(seconds * 1000, 3)
+        fusion_start = time.perf_counter()
+        results = self._fuse(leg_results, k)
+        latency_ms['fusion'] = round((time.perf_counter() - fusion_start) * 1000, 3)
+        latency_ms['total'] = round((time.perf_counter() - start) * 1000, 3)
+        metrics.observe('search_seconds', latency_ms['total'] / 1000, backend=self.name)
+        return {'results': results, 'latency_ms': latency_ms}
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Dict]:
+        return self.hybrid_search(query, k)['results']
+
+    def batch_search(self, queries: Iterable[str], k: int = DEFAULT_TOP_K) -> List[List[Dict]]:
+        """Runs the batch through both legs concurrently (the vector leg in one pass) and fuses every query."""
+        queries = list(queries)
+        depth = max(k, self.candidates)
+        with metrics.timer('batch_search_seconds', backend=self.name):
+            futures = {leg: self._executor.submit(engine.batch_search, queries, depth)
+                       for leg, engine in zip(self.LEGS, (self.keyword, self.vector))}
+            leg_results = {leg: future.result() for leg, future in futures.items()}
+            return [self._fuse({leg: results[i] for leg, results in leg_results.items()}, k)
+                    for i in range(len(queries))]
+
+    def optimize(self) -> Dict:
+        """Merges the segments of the keyword index; see WhooshEngine.optimize."""
+        return self.keyword.optimize()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    @property
+    def source_directory(self) -> Optional[str]:
+        return self.keyword.source_directory
+
+
+BACKENDS = {engine.name: engine for engine in (WhooshEngine, FaissEngine, PineconeEngine, HybridEngine)}
+
+
+def create_engine(backend: str, **options) -> SearchEngine:
+    """Creates the engine of a backend ('whoosh', 'faiss', 'pinecone' or 'hybrid') with backend-specific options."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](**options)
@@ -0,0 +1,374 @@
+"""Text extraction for PDF, image and text files, run in a pool of worker processes.
+
+Extraction is page based: every file is read as a stream of
+(page number, text) pairs, and PDFs are read one page at a time, so memory
+use is bounded by the size of a page rather than the size of a document.
+
+Each worker owns a pipe to the parent and handles one file at a time,
+sending pages back as they are read. A worker stuck on a pathological file
+can be killed and replaced without affecting the others.
+
+Images are OCR'd after preprocessing, and so are the pages of scanned PDFs
+that have no text layer, as configured by the `ocr` settings (see
+docsearch.ocr). PDF OCR needs the tesseract executable and is skipped
+without it.
+
+Page text extracted from PDFs and images is stored in the shared
+extraction cache, keyed by file content and extractor settings (including
+the OCR settings), so files already extracted by any of the apps are not
+parsed or OCR'd again.
+
+The time spent extracting each file, its size and its page count are
+recorded per file type in docsearch.metrics, and OCR time per image and scanned page;
+workers send their metrics to the parent after every file.
+"""
+import functools
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.connection import wait
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+from tqdm import tqdm
+
+from docsearch.cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, ExtractionCache
+from docsearch.discovery import DEFAULT_EXCLUDE, iter_files
+from docsearch.manifest import file_hash
+from docsearch.metrics import metrics
+from docsearch.ocr import ocr_available, ocr_config, ocr_image, ocr_pdf_pages, ocr_settings
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.txt')
+DEFAULT_FILE_TIMEOUT = 300  # Seconds a worker may spend on a single file
+
+
+def _pdf_ocr(ocr: Optional[Dict]) -> bool:
+    return ocr_config(ocr)['pdf_ocr'] and ocr_available()
+
+
+def pdf_settings(ocr: Optional[Dict] = None) -> str:
+    """Describes the PDF extractor and, if scanned pages are OCR'd, the OCR settings; part of the cache key."""
+    settings = f"pymupdf-{fitz.VersionBind}"
+    if _pdf_ocr(ocr):
+        config = ocr_config(ocr)
+        settings += f"-ocr-{ocr_settings(config)}-min_chars={config['pdf_min_chars']}"
+    return settings
+
+
+def image_settings(ocr: Optional[Dict] = None) -> str:
+    """Describes the OCR engine and its settings; part of the cache key for image text."""
+    return ocr_settings(ocr_config(ocr))
+
+
+# --- Page Extractors ---
+def _pdf_pages(filepath: str, start: int = 1, ocr: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    with fitz.open(filepath) as doc:
+        if _pdf_ocr(ocr):
+            yield from ocr_pdf_pages(doc, range(start - 1, doc.page_count), ocr_config(ocr))
+            return
+        for number in range(start - 1, doc.page_count):
+            yield number + 1, doc[number].get_text()
+
+
+def _image_pages(filepath: str, start: int = 1, ocr: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    if start == 1:
+        with Image.open(filepath) as image:
+            text = ocr_image(image, ocr_config(ocr))
+        yield 1, text
+
+
+def _cached_pages(filepath: str, cache: Optional[ExtractionCache], settings, extract) -> Iterator[Tuple[int, str]]:
+    """Yields the pages of extract(filepath), reusing cached page text for this file content and settings.
+
+    Every page is cached on its own, and the page count is only stored once
+    the whole file was read, so an interrupted extraction is never mistaken
+    for a complete one. If a page was evicted, extraction resumes from it.
+    """
+    if cache is None:
+        yield from extract(filepath)
+        return
+    content_hash = file_hash(filepath)
+    key = settings()
+    start = 1
+    page_count = cache.get(content_hash, f"{key}#pages")
+    if page_count is not None:
+        for number in range(1, int(page_count) + 1):
+            text = cache.get(content_hash, f"{key}#page={number}")
+            if text is None:
+                break
+            yield number, text
+            start = number + 1
+        else:
+            return
+    page_count = start - 1
+    for number, text in extract(filepath, start):
+        cache.put(content_hash, f"{key}#page={number}", text)
+        page_count = number
+        yield number, text
+    cache.put(content_hash, f"{key}#pages", str(page_count))
+
+
+def iter_pdf_pages(filepath: str, cache: Optional[ExtractionCache] = None,
+                   ocr: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) for each page of a PDF file as it is read, OCR'ing scanned pages."""
+    return _cached_pages(filepath, cache, functools.partial(pdf_settings, ocr), functools.partial(_pdf_pages, ocr=ocr))
+
+
+def iter_image_pages(filepath: str, cache: Optional[ExtractionCache] = None,
+                     ocr: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    """Yields the text of an image file, extracted using OCR, as its single page."""
+    return _cached_pages(filepath, cache, functools.partial(image_settings, ocr),
+                         functools.partial(_image_pages, ocr=ocr))
+
+
+def iter_text_file_pages(filepath: str, cache: Optional[ExtractionCache] = None) -> Iterator[Tuple[int, str]]:
+    """Yields the content of a text file as its single page."""
+    with open(filepath, 'r', encoding='utf-8') as file:
+        yield 1, file.read()
+
+
+def _measured_pages(filepath: str, kind: str, pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    """Yields pages, recording the file's size, page count and the time spent extracting it."""
+    metrics.count('extract_files_total', type=kind)
+    metrics.count('extract_bytes_total', os.path.getsize(filepath), type=kind)
+    count = 0
+    for page in metrics.timed_iter(pages, 'extract_seconds', type=kind):
+        count += 1
+        yield page
+    metrics.count('extract_pages_total', count, type=kind)
+
+
+def iter_pages(filepath: str, cache: Optional[ExtractionCache] = None,
+               ocr: Optional[Dict] = None) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) for a file, dispatching on its file type; unsupported files yield nothing.
+
+    ocr holds the OCR settings of images and scanned PDF pages (see docsearch.ocr.ocr_config).
+    """
+    if filepath.endswith('.pdf'):
+        return _measured_pages(filepath, 'pdf', iter_pdf_pages(filepath, cache, ocr))
+    elif filepath.endswith(('.png', '.jpg', '.jpeg')):
+        return _measured_pages(filepath, 'image', iter_image_pages(filepath, cache, ocr))
+    elif filepath.endswith('.txt'):
+        return _measured_pages(filepath, 'text', iter_text_file_pages(filepath, cache))
+    return iter(())
+
+
+def get_metadata(filepath: str) -> Dict:
+    """Extracts metadata (filename, size, creation date) from a file."""
+    return {
+        'filename': os.path.basename(filepath),
+        'size': os.path.getsize(filepath),
+        'creation_date': os.path.getctime(filepath)
+    }
+
+
+# --- Worker Pool ---
+def _open_cache(cache_path: Optional[str], cache_max_bytes: int) -> Optional[ExtractionCache]:
+    return ExtractionCache(cache_path, cache_max_bytes) if cache_path else None
+
+
+def _extraction_worker(connection, cache_path: Optional[str], cache_max_bytes: int, ocr: Optional[Dict]) -> None:
+    """Worker loop: receives file paths until it gets None.
+
+    For each file it sends ('metadata', metadata), then ('page', number, text)
+    for every page, ('metrics', state) with the metrics recorded meanwhile,
+    and finally ('done',) or ('error', message).
+    """
+    cache = _open_cache(cache_path, cache_max_bytes)
+    while True:
+        filepath = connection.recv()
+        if filepath is None:
+            if cache is not None:
+                cache.close()
+            return
+        try:
+            connection.send(('metadata', get_metadata(filepath)))
+            for number, text in iter_pages(filepath, cache, ocr):
+                connection.send(('page', number, text))
+            connection.send(('metrics', metrics.drain()))
+            connection.send(('done',))
+        except Exception as e:
+            metrics.count('extract_errors_total', reason='error')
+            connection.send(('metrics', metrics.drain()))
+            connection.send(('error', f"{type(e).__name__}: {e}"))
+
+
+def _start_worker(context, cache_path: Optional[str], cache_max_bytes: int, ocr: Optional[Dict]):
+    parent_connection, child_connection = context.Pipe()
+    process = context.Process(target=_extraction_worker, args=(child_connection, cache_path, cache_max_bytes, ocr),
+                              daemon=True)
+    process.start()
+    child_connection.close()
+    return parent_connection, process
+
+
+def iter_extract(filepaths: Iterable[str], workers: Optional[int] = None,
+                 timeout: Optional[float] = DEFAULT_FILE_TIMEOUT, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                 ocr: Optional[Dict] = None) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """Extracts files in parallel, yielding (filepath, page, error) tuples as pages are read.
+
+    page is a dict with 'text', 'page' (numbered from 1) and 'metadata'.
+    After the last page of a file, (filepath, None, None) marks it as done;
+    (filepath, None, error) means it failed, and any pages already yielded
+    for it should be discarded. Pages of different files may interleave.
+
+    workers defaults to the number of CPU cores; 0 extracts in the current
+    process without timeouts. A file that takes longer than timeout seconds,
+    or whose worker crashes, is reported with an error and its worker is
+    replaced. filepaths is consumed lazily, so it may be a generator.
+    Extracted text is cached in the SQLite file at cache_path; pass None to
+    disable the cache. ocr configures the OCR of images and scanned PDF
+    pages (see docsearch.ocr).
+    """
+    filepaths = iter(filepaths)
+    ocr = ocr_config(ocr)
+    if workers == 0:
+        cache = _open_cache(cache_path, cache_max_bytes)
+        try:
+            for filepath in filepaths:
+                try:
+                    metadata = get_metadata(filepath)
+                    for number, text in iter_pages(filepath, cache, ocr):
+                        yield filepath, {'text': text, 'page': number, 'metadata': metadata}, None
+                except Exception as e:
+                    metrics.count('extract_errors_total', reason='error')
+                    yield filepath, None, f"{type(e).__name__}: {e}"
+                else:
+                    yield filepath, None, None
+        finally:
+            if cache is not None:
+                cache.close()
+        return
+
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context()
+    idle = []  # (connection, process) pairs waiting for work
+    busy = {}  # connection -> [process, filepath, deadline, metadata]
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(busy) < workers:
+                filepath = next(filepaths, None)
+                if filepath is None:
+                    exhausted = True
+                    break
+                connection, process = idle.pop() if idle else _start_worker(context, cache_path, cache_max_bytes, ocr)
+                connection.send(filepath)
+                busy[connection] = [process, filepath, time.monotonic() + timeout if timeout else None, None]
+            if not busy:
+                return
+
+            deadlines = [state[2] for state in busy.values() if state[2] is not None]
+            wait_timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for connection in wait(list(busy), timeout=wait_timeout):
+                state = busy[connection]
+                process, filepath = state[0], state[1]
+                try:
+                    message = connection.recv()
+                except EOFError:  # The worker died without answering, e.g. a crash inside a native library
+                    del busy[connection]
+                    process.join()
+                    connection.close()
+                    metrics.count('extract_errors_total', reason='crash')
+                    yield filepath, None, f"worker exited with code {process.exitcode}"
+                    continue
+                if message[0] == 'metadata':
+                    state[3] = message[1]
+                elif message[0] == 'page':
+                    yield filepath, {'text': message[2], 'page': message[1], 'metadata': state[3]}, None
+                elif message[0] == 'metrics':
+                    metrics.merge(message[1])
+                else:
+                    del busy[connection]
+                    idle.append((connection, process))
+                    yield filepath, None, message[1] if message[0] == 'error' else None
+
+            now = time.monotonic()
+            for connection, (process, filepath, deadline, _) in list(busy.items()):
+                if deadline is not None and now >= deadline:
+                    del busy[connection]
+                    process.kill()
+                    process.join()
+                    connection.close()
+                    metrics.count('extract_errors_total', reason='timeout')
+                    yield filepath, None, f"timed out after {timeout} seconds"
+    finally:
+        for connection, process in idle:
+            try:
+                connection.send(None)
+            except OSError:
+                process.kill()
+        for state in busy.values():
+            state[0].kill()
+        for _, process in idle:
+            process.join()
+        for state in busy.values():
+            state[0].join()
+
+
+def iter_documents(directory: str, include: Optional[Sequence[str]] = None,
+                   exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE) -> Iterator[str]:
+    """Yields the relative path of every supported file under directory, recursively, as it is found.
+
+    include and exclude are glob patterns; see docsearch.discovery.
+    """
+    return iter_files(directory, include, exclude, SUPPORTED_EXTENSIONS)
+
+
+def stream_documents(directory: str, filenames: Optional[Iterable[str]] = None, workers: Optional[int] = None,
+                     timeout: Optional[float] = DEFAULT_FILE_TIMEOUT, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                     include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                     ocr: Optional[Dict] = None) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """Extracts the supported files under a directory page by page, reporting progress per file.
+
+    Yields the same (filename, page, error) tuples as iter_extract, with
+    filenames relative to directory. If filenames is given, only those files
+    are extracted; otherwise the directory tree is walked with iter_documents
+    and files are handed to the workers as they are found, so extraction
+    starts before the whole tree has been listed.
+    """
+    if filenames is None:
+        filenames = iter_documents(directory, include, exclude)
+    total = len(filenames) if isinstance(filenames, (list, tuple)) else None
+    filepaths = (os.path.join(directory, filename) for filename in filenames
+                 if filename.endswith(SUPPORTED_EXTENSIONS))
+    with tqdm(total=total, desc="Loading Documents") as progress:
+        for filepath, page, error in iter_extract(filepaths, workers, timeout, cache_path, ocr=ocr):
+            if page is None:
+                progress.update()
+                if error is not None:
+                    print(f"Error processing {os.path.relpath(filepath, directory)}: {error}", file=sys.stderr)
+            yield os.path.relpath(filepath, directory), page, error
+
+
+def load_documents(directory: str, filenames: Optional[Iterable[str]] = None, workers: Optional[int] = None,
+                   timeout: Optional[float] = DEFAULT_FILE_TIMEOUT, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                   include: Optional[Sequence[str]] = None,
+                   exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                   ocr: Optional[Dict] = None) -> Tuple[List[Dict], List[str]]:
+    """Loads the supported files under a directory in parallel, each as one document.
+
+    Returns (documents, skipped_files), where each document has 'path'
+    (relative to directory), 'text' and 'metadata', and skipped_files lists
+    the files that failed or timed out. Prefer stream_documents for large files, since
+    this keeps the full text of every document in memory.
+    """
+    documents = []
+    skipped_files = []  # Store files that caused errors
+    pages = {}  # filename -> page texts read so far
+    for filename, page, error in stream_documents(directory, filenames, workers, timeout, cache_path, include, exclude,
+                                                  ocr):
+        if page is not None:
+            pages.setdefault(filename, ([], page['metadata']))[0].append(page['text'])
+        elif error is None:
+            texts, metadata = pages.pop(filename, ([], None))
+            documents.append({'path': filename,
+                              'text': "".join(texts),
+                              'metadata': metadata or get_metadata(os.path.join(directory, filename))})
+        else:
+            pages.pop(filename, None)
+            skipped_files.append(filename)
+    return documents, skipped_files
@@ -0,0 +1,708 @@
+"""Persistent on-disk FAISS index store, one subdirectory per embedding model.
+
+Each store directory holds the FAISS index, the embedding matrix as raw
+float32 rows (loaded memory-mapped), the metadata of every indexed file, the
+chunk table and a small info file describing the store. The info file is
+written last, so a store is only visible once all of its files are complete.
+
+With storage='float16' or 'int8' the index keeps its vectors scalar
+quantized, at a half or a quarter of the float32 size; flat indexes are
+memory-mapped rather than read into memory. Because quantized (and IVF-PQ)
+distances are approximate, searches fetch rescore_factor times more
+candidates and rescore them in full precision against the float32 rows,
+which are only read from disk for those candidates. File metadata is kept
+as one JSON line per file with an int64 offsets table, both memory-mapped
+and decoded only for the files in the results, so a loaded store holds no
+Python objects per file or per vector.
+
+The type, size and creation date of every file are also kept as columns of
+a NumPy array, so a metadata filter (see docsearch.filters) is one
+vectorized mask. A filter that keeps few vectors is searched exactly over
+just those rows; otherwise the mask is passed to FAISS as an ID selector
+bitmap, so filtered queries cost about the same as unfiltered ones.
+
+Every vector is one chunk of a page (see docsearch.chunking). The chunk
+table maps vector ids to their file and page as a NumPy structured array of
+two int32 columns, 8 bytes per vector, instead of one metadata dict per
+vector; search() pools the chunk hits of each file (or page) into a single
+result. search_batch() answers many queries with one FAISS search over the
+query matrix, which spreads the per-call overhead of FAISS over the batch.
+
+Stores are built incrementally with StoreWriter: embeddings are appended to
+disk as they are produced, and the index is built from the memory-mapped
+file on commit. That lets index types that need training (IVF-Flat, IVF-PQ)
+be trained on a sample of the whole corpus.
+
+StoreUpdate keeps a store up to date with its document directory without
+rebuilding it. A manifest in the store directory (see docsearch.manifest)
+records the file id of every indexed file; new and changed files are
+appended to the embeddings and metadata files and added to the existing
+index, and the files they replace or that were deleted are marked in a
+per-file tombstone array that searches apply as a mask. Once more than
+COMPACT_THRESHOLD of the vectors belong to deleted files, compact_store
+rebuilds the store from the stored vectors of the live files, without
+embedding anything again.
+"""
+import json
+import mmap
+import os
+import re
+import shutil
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from docsearch.chunking import CANDIDATE_FACTOR, DEFAULT_POOL_SIZE, DEFAULT_POOLING, pool_scores
+from docsearch.discovery import DEFAULT_EXCLUDE, resolve_changes
+from docsearch.extraction import SUPPORTED_EXTENSIONS, iter_documents
+from docsearch.filters import FILE_DTYPE, filter_mask, normalize_filters, type_code
+from docsearch.manifest import MANIFEST_FILE, file_entry, load_manifest, rescan_files, save_manifest, scan_files
+from docsearch.metrics import metrics
+
+INDEX_FILE = 'index.faiss'
+EMBEDDINGS_FILE = 'embeddings.f32'
+METADATA_FILE = 'metadata.jsonl'
+METADATA_OFFSETS_FILE = 'metadata_offsets.npy'
+CHUNKS_FILE = 'chunks.npy'
+FILES_FILE = 'files.npy'
+DELETED_FILE = 'deleted.npy'
+INFO_FILE = 'info.json'
+STORE_FORMAT = 5  # Bumped when the files change incompatibly; older stores must be rebuilt
+
+CHUNK_DTYPE = np.dtype([('file', '<i4'), ('page', '<i4')])
+GROUP_BY = ('file', 'page')
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+METRICS = ('l2', 'cosine')
+STORAGE_TYPES = ('float32', 'float16', 'int8')
+DEFAULT_INDEX_CONFIG = {
+    'index_type': 'flat',
+    'metric': 'l2',     # 'cosine' normalizes vectors and searches by inner product
+    'storage': 'float32',  # Vector encoding in flat, IVF-Flat and HNSW indexes; IVF-PQ is always compressed
+    'rescore_factor': 4,   # Candidates per hit rescored in full precision when index distances are approximate
+    'nlist': None,      # IVF lists; None picks about 4 * sqrt(number of vectors)
+    'pq_m': None,       # IVF-PQ subquantizers; None picks one per 4 dimensions
+    'hnsw_m': 32,       # HNSW neighbours per node
+    'nprobe': 16,       # IVF lists visited per query
+    'ef_search': 64,    # HNSW candidate list size per query
+    'train_size': 50000,  # Vectors sampled to train IVF indexes
+}
+SEARCH_SETTINGS = ('nprobe', 'ef_search', 'rescore_factor')  # Only used at query time; changing them keeps the index
+ADD_CHUNK_SIZE = 65536  # Vectors read from the embeddings file per index.add call
+SUBSET_SEARCH_LIMIT = 16384  # Filters keeping at most this many vectors are searched exactly over just those
+COMPACT_THRESHOLD = 0.25  # Fraction of vectors of deleted files at which an update compacts the store
+
+# Stores already loaded in this process, keyed by store directory
+_open_stores = {}
+
+
+def store_directory(index_directory: str, model_name: str) -> str:
+    """Returns the subdirectory of index_directory that holds the store for model_name."""
+    return os.path.join(index_directory, re.sub(r'[^A-Za-z0-9._-]+', '_', model_name))
+
+
+def index_config(config: dict = None, **overrides) -> dict:
+    """Returns DEFAULT_INDEX_CONFIG updated with config and overrides, after validating it."""
+    merged = dict(DEFAULT_INDEX_CONFIG, **(config or {}), **overrides)
+    unknown = set(merged) - set(DEFAULT_INDEX_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown index settings: {', '.join(sorted(unknown))}")
+    if merged['index_type'] not in INDEX_TYPES:
+        raise ValueError(f"index_type must be one of {INDEX_TYPES}, got {merged['index_type']!r}")
+    if merged['metric'] not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}, got {merged['metric']!r}")
+    if merged['storage'] not in STORAGE_TYPES:
+        raise ValueError(f"storage must be one of {STORAGE_TYPES}, got {merged['storage']!r}")
+    return merged
+
+
+def build_settings(config: dict) -> dict:
+    """Returns the settings of an index config that the built index depends on (all but SEARCH_SETTINGS)."""
+    return {key: value for key, value in config.items() if key not in SEARCH_SETTINGS}
+
+
+def is_approximate(config: dict) -> bool:
+    """Returns whether the distances reported by the index differ from exact float32 distances."""
+    return config['storage'] != 'float32' or config['index_type'] == 'ivf_pq'
+
+
+def create_faiss_index(dimension: int, count: int, config: dict):
+    """Creates an empty, possibly untrained, FAISS index for count vectors as described by config."""
+    metric = faiss.METRIC_INNER_PRODUCT if config['metric'] == 'cosine' else faiss.METRIC_L2
+    flat = faiss.IndexFlatIP if config['metric'] == 'cosine' else faiss.IndexFlatL2
+    qtype = {'float16': faiss.ScalarQuantizer.QT_fp16, 'int8': faiss.ScalarQuantizer.QT_8bit}.get(config['storage'])
+    index_type = config['index_type']
+    if count == 0:
+        return flat(dimension)
+    if index_type == 'flat':
+        return flat(dimension) if qtype is None else faiss.IndexScalarQuantizer(dimension, qtype, metric)
+    if index_type == 'hnsw':
+        if qtype is None:
+            return faiss.IndexHNSWFlat(dimension, config['hnsw_m'], metric)
+        return faiss.IndexHNSWSQ(dimension, qtype, config['hnsw_m'], metric)
+
+    # FAISS wants at least 39 training vectors per list, so small corpora get fewer lists
+    nlist = config['nlist'] or int(4 * np.sqrt(count))
+    nlist = max(1, min(nlist, count // 39))
+    quantizer = flat(dimension)
+    if index_type == 'ivf_flat':
+        if qtype is None:
+            return faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        return faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype, metric)
+    pq_m = config['pq_m'] or next(m for m in range(max(1, dimension // 4), 0, -1) if dimension % m == 0)
+    # Each subquantizer trains 2**nbits centroids and FAISS wants about 39 training vectors per centroid
+    training = min(count, config['train_size'])
+    nbits = int(np.clip(np.log2(max(training, 1) / 39), 1, 8))
+    return faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, nbits, metric)
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None) -> None:
+    """Sets the query-time accuracy/speed knobs that apply to the index type."""
+    if nprobe is not None and hasattr(index, 'nprobe'):
+        index.nprobe = nprobe
+    if ef_search is not None and hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search
+
+
+def prepare_vectors(vectors: np.ndarray, metric: str) -> np.ndarray:
+    """Copies vectors into a float32 array FAISS can use, L2-normalized for the cosine metric."""
+    vectors = np.array(vectors, dtype=np.float32, order='C')
+    if metric == 'cosine':
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_faiss_index(embeddings: np.ndarray, config: dict, seed: int = 0):
+    """Builds an index over embeddings (which may be memory-mapped), training it on a random sample if needed."""
+    count, dimension = embeddings.shape
+    index = create_faiss_index(dimension, count, config)
+    if not index.is_trained:
+        sample_size = min(count, config['train_size'])
+        sample = np.sort(np.random.default_rng(seed).choice(count, sample_size, replace=False))
+        with metrics.timer('faiss_train_seconds', index_type=config['index_type']):
+            index.train(prepare_vectors(embeddings[sample], config['metric']))
+    for start in range(0, count, ADD_CHUNK_SIZE):
+        _add_vectors(index, embeddings[start:start + ADD_CHUNK_SIZE], config)
+    set_search_params(index, config['nprobe'], config['ef_search'])
+    return index
+
+
+def _add_vectors(index, vectors: np.ndarray, config: dict) -> None:
+    vectors = prepare_vectors(vectors, config['metric'])
+    with metrics.timer('faiss_add_seconds', index_type=config['index_type']):
+        index.add(vectors)
+    metrics.count('faiss_vectors_added_total', len(vectors))
+    metrics.count('faiss_bytes_added_total', vectors.nbytes)
+
+
+def _replace_file(path: str, write) -> None:
+    """Writes a file through a temporary path so readers never see it half written."""
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_json(path: str, data) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+
+
+def _save_array(path: str, data: np.ndarray) -> None:
+    with open(path, 'wb') as file:  # np.save would append .npy to a temporary path
+        np.save(file, data)
+
+
+def _map_file(path: str):
+    """Memory-maps a whole file read-only; an empty file, which cannot be mapped, reads as b''."""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _map_embeddings(path: str, count: int, dimension: int) -> np.ndarray:
+    if count == 0:  # An empty file cannot be memory-mapped
+        return np.empty((0, dimension), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r', shape=(count, dimension))
+
+
+def _append_file(path: str, size: int, source_path: str) -> None:
+    """Appends the content of source_path to the first size bytes of path, then deletes source_path.
+
+    Bytes after size, left by an interrupted update, are dropped. Readers
+    never map more than the first size bytes, so their mappings stay valid.
+    """
+    with open(path, 'r+b') as file, open(source_path, 'rb') as source:
+        file.truncate(size)
+        file.seek(size)
+        shutil.copyfileobj(source, file)
+    os.remove(source_path)
+
+
+def _load_info(directory: str) -> Optional[dict]:
+    """Returns the info of the store in directory, or None if there is no store of the current format."""
+    try:
+        with open(os.path.join(directory, INFO_FILE), encoding='utf-8') as file:
+            info = json.load(file)
+    except FileNotFoundError:
+        return None
+    return info if info.get('format') == STORE_FORMAT else None
+
+
+class StoreWriter:
+    """Builds the store for a model incrementally.
+
+    Each call to add_file appends the chunk vectors of a file to the
+    embeddings file; commit builds the index from that file and only then
+    replaces the existing store.
+    """
+
+    _first_file = 0  # Id of the first file added; StoreUpdate appends after the files of the existing store
+
+    def __init__(self, index_directory: str, model_name: str, dimension: int, config: dict = None,
+                 source_directory: str = None):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.config = index_config(config)
+        self.source_directory = source_directory
+        self.directory = store_directory(index_directory, model_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self._metadata_path = os.path.join(self.directory, METADATA_FILE)
+        self._metadata_file = open(self._metadata_path + '.tmp', 'wb')
+        self._metadata_offsets = array('q', [0])
+        self._file_types = []
+        self._file_type_codes = array('H')
+        self._file_sizes = array('q')
+        self._file_created = array('d')
+        self._chunk_files = array('i')
+        self._chunk_pages = array('i')
+        self._embeddings_path = os.path.join(self.directory, EMBEDDINGS_FILE)
+        self._embeddings_file = open(self._embeddings_path + '.tmp', 'wb')
+
+    @property
+    def count(self) -> int:
+        return len(self._chunk_files)
+
+    @property
+    def file_count(self) -> int:
+        return len(self._metadata_offsets) - 1
+
+    def add_file(self, metadata: dict, pages, embeddings: np.ndarray) -> int:
+        """Adds the chunk vectors of one file and returns its file id; row i of embeddings is a chunk of page pages[i]."""
+        file_id = self._first_file + self.file_count
+        line = json.dumps(metadata).encode('utf-8') + b'\n'
+        self._metadata_file.write(line)
+        self._metadata_offsets.append(self._metadata_offsets[-1] + len(line))
+        self._file_type_codes.append(type_code(metadata['filename'], self._file_types))
+        self._file_sizes.append(metadata['size'])
+        self._file_created.append(metadata['creation_date'])
+        self._embeddings_file.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        self._chunk_files.extend([file_id] * len(pages))
+        self._chunk_pages.extend(pages)
+        return file_id
+
+    def _new_tables(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the metadata offsets, chunk table and file columns of the files added so far."""
+        chunks = np.empty(self.count, dtype=CHUNK_DTYPE)
+        chunks['file'] = self._chunk_files
+        chunks['page'] = self._chunk_pages
+        offsets = np.frombuffer(self._metadata_offsets, dtype=np.int64)
+        files = np.empty(self.file_count, dtype=FILE_DTYPE)
+        files['type'] = self._file_type_codes
+        files['size'] = self._file_sizes
+        files['created'] = self._file_created
+        return offsets, chunks, files
+
+    def _write_tables(self, index, offsets: np.ndarray, chunks: np.ndarray, files: np.ndarray,
+                      deleted: np.ndarray, manifest: Optional[dict], staged: Sequence[str] = ()) -> None:
+        """Writes the index, the tables and the info file, then moves them all into place with the info file last.
+
+        staged names store files already written to their temporary path
+        (the file name plus '.tmp') that are moved into place with them.
+        Every file is complete before the first one is replaced, so the
+        files on disk only disagree for the few renames in between, and a
+        failed write leaves the previous store untouched.
+        """
+        writes = {
+            INDEX_FILE: lambda path: faiss.write_index(index, path),
+            METADATA_OFFSETS_FILE: lambda path: _save_array(path, offsets),
+            CHUNKS_FILE: lambda path: _save_array(path, chunks),
+            FILES_FILE: lambda path: _save_array(path, files),
+            DELETED_FILE: lambda path: _save_array(path, deleted),
+        }
+        if manifest is not None:
+            writes[MANIFEST_FILE] = lambda path: _save_json(path, manifest)
+        info = {
+            'format': STORE_FORMAT,
+            'file_types': self._file_types,
+            'model_name': self.model_name,
+            'dimension': self.dimension,
+            'count': len(chunks),
+            'deleted_count': int(np.count_nonzero(deleted[chunks['file']])),
+            'source_directory': self.source_directory,
+            'config': self.config,
+        }
+        writes[INFO_FILE] = lambda path: _save_json(path, info)  # Last, so readers only see the new store once complete
+        for name, write in writes.items():
+            write(os.path.join(self.directory, name + '.tmp'))
+        for name in list(staged) + list(writes):
+            os.replace(os.path.join(self.directory, name + '.tmp'), os.path.join(self.directory, name))
+
+    def commit(self, manifest: Optional[dict] = None) -> str:
+        """Builds the index and writes all store files, making the new store visible to readers.
+
+        manifest, if given, is saved with the store for later updates; its
+        file entries hold the ids returned by add_file under 'file'.
+        """
+        self._embeddings_file.close()
+        self._metadata_file.close()
+        embeddings = _map_embeddings(self._embeddings_path + '.tmp', self.count, self.dimension)
+        index = build_faiss_index(embeddings, self.config)
+        del embeddings  # Release the mapping before the file is renamed
+        offsets, chunks, files = self._new_tables()
+        self._write_tables(index, offsets, chunks, files, np.zeros(self.file_count, dtype=bool), manifest,
+                           staged=(EMBEDDINGS_FILE, METADATA_FILE))
+        return self.directory
+
+
+class StoreUpdate(StoreWriter):
+    """One update of the store for a model from the documents in document_directory.
+
+    Like docsearch.whoosh_index.IndexUpdate: creating it compares the files
+    on disk (or, with paths, only the given changed paths) with the manifest
+    saved with the store and marks the old vectors of changed and removed
+    files as deleted. The embedded chunks of the files in .changed are then
+    passed to add() and commit() finishes the update. Without a compatible
+    store (none yet, another format, source directory, dimension or index
+    configuration, ignoring the query-time SEARCH_SETTINGS), or with
+    incremental=False, the store is rebuilt from
+    every file instead: nothing is scanned up front, .changed is None and
+    every file is passed to add() as it is discovered and extracted (e.g.
+    from stream_documents(document_directory, None)).
+    """
+
+    def __init__(self, index_directory: str, model_name: str, dimension: int, document_directory: str,
+                 config: dict = None, incremental: bool = True, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE, paths: Optional[Iterable[str]] = None):
+        super().__init__(index_directory, model_name, dimension, config, source_directory=document_directory)
+        manifest = load_manifest(os.path.join(self.directory, MANIFEST_FILE))
+        info = _load_info(self.directory) if incremental else None
+        if (info is None or info['source_directory'] != document_directory or info['dimension'] != dimension
+                or build_settings(index_config(info['config'])) != build_settings(self.config)
+                or manifest['source_directory'] != document_directory):
+            info = None
+        self._base = info
+        self.indexed = 0
+        self.skipped_files = []
+        if info is None:
+            self.files, self.changed, self.removed = {}, None, []
+            return
+        self._base_offsets = np.load(os.path.join(self.directory, METADATA_OFFSETS_FILE))
+        self._base_chunks = np.load(os.path.join(self.directory, CHUNKS_FILE))
+        self._base_files = np.load(os.path.join(self.directory, FILES_FILE))
+        self._deleted = np.load(os.path.join(self.directory, DELETED_FILE))
+        self._file_types = list(info['file_types'])
+        self._first_file = len(self._base_files)
+
+        previous = manifest['files']
+        if paths is None:
+            self.files, self.changed, self.removed = scan_files(
+                document_directory, iter_documents(document_directory, include, exclude), previous)
+        else:
+            files, cleared = resolve_changes(document_directory, paths, include, exclude, SUPPORTED_EXTENSIONS)
+            self.files, self.changed, self.removed = rescan_files(document_directory, files, cleared, previous)
+        for path in self.removed + self.changed:
+            if previous.get(path, {}).get('file') is not None:
+                self._deleted[previous[path]['file']] = True
+
+    @property
+    def rebuild(self) -> bool:
+        """Whether the store is rebuilt from every file instead of updated."""
+        return self._base is None
+
+    def add(self, path: str, chunks: List[dict], embeddings: np.ndarray, error: Optional[str] = None) -> None:
+        """Adds the embedded chunks of a changed file (as from embed_extracted), or records a file that failed."""
+        if error is not None:
+            # Failed files are left out of the manifest, so the next update retries them
+            self.skipped_files.append(path)
+            self.files.pop(path, None)
+            return
+        self.indexed += 1
+        if path not in self.files:  # Rebuilding: files are recorded as they arrive
+            self.files[path] = file_entry(os.path.join(self.source_directory, path))
+        if chunks:  # Files without any text have nothing to search
+            self.files[path]['file'] = self.add_file(dict(chunks[0]['metadata'], path=path),
+                                                     [chunk['page'] for chunk in chunks], embeddings)
+
+    def commit(self) -> Dict:
+        """Writes the update and returns {'indexed', 'removed', 'vectors', 'deleted_vectors', 'skipped_files'}.
+
+        vectors is the number of vectors added and deleted_vectors the number
+        of vectors of deleted files still in the store, which is 0 after a
+        rebuild or a compaction.
+        """
+        manifest = {'source_directory': self.source_directory, 'files': self.files}
+        with metrics.timer('index_commit_seconds', backend='faiss'):
+            if self.rebuild:
+                super().commit(manifest)
+                deleted_count = 0
+            else:
+                deleted_count = self._append(manifest)
+        if not self.rebuild and deleted_count > COMPACT_THRESHOLD * (self._base['count'] + self.count):
+            with metrics.timer('faiss_compact_seconds'):
+                compact_store(os.path.dirname(self.directory), self.model_name)
+            deleted_count = 0
+        return {'indexed': self.indexed, 'removed': len(self.removed), 'vectors': self.count,
+                'deleted_vectors': deleted_count, 'skipped_files': self.skipped_files}
+
+    def _append(self, manifest: dict) -> int:
+        """Appends the added files to the existing store; returns the number of vectors of deleted files."""
+        self._embeddings_file.close()
+        self._metadata_file.close()
+        if not self.changed and not self.removed:  # Only touched files; the vectors stay as they are
+            os.remove(self._embeddings_path + '.tmp')
+            os.remove(self._metadata_path + '.tmp')
+            save_manifest(os.path.join(self.directory, MANIFEST_FILE), manifest)
+            if index_config(self._base['config']) != self.config:  # Only the search settings changed
+                _replace_file(os.path.join(self.directory, INFO_FILE),
+                              lambda path: _save_json(path, dict(self._base, config=self.config)))
+            return self._base['deleted_count']
+        base_count = self._base['count']
+        _append_file(self._embeddings_path, base_count * self.dimension * 4, self._embeddings_path + '.tmp')
+        _append_file(self._metadata_path, int(self._base_offsets[-1]), self._metadata_path + '.tmp')
+        # Read into memory rather than memory-mapped, since the index grows; readers keep the file they opened
+        index = faiss.read_index(os.path.join(self.directory, INDEX_FILE))
+        embeddings = _map_embeddings(self._embeddings_path, base_count + self.count, self.dimension)
+        for start in range(base_count, base_count + self.count, ADD_CHUNK_SIZE):
+            _add_vectors(index, embeddings[start:min(start + ADD_CHUNK_SIZE, base_count + self.count)], self.config)
+        del embeddings
+        set_search_params(index, self.config['nprobe'], self.config['ef_search'])
+        offsets, chunks, files = self._new_tables()
+        offsets = np.concatenate([self._base_offsets, self._base_offsets[-1] + offsets[1:]])
+        chunks = np.concatenate([self._base_chunks, chunks])
+        files = np.concatenate([self._base_files, files])
+        deleted = np.concatenate([self._deleted, np.zeros(self.file_count, dtype=bool)])
+        self._write_tables(index, offsets, chunks, files, deleted, manifest)
+        return int(np.count_nonzero(deleted[chunks['file']]))
+
+
+def compact_store(index_directory: str, model_name: str) -> Dict:
+    """Rebuilds the store for model_name without the vectors of deleted files, from its stored float32 rows.
+
+    File ids change, and the manifest is rewritten to match. The index is
+    trained again on the remaining vectors. Returns {'vectors_before',
+    'vectors_after'}.
+    """
+    store = FaissStore(store_directory(index_directory, model_name))
+    manifest = load_manifest(os.path.join(store.directory, MANIFEST_FILE))
+    writer = StoreWriter(index_directory, model_name, store.info['dimension'], store.config,
+                         source_directory=store.source_directory)
+    live = np.flatnonzero(~store.deleted)
+    # Chunks are stored in file order, so each file's rows are one contiguous range
+    starts = np.searchsorted(store.chunks['file'], live, side='left')
+    ends = np.searchsorted(store.chunks['file'], live, side='right')
+    file_ids = {}
+    for file_id, start, end in zip(live.tolist(), starts.tolist(), ends.tolist()):
+        file_ids[file_id] = writer.add_file(store.file_metadata(file_id), store.chunks['page'][start:end].tolist(),
+                                            store.embeddings[start:end])
+    for entry in manifest['files'].values():
+        if entry.get('file') is not None:
+            entry['file'] = file_ids[entry['file']]
+    vectors_before = store.info['count']
+    del store  # Release its memory maps before the files are replaced
+    writer.commit(manifest)
+    return {'vectors_before': vectors_before, 'vectors_after': writer.count}
+
+
+class FaissStore:
+    """A store loaded from disk: FAISS index, memory-mapped embeddings, file metadata and chunk table."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        info_path = os.path.join(directory, INFO_FILE)
+        self.version = os.stat(info_path).st_mtime_ns
+        with open(info_path, encoding='utf-8') as file:
+            self.info = json.load(file)
+        if self.info.get('format') != STORE_FORMAT:
+            raise FileNotFoundError(f"The index in {directory} was built by an older version; index the documents again")
+        self.config = index_config(self.info.get('config'))
+        # Flat and scalar quantized indexes are memory-mapped instead of copied into memory
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) if self.config['index_type'] == 'flat' else 0
+        self.index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+        set_search_params(self.index, self.config['nprobe'], self.config['ef_search'])
+        self.embeddings = _map_embeddings(os.path.join(directory, EMBEDDINGS_FILE),
+                                          self.info['count'], self.info['dimension'])
+        self._metadata = _map_file(os.path.join(directory, METADATA_FILE))
+        self.metadata_offsets = np.load(os.path.join(directory, METADATA_OFFSETS_FILE), mmap_mode='r')
+        self.chunks = np.load(os.path.join(directory, CHUNKS_FILE))
+        self.files = np.load(os.path.join(directory, FILES_FILE))
+        self.deleted = np.load(os.path.join(directory, DELETED_FILE))  # Tombstones of files removed by updates
+
+    @property
+    def model_name(self) -> str:
+        return self.info['model_name']
+
+    @property
+    def source_directory(self) -> str:
+        return self.info.get('source_directory')
+
+    @property
+    def file_count(self) -> int:
+        return len(self.metadata_offsets) - 1
+
+    def file_metadata(self, file_id: int) -> dict:
+        """Returns the metadata dict of a file, decoded from its line of the metadata file."""
+        start, end = self.metadata_offsets[file_id], self.metadata_offsets[file_id + 1]
+        return json.loads(self._metadata[start:end])
+
+    @property
+    def file_types(self) -> list:
+        return self.info['file_types']
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None) -> None:
+        """Tunes how many IVF lists or HNSW candidates later searches visit."""
+        set_search_params(self.index, nprobe, ef_search)
+
+    @property
+    def search_params(self) -> Tuple[Optional[int], Optional[int]]:
+        """The current (nprobe, ef_search) of the index, None where they do not apply."""
+        return (self.index.nprobe if hasattr(self.index, 'nprobe') else None,
+                self.index.hnsw.efSearch if hasattr(self.index, 'hnsw') else None)
+
+    def chunk_mask(self, filters: dict = None) -> Optional[np.ndarray]:
+        """Returns the boolean mask of the live vectors whose files pass a metadata filter.
+
+        Returns None if every vector is live and passes, so the search needs no mask.
+        """
+        if not filters and not self.info['deleted_count']:
+            return None
+        live = ~self.deleted
+        if filters:
+            live &= filter_mask(self.files, self.file_types, normalize_filters(filters))
+        return live[self.chunks['file']]
+
+    def _search_parameters(self, selector):
+        """Returns FAISS search parameters restricted by selector, keeping the store's nprobe or efSearch."""
+        index = faiss.downcast_index(self.index)
+        if hasattr(index, 'nprobe'):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        if hasattr(index, 'hnsw'):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def rescore(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Returns the exact scores of the vectors ids for a prepared query, read from the float32 rows.
+
+        query may also be a matrix of prepared queries, one per row; the
+        scores are then a matrix with one row per query.
+        """
+        rows = prepare_vectors(self.embeddings[ids], self.config['metric'])
+        if self.config['metric'] == 'cosine':
+            return query @ rows.T
+        if query.ndim == 1:
+            return -np.sum((rows - query) ** 2, axis=1)
+        # Exact differences rather than the expanded product, whose rounding can reorder equidistant rows
+        return np.stack([-np.sum((rows - row) ** 2, axis=1) for row in query])
+
+    def search_chunks(self, query_embedding: np.ndarray, top_k: int,
+                      mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the scores and ids of the top_k nearest chunks, nearest first.
+
+        The score is the cosine similarity for the cosine metric and the
+        negated squared L2 distance for l2, so higher is closer. When the
+        index distances are approximate, top_k * rescore_factor candidates
+        are rescored with the full-precision vectors. mask, a boolean array
+        over all vectors, restricts the search to the vectors where it is True.
+        """
+        return self.search_chunks_batch(np.reshape(query_embedding, (1, -1)), top_k, mask)[0]
+
+    def search_chunks_batch(self, query_embeddings: np.ndarray, top_k: int,
+                            mask: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Like search_chunks for every row of query_embeddings, with a single index search for all of them."""
+        queries = prepare_vectors(np.reshape(query_embeddings, (len(query_embeddings), -1)), self.config['metric'])
+        if not len(queries):
+            return []
+        params = bitmap = None
+        if mask is not None:
+            selected = np.flatnonzero(mask)
+            if len(selected) <= SUBSET_SEARCH_LIMIT:
+                results = []
+                for scores in np.atleast_2d(self.rescore(queries, selected)):
+                    best = np.argsort(-scores, kind='stable')[:top_k]
+                    results.append((scores[best], selected[best]))
+                return results
+            bitmap = np.packbits(mask, bitorder='little')  # Must outlive the search
+            params = self._search_parameters(faiss.IDSelectorBitmap(bitmap))
+        rescore = is_approximate(self.config) and self.config['rescore_factor']
+        distances, ids = self.index.search(queries, top_k * self.config['rescore_factor'] if rescore else top_k,
+                                           params=params)
+        results = []
+        for query, query_distances, query_ids in zip(queries, distances, ids):
+            found = query_ids >= 0
+            query_distances, query_ids = query_distances[found], query_ids[found]
+            if not rescore:
+                results.append((query_distances if self.config['metric'] == 'cosine' else -query_distances,
+                                query_ids))
+                continue
+            query_ids = np.sort(query_ids)  # Reads the memory-mapped rows in file order
+            scores = self.rescore(query, query_ids)
+            best = np.argsort(-scores, kind='stable')[:top_k]
+            results.append((scores[best], query_ids[best]))
+        return results
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, group_by: str = 'file',
+               pooling: str = DEFAULT_POOLING, pool_size: int = DEFAULT_POOL_SIZE, filters: dict = None) -> list:
+        """Returns up to top_k files (or pages, with group_by='page'), best first.
+
+        The nearest top_k * CANDIDATE_FACTOR chunks are pooled per group (see
+        docsearch.chunking.pool_scores). Each result is the metadata dict of
+        the file with the 'page' of its best chunk, the pooled 'score', the
+        matching 'distance' and the number of chunk 'hits'. For the cosine
+        metric the distance is 1 - cosine similarity, so smaller is closer
+        for every metric. filters (see docsearch.filters) restricts the
+        search to the files that pass them.
+        """
+        return self.search_batch(np.reshape(query_embedding, (1, -1)), top_k, group_by, pooling, pool_size,
+                                 filters)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, group_by: str = 'file',
+                     pooling: str = DEFAULT_POOLING, pool_size: int = DEFAULT_POOL_SIZE,
+                     filters: dict = None) -> List[list]:
+        """Returns the results of search() for every row of query_embeddings, searching the index once for all."""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {GROUP_BY}, got {group_by!r}")
+        mask = self.chunk_mask(filters)
+        return [self._pool(scores, ids, top_k, group_by, pooling, pool_size)
+                for scores, ids in self.search_chunks_batch(query_embeddings, top_k * CANDIDATE_FACTOR, mask)]
+
+    def _pool(self, scores: np.ndarray, ids: np.ndarray, top_k: int, group_by: str, pooling: str,
+              pool_size: int) -> list:
+        chunks = self.chunks[ids]
+        groups = chunks['file'].astype(np.int64)
+        if group_by == 'page':
+            groups = (groups << 32) | chunks['page']
+        _, pooled, best, hits = pool_scores(groups, scores, pooling, pool_size)
+        distances = 1.0 - pooled if self.config['metric'] == 'cosine' else -pooled
+        return [dict(self.file_metadata(chunks['file'][i]), page=int(chunks['page'][i]), score=float(score),
+                     distance=float(distance), hits=int(count))
+                for score, distance, i, count in zip(pooled[:top_k], distances[:top_k], best[:top_k], hits[:top_k])]
+
+
+def open_store(index_directory: str, model_name: str) -> FaissStore:
+    """Returns the store for model_name, reading it from disk only on first use or after a rebuild."""
+    directory = store_directory(index_directory, model_name)
+    try:
+        version = os.stat(os.path.join(directory, INFO_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No index for model '{model_name}' in {index_directory}; index the documents first")
+    store = _open_stores.get(directory)
+    if store is None or store.version != version:
+        metrics.count('cache_misses_total', cache='faiss_store')
+        with metrics.timer('faiss_load_seconds'):
+            store = FaissStore(directory)
+        _open_stores[directory] = store
+    else:
+        metrics.count('cache_hits_total', cache='faiss_store')
+    return store
@@ -0,0 +1,157 @@
+"""In-process stand-in for a Pinecone index, for offline testing and benchmarking.
+
+FakeIndex implements the parts of the ``pinecone.Index`` API the apps use
+(upsert, query, delete, fetch and describe_index_stats) on NumPy arrays.
+It enforces Pinecone's per-request limits and can simulate network latency
+and throttling, so the ingest path can be exercised without an API key.
+"""
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MAX_VECTORS_PER_UPSERT = 1000
+MAX_REQUEST_BYTES = 2 * 1024 * 1024
+METRICS = ('cosine', 'dotproduct', 'euclidean')
+
+# Metadata filter operators supported by query, as in Pinecone's filter syntax
+FILTER_OPERATORS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value is not None and value > operand,
+    '$gte': lambda value, operand: value is not None and value >= operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+class FakePineconeError(Exception):
+    """Raised like a Pinecone API error; status carries the HTTP status code."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"({status}) {message}")
+        self.status = status
+
+
+def matches_filter(metadata: Dict, filter: Dict) -> bool:
+    """Returns whether metadata passes a Pinecone filter of per-field values or operator dicts."""
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, operand in condition.items():
+            if operator not in FILTER_OPERATORS:
+                raise FakePineconeError(400, f"Unsupported filter operator {operator}")
+            if not FILTER_OPERATORS[operator](value, operand):
+                return False
+    return True
+
+
+class FakeIndex:
+    """Thread-safe in-memory vector index with a Pinecone-compatible interface."""
+
+    def __init__(self, dimension: int, metric: str = 'cosine', latency: float = 0.0, throttle_rate: float = 0.0,
+                 seed: int = 0):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+        self.dimension = dimension
+        self.metric = metric
+        self.latency = latency  # Seconds added to every request
+        self.throttle_rate = throttle_rate  # Probability that a request fails with 429
+        self.requests = 0
+        self.throttled = 0
+        self._namespaces = {}  # namespace -> {id: (vector, metadata)}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _request(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                raise FakePineconeError(429, "Too Many Requests")
+
+    @staticmethod
+    def _normalize(vector) -> tuple:
+        if isinstance(vector, dict):
+            return vector['id'], vector['values'], vector.get('metadata') or {}
+        vector_id, values, *rest = vector
+        return vector_id, values, rest[0] if rest else {}
+
+    def upsert(self, vectors, namespace: str = '') -> Dict:
+        if len(vectors) > MAX_VECTORS_PER_UPSERT:
+            raise FakePineconeError(400, f"Upsert of {len(vectors)} vectors exceeds {MAX_VECTORS_PER_UPSERT}")
+        vectors = [self._normalize(vector) for vector in vectors]
+        request_bytes = len(json.dumps([[vector_id, list(values), metadata] for vector_id, values, metadata in vectors]))
+        if request_bytes > MAX_REQUEST_BYTES:
+            raise FakePineconeError(400, f"Request of {request_bytes} bytes exceeds {MAX_REQUEST_BYTES}")
+        self._request()
+        with self._lock:
+            records = self._namespaces.setdefault(namespace, {})
+            for vector_id, values, metadata in vectors:
+                if len(values) != self.dimension:
+                    raise FakePineconeError(400, f"Vector dimension {len(values)} does not match {self.dimension}")
+                records[vector_id] = (np.asarray(values, dtype=np.float32), dict(metadata))
+        return {'upserted_count': len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = False,
+              include_values: bool = False, namespace: str = '', filter: Optional[Dict] = None) -> Dict:
+        self._request()
+        with self._lock:
+            records = list(self._namespaces.get(namespace, {}).items())
+        if filter:
+            records = [(vector_id, record) for vector_id, record in records
+                       if matches_filter(record[1], filter)]
+        if not records:
+            return {'matches': [], 'namespace': namespace}
+        matrix = np.stack([record[0] for _, record in records])
+        query = np.asarray(vector, dtype=np.float32)
+        if self.metric == 'euclidean':  # Negated, so the best match has the highest score for every metric
+            scores = -np.linalg.norm(matrix - query, axis=1)
+        else:
+            scores = matrix @ query
+            if self.metric == 'cosine':
+                scores /= np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(query), 1e-12)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for i in order:
+            vector_id, (values, metadata) = records[i]
+            match = {'id': vector_id, 'score': float(scores[i])}
+            if include_metadata:
+                match['metadata'] = dict(metadata)
+            if include_values:
+                match['values'] = values.tolist()
+            matches.append(match)
+        return {'matches': matches, 'namespace': namespace}
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = '') -> Dict:
+        self._request()
+        with self._lock:
+            records = self._namespaces.setdefault(namespace, {})
+            if delete_all:
+                records.clear()
+            for vector_id in ids or ():
+                records.pop(vector_id, None)
+        return {}
+
+    def fetch(self, ids: List[str], namespace: str = '') -> Dict:
+        self._request()
+        with self._lock:
+            records = self._namespaces.get(namespace, {})
+            return {'vectors': {vector_id: {'id': vector_id, 'values': records[vector_id][0].tolist(),
+                                            'metadata': dict(records[vector_id][1])}
+                                for vector_id in ids if vector_id in records}}
+
+    def describe_index_stats(self) -> Dict:
+        with self._lock:
+            namespaces = {name: {'vector_count': len(records)} for name, records in self._namespaces.items()}
+        return {'dimension': self.dimension,
+                'namespaces': namespaces,
+                'total_vector_count': sum(stats['vector_count'] for stats in namespaces.values())}
@@ -0,0 +1,95 @@
+"""Metadata filters on file type, creation date and size, shared by the vector backends.
+
+A filter is a dict with any of these keys:
+
+    types           file extensions to keep, e.g. ['pdf', 'txt']
+    created_after   earliest creation date, as a timestamp or an ISO date ('2024-01-31')
+    created_before  latest creation date, likewise
+    min_size        smallest file size in bytes
+    max_size        largest file size in bytes
+
+The FAISS store keeps the filterable fields of every file in columnar NumPy
+arrays (FILE_DTYPE) and evaluates a filter as one vectorized boolean mask
+with filter_mask; pinecone_filter translates the same filter into
+Pinecone's metadata filter syntax.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+FILTER_KEYS = ('types', 'created_after', 'created_before', 'min_size', 'max_size')
+FILE_DTYPE = np.dtype([('type', '<u2'), ('size', '<i8'), ('created', '<f8')])
+
+
+def file_type(filename: str) -> str:
+    """Returns the type of a file as its lower-case extension without the dot, e.g. 'pdf'."""
+    return os.path.splitext(filename)[1].lstrip('.').lower()
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def normalize_filters(filters: Optional[Dict]) -> Dict:
+    """Validates a filter and returns it with types lower-cased and dates as timestamps; None means no filter."""
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+    if 'types' in filters:
+        types = [filters['types']] if isinstance(filters['types'], str) else filters['types']
+        filters['types'] = sorted({t.lstrip('.').lower() for t in types})
+    for key in ('created_after', 'created_before'):
+        if key in filters:
+            filters[key] = _timestamp(filters[key])
+    for key in ('min_size', 'max_size'):
+        if key in filters:
+            filters[key] = int(filters[key])
+    return filters
+
+
+def type_code(filename: str, types: List[str]) -> int:
+    """Returns the code of a file's type in the types table, adding the type if it is new."""
+    kind = file_type(filename)
+    if kind not in types:
+        types.append(kind)
+    return types.index(kind)
+
+
+def filter_mask(columns: np.ndarray, types: Sequence[str], filters: Dict) -> np.ndarray:
+    """Returns the boolean mask of the rows of columns (a FILE_DTYPE array) that pass a normalized filter."""
+    mask = np.ones(len(columns), dtype=bool)
+    if 'types' in filters:
+        codes = [code for code, kind in enumerate(types) if kind in filters['types']]
+        mask &= np.isin(columns['type'], codes)
+    if 'created_after' in filters:
+        mask &= columns['created'] >= filters['created_after']
+    if 'created_before' in filters:
+        mask &= columns['created'] <= filters['created_before']
+    if 'min_size' in filters:
+        mask &= columns['size'] >= filters['min_size']
+    if 'max_size' in filters:
+        mask &= columns['size'] <= filters['max_size']
+    return mask
+
+
+def pinecone_filter(filters: Dict) -> Optional[Dict]:
+    """Returns the Pinecone metadata filter of a normalized filter, or None if it filters nothing."""
+    conditions = {}
+    if 'types' in filters:
+        conditions['file_type'] = {'$in': filters['types']}
+    for field, low, high in (('creation_date', 'created_after', 'created_before'), ('size', 'min_size', 'max_size')):
+        bounds = {}
+        if low in filters:
+            bounds['$gte'] = filters[low]
+        if high in filters:
+            bounds['$lte'] = filters[high]
+        if bounds:
+            conditions[field] = bounds
+    return conditions or None
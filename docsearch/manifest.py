@@ -0,0 +1,94 @@
+"""File manifest used to detect which source files changed between indexing runs.
+
+A manifest records the size, modification time and content hash of every
+indexed file, keyed by its path relative to the source directory. Files
+whose size and mtime are unchanged are assumed unchanged and are not
+re-hashed, so scanning a mostly static archive only costs one stat per file.
+"""
+import hashlib
+import json
+import os
+
+from docsearch.discovery import is_under
+
+MANIFEST_FILE = 'manifest.json'
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(filepath: str) -> str:
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_entry(filepath: str) -> dict:
+    """Returns the manifest entry of a file: its size, mtime and content hash."""
+    stat = os.stat(filepath)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(filepath)}
+
+
+def load_manifest(path: str) -> dict:
+    """Loads a manifest, returning an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return {'source_directory': None, 'files': {}}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """Writes a manifest through a temporary file so an interrupted run leaves the old one intact."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+
+
+def scan_files(directory: str, relpaths, previous: dict):
+    """Compares files on disk with a previous manifest's file entries.
+
+    Returns (files, changed, removed): the new file entries (entries of
+    unchanged files keep any extra fields an index stored in them), the
+    relative paths that are new or whose content changed, and the relative
+    paths in the previous manifest that no longer exist.
+    """
+    files = {}
+    changed = []
+    for relpath in relpaths:
+        stat = os.stat(os.path.join(directory, relpath))
+        entry = previous.get(relpath)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            files[relpath] = entry
+            continue
+        digest = file_hash(os.path.join(directory, relpath))
+        if entry is None or entry['hash'] != digest:
+            files[relpath] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest}
+            changed.append(relpath)
+        else:  # Touched but unchanged; keeps anything the index recorded in the entry
+            files[relpath] = dict(entry, size=stat.st_size, mtime=stat.st_mtime_ns)
+    removed = [relpath for relpath in previous if relpath not in files]
+    return files, changed, removed
+
+
+def rescan_files(directory: str, relpaths, cleared, previous: dict):
+    """Like scan_files, but only for some paths, e.g. the changes reported by a file watcher.
+
+    relpaths are the files to rescan. Every entry at or under a path in
+    cleared (e.g. a directory that was rescanned, or a path that no longer
+    exists) that is not in relpaths is removed; see
+    discovery.resolve_changes. Files in relpaths that have disappeared in
+    the meantime are removed too. Entries of all other files are kept as
+    they are. Returns (files, changed, removed) as scan_files does.
+    """
+    relpaths = list(relpaths)
+    existing = [relpath for relpath in relpaths if os.path.isfile(os.path.join(directory, relpath))]
+    cleared = set(cleared).union(set(relpaths) - set(existing))
+    files, changed, _ = scan_files(directory, existing, previous)
+    removed = [relpath for relpath in previous if relpath not in files and is_under(relpath, cleared)]
+    for relpath, entry in previous.items():
+        files.setdefault(relpath, entry)
+    for relpath in removed:
+        del files[relpath]
+    return files, changed, removed
@@ -0,0 +1,227 @@
+"""Lightweight instrumentation of the ingest and query paths: counters, timers and latency histograms.
+
+Every stage records into the process-wide registry `metrics`:
+
+    with metrics.timer('extract_seconds', type='pdf'):
+        ...
+    metrics.count('extract_bytes_total', size, type='pdf')
+
+A timer adds the elapsed seconds to a histogram with fixed buckets (count,
+sum and per-bucket counts, as Prometheus histograms); counters only add up.
+Names ending in _total are counters and names ending in _seconds are
+latency histograms. Cache lookups are counted as cache_hits_total and
+cache_misses_total with a `cache` label, and snapshot() reports the hit
+rate of every cache. snapshot() returns everything as a JSON-serializable
+dict, to_prometheus() in the Prometheus text exposition format.
+
+Extraction runs in worker processes, each with its own registry. A worker
+drains what it recorded after every file and sends it to the parent, which
+merges it, so the parent's registry covers the whole run.
+
+profile() runs cProfile, and optionally tracemalloc, around a single run.
+"""
+import bisect
+import cProfile
+import io
+import json
+import math
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   math.inf)
+PROMETHEUS_PREFIX = 'docsearch_'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """Thread-safe registry of counters and latency histograms, keyed by name and labels."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [count per bucket, sum, count]
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """Adds value to a counter."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Records one observation, e.g. a latency in seconds, in a histogram."""
+        key = (name, _labels(labels))
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Records the seconds spent in the with block in a histogram, also if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, iterable: Iterable, name: str, **labels) -> Iterator:
+        """Yields from iterable, recording the seconds spent producing its items (not consuming them) once it ends."""
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    return
+                elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    def drain(self) -> Dict:
+        """Returns the raw state recorded so far and resets the registry, e.g. to send it to another process."""
+        with self._lock:
+            state = {'counters': self._counters, 'histograms': self._histograms}
+            self._counters, self._histograms = {}, {}
+        return state
+
+    def merge(self, state: Dict) -> None:
+        """Adds a raw state returned by drain() to this registry."""
+        with self._lock:
+            for key, value in state['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, count) in state['histograms'].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    self._histograms[key] = [list(counts), total, count]
+                else:
+                    histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                    histogram[1] += total
+                    histogram[2] += count
+
+    def reset(self) -> None:
+        self.drain()
+
+    def snapshot(self) -> Dict:
+        """Returns {'counters', 'histograms', 'cache_hit_rates'} as JSON-serializable data.
+
+        Histogram buckets are cumulative counts keyed by their upper bound,
+        as in Prometheus.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total, count) for key, (counts, total, count) in self._histograms.items()}
+        snapshot = {'counters': [], 'histograms': [], 'cache_hit_rates': {}}
+        for (name, labels), value in sorted(counters.items()):
+            snapshot['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            buckets = {}
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                buckets['+Inf' if math.isinf(bound) else repr(bound)] = cumulative
+            snapshot['histograms'].append({'name': name, 'labels': dict(labels), 'count': count,
+                                           'sum': round(total, 6), 'mean': round(total / count, 6) if count else None,
+                                           'buckets': buckets})
+        for cache in sorted({dict(labels).get('cache') for name, labels in counters
+                             if name in ('cache_hits_total', 'cache_misses_total')}):
+            hits = sum(value for (name, labels), value in counters.items()
+                       if name == 'cache_hits_total' and dict(labels).get('cache') == cache)
+            misses = sum(value for (name, labels), value in counters.items()
+                         if name == 'cache_misses_total' and dict(labels).get('cache') == cache)
+            snapshot['cache_hit_rates'][cache] = round(hits / (hits + misses), 4) if hits + misses else None
+        return snapshot
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format, names prefixed with PROMETHEUS_PREFIX."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def label_text(labels: Dict, **extra) -> str:
+            items = list(labels.items()) + list(extra.items())
+            if not items:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                       for _, value in items)
+            return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+        for counter in snapshot['counters']:
+            name = PROMETHEUS_PREFIX + counter['name']
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = PROMETHEUS_PREFIX + histogram['name']
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in histogram['buckets'].items():
+                lines.append(f"{name}_bucket{label_text(histogram['labels'], le=bound)} {count}")
+            lines.append(f"{name}_sum{label_text(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """Writes the metrics to path, in the Prometheus text format if it ends in .prom and as JSON otherwise."""
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json() + '\n'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profile(path: Optional[str] = None, trace_memory: bool = False, top: int = 20) -> Iterator[Dict]:
+    """Profiles the with block with cProfile, and tracemalloc if trace_memory, for a single run.
+
+    Yields a dict that is filled on exit with 'profile', the top functions
+    by cumulative time as text, and with trace_memory 'memory': current and
+    peak traced bytes and the top allocation sites. With path, the raw
+    cProfile stats are also written there (for pstats or snakeviz). Only the
+    current process is profiled; extract with workers=0 to include
+    extraction.
+    """
+    result = {}
+    profiler = cProfile.Profile()
+    if trace_memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        if trace_memory:  # Before the profiler's stats are processed, which allocates too
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['memory'] = {'current_bytes': current, 'peak_bytes': peak,
+                                'top': [str(stat) for stat in snapshot.statistics('lineno')[:top]]}
+        if path:
+            profiler.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(top)
+        result['profile'] = stream.getvalue()
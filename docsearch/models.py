@@ -0,0 +1,130 @@
+"""Registry of sentence-transformers encoders shared by the apps.
+
+Models are loaded lazily on first use and kept in a bounded LRU, so
+switching between a few models or repeating a query never pays the loading
+cost again, while a long session over many models does not keep all of them
+in memory. sentence_transformers itself is only imported when the first
+model is loaded, which keeps app startup fast. The dimension and maximum
+sequence length of every model are recorded when it is loaded and stay
+known after it has been evicted. warm() loads models in a background thread,
+e.g. the default model while the UI is starting. Lookups are counted as
+hits and misses of the 'model' cache in docsearch.metrics, and loads are
+timed as model_load_seconds.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from docsearch.metrics import metrics
+
+DEFAULT_MAX_LOADED = 3
+
+
+def load_sentence_transformer(model_name: str):
+    """Loads a SentenceTransformer, importing the library on first use."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class ModelRegistry:
+    """Thread-safe LRU of loaded encoders, keyed by model name."""
+
+    def __init__(self, max_loaded: int = DEFAULT_MAX_LOADED,
+                 loader: Callable[[str], object] = load_sentence_transformer):
+        if max_loaded < 1:
+            raise ValueError("max_loaded must be at least 1")
+        self.max_loaded = max_loaded
+        self._loader = loader
+        self._models = OrderedDict()
+        self._info = {}
+        self._loading = {}  # Model name -> lock held while that model is being loaded
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str):
+        """Returns the model, loading it (and evicting the least recently used one) if needed.
+
+        Concurrent calls for the same model wait for a single load; different
+        models load in parallel.
+        """
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                metrics.count('cache_hits_total', cache='model')
+                return self._models[model_name]
+            loading = self._loading.setdefault(model_name, threading.Lock())
+        metrics.count('cache_misses_total', cache='model')
+        with loading:
+            with self._lock:
+                if model_name in self._models:  # Loaded by another thread while we waited
+                    self._models.move_to_end(model_name)
+                    return self._models[model_name]
+            with metrics.timer('model_load_seconds'):
+                model = self._loader(model_name)
+            with self._lock:
+                self._info[model_name] = {
+                    'dimension': model.get_sentence_embedding_dimension(),
+                    'max_seq_length': getattr(model, 'max_seq_length', None),
+                }
+                self._models[model_name] = model
+                while len(self._models) > self.max_loaded:
+                    self._models.popitem(last=False)
+                self._loading.pop(model_name, None)
+        return model
+
+    def info(self, model_name: str) -> Dict:
+        """Returns {'dimension', 'max_seq_length'} of a model, loading it if it was never loaded."""
+        with self._lock:
+            if model_name in self._info:
+                return dict(self._info[model_name])
+        self.get(model_name)
+        with self._lock:
+            return dict(self._info[model_name])
+
+    def dimension(self, model_name: str) -> int:
+        """Returns the embedding dimension of a model."""
+        return self.info(model_name)['dimension']
+
+    def loaded(self) -> List[str]:
+        """Returns the names of the loaded models, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def warm(self, model_names: Iterable[str], on_error: Optional[Callable[[str, Exception], None]] = None
+             ) -> threading.Thread:
+        """Loads models in a background daemon thread and returns the thread.
+
+        Failures are passed to on_error(model_name, error) if given and are
+        otherwise ignored; get() will raise them again on first real use.
+        """
+        model_names = list(model_names)
+
+        def run():
+            for model_name in model_names:
+                try:
+                    self.get(model_name)
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(model_name, e)
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+# Registry shared by everything in the process
+registry = ModelRegistry()
+
+
+def get_model(model_name: str):
+    """Returns a model from the shared registry."""
+    return registry.get(model_name)
+
+
+def model_dimension(model_name: str) -> int:
+    """Returns the embedding dimension of a model from the shared registry."""
+    return registry.dimension(model_name)
+
+
+def warm_models(model_names: Iterable[str]) -> threading.Thread:
+    """Loads models into the shared registry in the background."""
+    return registry.warm(model_names)
@@ -0,0 +1,220 @@
+"""OCR of images and scanned PDF pages with tesseract, after adaptive preprocessing.
+
+Tesseract's run time grows with the number of pixels and it reads best at
+about 300 dpi, so every image is prepared before OCR:
+
+- it is converted to grayscale (transparency is composited onto white),
+- it is scaled to the target dpi, using the resolution recorded in the
+  file (JPEGs are decoded at reduced size directly); images without one,
+  and any image above max_pixels, are scaled down to max_pixels,
+- it is binarized with Otsu's threshold.
+
+Images without text (blank or nearly uniform scans) are recognised from
+their gray-level histogram and not OCR'd at all.
+
+PDF pages whose text layer has fewer than pdf_min_chars characters but that
+contain images are treated as scanned: they are rendered with PyMuPDF in
+grayscale at the target dpi and OCR'd the same way, so image-only PDFs
+become searchable. Tesseract runs as a separate process per image, so the
+scanned pages of a PDF are OCR'd by page_workers threads in parallel while
+the next pages are rendered.
+
+Settings are a dict (see DEFAULT_OCR_CONFIG and ocr_config) passed to the
+extraction functions and engines as `ocr`. OCR time, skipped images and
+OCR'd pixels are recorded in docsearch.metrics per source ('image' or
+'pdf').
+"""
+import functools
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from docsearch.metrics import metrics
+
+DEFAULT_OCR_CONFIG = {
+    'language': 'eng',
+    'psm': 3,              # Tesseract page segmentation mode (3 = fully automatic, tesseract's default)
+    'dpi': 300,            # Resolution images are scaled to and scanned PDF pages are rendered at
+    'max_upscale': 1.0,    # Images recorded below dpi are enlarged at most this much (1.0: never)
+    'max_pixels': 9_000_000,  # Larger images, and images without a recorded dpi, are scaled down to this
+    'binarize': True,      # Threshold the grayscale image with Otsu's method before OCR
+    'skip_blank': True,    # Skip OCR of images that look like they contain no text
+    'min_contrast': 40,    # Images whose dark and light pixels differ by fewer gray levels on average are blank
+    'min_ink': 0.0001,     # Images with a smaller fraction of dark pixels are blank
+    'pdf_ocr': True,       # OCR scanned PDF pages
+    'pdf_min_chars': 20,   # PDF pages with images and less text than this are treated as scanned
+    'page_workers': 2,     # Scanned pages of one PDF OCR'd in parallel
+}
+RESULT_KEYS = ('language', 'psm', 'dpi', 'max_upscale', 'max_pixels', 'binarize', 'skip_blank', 'min_contrast',
+               'min_ink')  # Settings that change the text of an OCR'd image
+MIN_RECORDED_DPI = 50  # Lower recorded resolutions (often 1 or 0) are placeholders and ignored
+
+
+def ocr_config(config: Optional[Dict] = None, **overrides) -> Dict:
+    """Returns DEFAULT_OCR_CONFIG updated with config and overrides, after validating it."""
+    merged = dict(DEFAULT_OCR_CONFIG, **(config or {}), **overrides)
+    unknown = set(merged) - set(DEFAULT_OCR_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown OCR settings: {', '.join(sorted(unknown))}")
+    if not 0 <= merged['psm'] <= 13:
+        raise ValueError(f"psm must be between 0 and 13, got {merged['psm']!r}")
+    if merged['dpi'] <= 0 or merged['max_pixels'] <= 0 or merged['max_upscale'] <= 0:
+        raise ValueError("dpi, max_pixels and max_upscale must be positive")
+    if merged['page_workers'] < 1:
+        raise ValueError(f"page_workers must be at least 1, got {merged['page_workers']!r}")
+    return merged
+
+
+@functools.lru_cache(maxsize=None)
+def tesseract_version() -> str:
+    return str(pytesseract.get_tesseract_version())
+
+
+@functools.lru_cache(maxsize=None)
+def ocr_available() -> bool:
+    """Returns whether the tesseract executable can be run."""
+    try:
+        tesseract_version()
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return False
+    return True
+
+
+def ocr_settings(config: Dict) -> str:
+    """Describes the OCR engine and the settings that affect its output; part of the cache key for OCR'd text."""
+    return '-'.join([f"tesseract-{tesseract_version()}"] + [f"{key}={config[key]}" for key in RESULT_KEYS])
+
+
+# --- Preprocessing ---
+def _grayscale(image: Image.Image) -> Image.Image:
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image.convert('RGBA'))
+    return image if image.mode == 'L' else image.convert('L')
+
+
+def prepare_image(image: Image.Image, config: Dict, dpi: Optional[float] = None) -> Tuple[Image.Image, Optional[float]]:
+    """Returns image in grayscale, scaled to the target resolution, and its resulting dpi if known.
+
+    dpi is the image's resolution; by default the one recorded in the file.
+    """
+    if dpi is None:
+        recorded = image.info.get('dpi')
+        dpi = float(recorded[0]) if recorded and recorded[0] >= MIN_RECORDED_DPI else None
+    width, height = image.size
+    scale = min(config['dpi'] / dpi, config['max_upscale']) if dpi else 1.0
+    if width * height * scale ** 2 > config['max_pixels']:
+        scale = math.sqrt(config['max_pixels'] / (width * height))
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1 and image.format == 'JPEG':
+        image.draft('L', target)  # Decodes at a power-of-two fraction of the size, at least target
+    image = _grayscale(image)
+    if image.size != target and abs(scale - 1) > 0.02:
+        image = image.resize(target, Image.LANCZOS if scale < 1 else Image.BICUBIC)
+    return image, dpi * scale if dpi else None
+
+
+def gray_histogram(image: Image.Image) -> np.ndarray:
+    """Returns the number of pixels of each of the 256 gray levels of a grayscale image."""
+    return np.asarray(image.histogram(), dtype=np.float64)
+
+
+def otsu_threshold(histogram: np.ndarray) -> int:
+    """Returns the gray level that best separates dark from light pixels (Otsu's method); dark is <= it."""
+    dark = np.cumsum(histogram)[:-1]  # Pixels at or below each threshold
+    dark_sum = np.cumsum(histogram * np.arange(256))[:-1]
+    light = dark[-1] + histogram[-1] - dark
+    light_sum = dark_sum[-1] + 255 * histogram[-1] - dark_sum
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = dark * light * (dark_sum / dark - light_sum / light) ** 2
+    return int(np.argmax(np.nan_to_num(variance)))
+
+
+def looks_blank(histogram: np.ndarray, config: Dict) -> bool:
+    """Returns whether an image with this gray histogram looks like it has no text.
+
+    It does if Otsu's dark and light pixels differ by fewer than
+    min_contrast gray levels on average (a uniform page with scanner noise)
+    or if fewer than a min_ink fraction of the pixels are dark (a page with
+    a few specks of dust).
+    """
+    threshold = otsu_threshold(histogram)
+    levels = np.arange(256)
+    dark, light = histogram[:threshold + 1], histogram[threshold + 1:]
+    if not dark.sum() or not light.sum():
+        return True
+    contrast = (light @ levels[threshold + 1:]) / light.sum() - (dark @ levels[:threshold + 1]) / dark.sum()
+    return contrast < config['min_contrast'] or dark.sum() / histogram.sum() < config['min_ink']
+
+
+def binarize(image: Image.Image, histogram: Optional[np.ndarray] = None) -> Image.Image:
+    """Returns a grayscale image thresholded to black and white with Otsu's method."""
+    threshold = otsu_threshold(gray_histogram(image) if histogram is None else histogram)
+    return image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+# --- OCR ---
+def ocr_image(image: Image.Image, config: Dict, dpi: Optional[float] = None, source: str = 'image') -> str:
+    """Returns the text of an image, preprocessed as configured; '' if it looks blank."""
+    with metrics.timer('ocr_prepare_seconds', source=source):
+        image, dpi = prepare_image(image, config, dpi)
+        histogram = gray_histogram(image)
+        if config['skip_blank'] and looks_blank(histogram, config):
+            metrics.count('ocr_skipped_total', source=source)
+            return ''
+        if config['binarize']:
+            image = binarize(image, histogram)
+    options = f"--psm {config['psm']}" + (f" --dpi {round(dpi)}" if dpi else '')
+    metrics.count('ocr_pixels_total', image.width * image.height, source=source)
+    with metrics.timer('ocr_seconds', source=source):
+        return pytesseract.image_to_string(image, lang=config['language'], config=options)
+
+
+def needs_ocr(page, text: str, config: Dict) -> bool:
+    """Returns whether a PDF page with this text layer looks scanned: little text, but images."""
+    return len(text.strip()) < config['pdf_min_chars'] and bool(page.get_images())
+
+
+def render_page(page, config: Dict) -> Image.Image:
+    """Renders a PDF page in grayscale at the target dpi."""
+    pixmap = page.get_pixmap(dpi=config['dpi'], colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def ocr_pdf_pages(doc, numbers: Iterable[int], config: Dict) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) for the pages of an open PDF, OCR'ing scanned pages in parallel.
+
+    numbers are 0-based page indexes; pages are yielded in their order,
+    numbered from 1. Pages are rendered in this thread (PyMuPDF documents
+    are not thread-safe) and OCR'd by page_workers threads. At most
+    2 * page_workers pages are pending, which bounds the memory used by
+    rendered pages. A scanned page keeps its text layer if OCR finds less.
+    """
+    workers = config['page_workers']
+    pending = deque()  # (page number, text layer, OCR future or None)
+
+    def finish(number, text, future):
+        if future is not None:
+            ocr_text = future.result()
+            if len(ocr_text.strip()) > len(text.strip()):
+                text = ocr_text
+        return number, text
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='docsearch-ocr') as executor:
+        for number in numbers:
+            page = doc[number]
+            text = page.get_text()
+            future = None
+            if needs_ocr(page, text, config):
+                metrics.count('ocr_pdf_pages_total')
+                future = executor.submit(ocr_image, render_page(page, config), config, config['dpi'], 'pdf')
+            pending.append((number + 1, text, future))
+            while pending and (pending[0][2] is None or pending[0][2].done() or len(pending) > 2 * workers):
+                yield finish(*pending.popleft())
+        while pending:
+            yield finish(*pending.popleft())
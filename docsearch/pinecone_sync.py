@@ -0,0 +1,181 @@
+"""Incremental synchronisation of a document directory with a Pinecone index.
+
+Files are split into token-aware chunks (see docsearch.chunking) and every
+chunk is one vector. Chunk IDs are derived from the file's path and content
+hash plus the chunk number, so reordering or adding files leaves the other
+IDs unchanged. A local sync state (a docsearch.manifest manifest extended
+with each file's ID prefix and chunk count) records what was uploaded; each
+run only embeds and upserts new or changed files and deletes the vectors of
+changed and removed ones. Metadata is stored as native Pinecone fields, so
+it can be read and filtered on directly. query_documents pools the chunk
+hits of every document into one result, optionally restricted by a
+docsearch.filters filter translated into a Pinecone metadata filter, and
+query_documents_batch sends the queries of a batch concurrently.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
+from docsearch.cache import DEFAULT_CACHE_PATH
+from docsearch.chunking import (CANDIDATE_FACTOR, DEFAULT_CHUNK_OVERLAP, DEFAULT_POOL_SIZE, DEFAULT_POOLING,
+                                chunk_pages, chunker_for_model, pool_scores)
+from docsearch.discovery import DEFAULT_EXCLUDE, resolve_changes
+from docsearch.embedding import DEFAULT_BATCH_SIZE, embed_extracted
+from docsearch.extraction import DEFAULT_FILE_TIMEOUT, SUPPORTED_EXTENSIONS, iter_documents, stream_documents
+from docsearch.filters import file_type, normalize_filters, pinecone_filter
+from docsearch.manifest import load_manifest, rescan_files, save_manifest, scan_files
+from docsearch.metrics import metrics
+from docsearch.pinecone_upsert import (DEFAULT_BATCH_SIZE as DEFAULT_UPSERT_BATCH_SIZE, DEFAULT_MAX_PAYLOAD_BYTES,
+                                       DEFAULT_MAX_WORKERS, Vector, delete_vectors, upsert_vectors)
+
+MAX_QUERY_TOP_K = 10000  # Pinecone's limit on matches per query
+DEFAULT_QUERY_WORKERS = 8  # Queries sent concurrently by query_documents_batch
+
+
+def connect_index(api_key: str, environment: str, index_name: str, dimension: int,
+                  cloud: str = "aws", region: str = "us-east-1"):
+    """Connects to Pinecone and returns the named index, creating it as a serverless index if it does not exist."""
+    from pinecone import Pinecone, ServerlessSpec  # Only needed when talking to the real service
+    pinecone = Pinecone(api_key=api_key, environment=environment)
+    if index_name not in pinecone.list_indexes():
+        pinecone.create_index(index_name, dimension=dimension, spec=ServerlessSpec(cloud=cloud, region=region))
+    return pinecone.Index(index_name)
+
+
+def vector_id(path: str, content_hash: str) -> str:
+    """Returns the vector ID of a file: a digest of its relative path followed by a prefix of its content hash."""
+    path_digest = hashlib.sha256(path.replace(os.sep, '/').encode('utf-8')).hexdigest()
+    return f"{path_digest[:16]}-{content_hash[:16]}"
+
+
+def chunk_ids(entry: Dict) -> List[str]:
+    """Returns the IDs of the vectors of a file from its sync state entry."""
+    if 'chunks' not in entry:  # Uploaded as a single whole-document vector before chunking
+        return [entry['id']]
+    return [f"{entry['id']}#{number}" for number in range(entry['chunks'])]
+
+
+def vector_metadata(path: str, page: Dict) -> Dict:
+    """Returns the Pinecone metadata of a chunk of a page as native fields."""
+    metadata = page['metadata']
+    return {
+        'path': path,
+        'filename': metadata['filename'],
+        'file_type': file_type(metadata['filename']),
+        'size': metadata['size'],
+        'creation_date': metadata['creation_date'],
+        'page': page['page'],
+    }
+
+
+def sync_directory(index, model, directory: str, state_path: str, model_name: str,
+                   embedding_batch_size: int = DEFAULT_BATCH_SIZE, workers: Optional[int] = None,
+                   timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                   upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+                   max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+                   upsert_workers: int = DEFAULT_MAX_WORKERS,
+                   cache_path: Optional[str] = DEFAULT_CACHE_PATH, chunk_tokens: Optional[int] = None,
+                   chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, include: Optional[Sequence[str]] = None,
+                   exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE, paths: Optional[Iterable[str]] = None,
+                   ocr: Optional[Dict] = None) -> Dict:
+    """Brings the index up to date with directory and returns {'indexed', 'vectors', 'deleted', 'skipped_files'}.
+
+    Pages are streamed from extraction through the chunker and the encoder
+    straight into the upserts, so only a few batches of chunks are in memory
+    at a time. A different source directory or model than in the saved state
+    makes every file count as new, and every previously uploaded vector as
+    stale. New vectors are upserted before stale ones are deleted, so a
+    changed file never disappears from search results in between.
+
+    Files are discovered recursively under directory, filtered by the
+    include and exclude globs of docsearch.discovery. With paths (relative
+    to directory, e.g. from a file watcher), only those files and
+    directories are rescanned. ocr configures the OCR of images and scanned
+    PDFs (see docsearch.ocr).
+    """
+    state = load_manifest(state_path)
+    previous = state['files']
+    if state['source_directory'] != directory or state.get('model_name') != model_name:
+        previous = {}
+    stale_ids = {vector for entry in state['files'].values() for vector in chunk_ids(entry)} if not previous else set()
+
+    if paths is None or not previous:
+        files, changed, removed = scan_files(directory, iter_documents(directory, include, exclude), previous)
+    else:
+        found, cleared = resolve_changes(directory, paths, include, exclude, SUPPORTED_EXTENSIONS)
+        files, changed, removed = rescan_files(directory, found, cleared, previous)
+    stale_ids.update(vector for path in removed + changed if path in previous for vector in chunk_ids(previous[path]))
+
+    chunker = chunker_for_model(model, chunk_tokens, chunk_overlap)
+    skipped_files = []
+    indexed = 0
+
+    def vectors() -> Iterator[Vector]:
+        nonlocal indexed
+        pages = chunk_pages(stream_documents(directory, changed, workers=workers, timeout=timeout,
+                                             cache_path=cache_path, ocr=ocr), chunker)
+        for path, chunks, embeddings, error in embed_extracted(model, pages, batch_size=embedding_batch_size):
+            if error is not None:
+                skipped_files.append(path)
+                continue
+            indexed += 1
+            entry = files[path]
+            entry['id'] = vector_id(path, entry['hash'])
+            entry['chunks'] = len(chunks)
+            for vector, chunk, embedding in zip(chunk_ids(entry), chunks, embeddings):
+                stale_ids.discard(vector)  # Content changed back to an earlier version
+                yield vector, embedding.tolist(), vector_metadata(path, chunk)
+
+    with tqdm(desc="Upserting", unit="vectors") as progress:
+        upserted = upsert_vectors(index, vectors(), batch_size=upsert_batch_size, max_payload_bytes=max_payload_bytes,
+                                  max_workers=upsert_workers, progress=progress.update)
+
+    # Files that failed to load lose their old vectors too and are left out of the state, so the next run retries them
+    for path in skipped_files:
+        files.pop(path, None)
+    deleted = delete_vectors(index, sorted(stale_ids))
+
+    save_manifest(state_path, {'source_directory': directory, 'model_name': model_name, 'files': files})
+    return {'indexed': indexed, 'vectors': upserted, 'deleted': deleted, 'skipped_files': skipped_files}
+
+
+def query_documents(index, query_embedding, top_k: int, pooling: str = DEFAULT_POOLING,
+                    pool_size: int = DEFAULT_POOL_SIZE, filters: Optional[Dict] = None) -> List[Dict]:
+    """Returns the top_k documents for a query embedding, pooling the scores of their chunk matches.
+
+    filters (see docsearch.filters) is applied by Pinecone; vectors uploaded
+    before 'file_type' was stored never pass a type filter.
+
+    Each result has 'path', 'filename', the 'page' of the best chunk (None
+    for vectors uploaded before chunking), the pooled 'score' and the
+    number of matching chunks as 'hits'.
+    """
+    with metrics.timer('pinecone_request_seconds', operation='query'):
+        results = index.query(vector=np.asarray(query_embedding).tolist(),
+                              top_k=min(top_k * CANDIDATE_FACTOR, MAX_QUERY_TOP_K), include_metadata=True,
+                              filter=pinecone_filter(normalize_filters(filters)))
+    matches = results['matches']
+    if not matches:
+        return []
+    paths = [match['metadata'].get('path', match['metadata']['filename']) for match in matches]
+    _, groups = np.unique(paths, return_inverse=True)
+    _, pooled, best, hits = pool_scores(groups, [match['score'] for match in matches], pooling, pool_size)
+    return [{'path': paths[i], 'filename': matches[i]['metadata']['filename'],
+             'page': matches[i]['metadata'].get('page'), 'score': float(score), 'hits': int(count)}
+            for score, i, count in zip(pooled[:top_k], best[:top_k], hits[:top_k])]
+
+
+def query_documents_batch(index, query_embeddings, top_k: int, pooling: str = DEFAULT_POOLING,
+                          pool_size: int = DEFAULT_POOL_SIZE, filters: Optional[Dict] = None,
+                          max_workers: int = DEFAULT_QUERY_WORKERS) -> List[List[Dict]]:
+    """Returns the results of query_documents for every query embedding, with up to max_workers queries in flight."""
+    if len(query_embeddings) <= 1 or max_workers <= 1:
+        return [query_documents(index, embedding, top_k, pooling, pool_size, filters) for embedding in query_embeddings]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(query_embeddings)),
+                            thread_name_prefix='pinecone-query') as executor:
+        return list(executor.map(lambda embedding: query_documents(index, embedding, top_k, pooling, pool_size,
+                                                                   filters), query_embeddings))
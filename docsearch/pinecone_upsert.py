@@ -0,0 +1,125 @@
+"""Batched, concurrent upserts into a Pinecone index.
+
+Vectors are grouped into requests bounded both by vector count and by
+payload size, sent from a thread pool with a bounded number of requests in
+flight, and retried with exponential backoff when Pinecone throttles or
+fails transiently. Works with a real ``pinecone.Index`` or with
+docsearch.fake_pinecone.FakeIndex. Request latency (including retries),
+retries, vectors and payload bytes are recorded in docsearch.metrics.
+"""
+import json
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from docsearch.metrics import metrics
+
+DEFAULT_BATCH_SIZE = 100  # Vectors per upsert request (Pinecone accepts up to 1000)
+DEFAULT_MAX_PAYLOAD_BYTES = 2 * 1024 * 1024 - 64 * 1024  # Pinecone's 2 MB request limit, with headroom
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+MAX_IDS_PER_DELETE = 1000
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+Vector = Tuple[str, List[float], Dict]
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns whether an upsert error is throttling or a transient failure worth retrying."""
+    status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+    if status is not None:
+        return int(status) in RETRY_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _payload_size(vector: Vector) -> int:
+    """Approximates the JSON size of one vector in an upsert request."""
+    vector_id, values, metadata = vector
+    return len(vector_id) + 12 * len(values) + len(json.dumps(metadata)) + 64
+
+
+def iter_batches(vectors: Iterable[Vector], batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES) -> Iterator[List[Vector]]:
+    """Groups vectors into batches of at most batch_size vectors and about max_payload_bytes each."""
+    batch = []
+    batch_bytes = 0
+    for vector in vectors:
+        size = _payload_size(vector)
+        if batch and (len(batch) >= batch_size or batch_bytes + size > max_payload_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def call_with_retry(request, max_retries: int = DEFAULT_MAX_RETRIES, backoff: float = 0.5):
+    """Calls request(), retrying throttled or transient failures with jittered exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            metrics.count('pinecone_retries_total')
+            time.sleep(min(30.0, backoff * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def upsert_with_retry(index, batch: List[Vector], namespace: Optional[str] = None,
+                      max_retries: int = DEFAULT_MAX_RETRIES, backoff: float = 0.5) -> int:
+    """Upserts one batch, retrying throttled or transient failures."""
+    with metrics.timer('pinecone_request_seconds', operation='upsert'):
+        if namespace is None:
+            call_with_retry(lambda: index.upsert(vectors=batch), max_retries, backoff)
+        else:
+            call_with_retry(lambda: index.upsert(vectors=batch, namespace=namespace), max_retries, backoff)
+    metrics.count('pinecone_upsert_vectors_total', len(batch))
+    metrics.count('pinecone_upsert_bytes_total', sum(_payload_size(vector) for vector in batch))
+    return len(batch)
+
+
+def upsert_vectors(index, vectors: Iterable[Vector], batch_size: int = DEFAULT_BATCH_SIZE,
+                   max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES, max_workers: int = DEFAULT_MAX_WORKERS,
+                   max_retries: int = DEFAULT_MAX_RETRIES, namespace: Optional[str] = None, progress=None) -> int:
+    """Upserts (id, values, metadata) vectors in concurrent batches and returns how many were written.
+
+    vectors is consumed lazily; at most 2 * max_workers batches are held in
+    memory at a time. progress, if given, is called with the size of every
+    completed batch (e.g. a tqdm bar's update method).
+    """
+    written = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+
+        def collect(futures):
+            nonlocal written
+            for future in futures:
+                count = future.result()
+                written += count
+                if progress is not None:
+                    progress(count)
+
+        for batch in iter_batches(vectors, batch_size, max_payload_bytes):
+            if len(in_flight) >= 2 * max_workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(upsert_with_retry, index, batch, namespace, max_retries))
+        collect(wait(in_flight).done)
+    return written
+
+
+def delete_vectors(index, ids: Iterable[str], batch_size: int = MAX_IDS_PER_DELETE,
+                   max_retries: int = DEFAULT_MAX_RETRIES, namespace: Optional[str] = None) -> int:
+    """Deletes vectors by ID in batches, retrying throttled requests, and returns how many IDs were sent."""
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with metrics.timer('pinecone_request_seconds', operation='delete'):
+            if namespace is None:
+                call_with_retry(lambda: index.delete(ids=batch), max_retries)
+            else:
+                call_with_retry(lambda: index.delete(ids=batch, namespace=namespace), max_retries)
+    return len(ids)
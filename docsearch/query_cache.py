@@ -0,0 +1,170 @@
+"""Bounded LRU caches of query embeddings and search results.
+
+Encoding a query is a forward pass through the model and dominates the
+latency of a vector search. QueryCache keeps the embeddings of recent
+queries per model, so repeated and popular queries skip the encoder, and
+encodes all the uncached queries of a batch in one encoder call.
+
+Search results are cached per namespace (an engine's index and search
+options) and index version. Engines pass a version that changes whenever
+their index does, e.g. the mtime of a FAISS store's info file, so a result
+is never served from an older index: once a newer version is seen, the
+namespace's older results are dropped. Engines also invalidate their
+namespace explicitly after an update.
+
+Both caches are thread-safe. Lookups are counted as hits and misses of the
+'query_embedding' and 'query_results' caches in docsearch.metrics.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+from docsearch.metrics import metrics
+
+DEFAULT_MAX_EMBEDDINGS = 10000
+DEFAULT_MAX_RESULTS = 10000
+DEFAULT_QUERY_BATCH_SIZE = 64  # Queries per encoder forward pass
+
+
+def filters_key(filters: Optional[Dict]) -> str:
+    """Returns a hashable, order-independent form of a metadata filter for cache keys."""
+    return json.dumps(filters or {}, sort_keys=True, default=str)
+
+
+class QueryCache:
+    """Thread-safe LRUs of query embeddings, keyed by model and query, and of search results."""
+
+    def __init__(self, max_embeddings: int = DEFAULT_MAX_EMBEDDINGS, max_results: int = DEFAULT_MAX_RESULTS):
+        self.max_embeddings = max_embeddings
+        self.max_results = max_results
+        self._embeddings = OrderedDict()  # (model name, query) -> float32 vector
+        self._results = OrderedDict()  # (namespace, key) -> list of result dicts
+        self._versions = {}  # namespace -> index version of its cached results
+        self._lock = threading.Lock()
+
+    def encode(self, model, model_name: str, queries: Iterable[str],
+               batch_size: int = DEFAULT_QUERY_BATCH_SIZE) -> np.ndarray:
+        """Returns the embeddings of queries as a float32 matrix, row i being queries[i].
+
+        Queries that are not cached are deduplicated and encoded together in
+        batches of batch_size.
+        """
+        queries = list(queries)
+        rows = [None] * len(queries)
+        missing = {}  # Query -> its rows
+        with self._lock:
+            for row, query in enumerate(queries):
+                embedding = self._embeddings.get((model_name, query))
+                if embedding is None:
+                    missing.setdefault(query, []).append(row)
+                else:
+                    self._embeddings.move_to_end((model_name, query))
+                    rows[row] = embedding
+        metrics.count('cache_hits_total', len(queries) - sum(len(positions) for positions in missing.values()),
+                      cache='query_embedding')
+        metrics.count('cache_misses_total', len(missing), cache='query_embedding')
+        if missing:
+            texts = list(missing)
+            embeddings = encode_queries(model, texts, batch_size)
+            with self._lock:
+                for text, embedding in zip(texts, embeddings):
+                    for row in missing[text]:
+                        rows[row] = embedding
+                    if self.max_embeddings > 0:
+                        self._embeddings[(model_name, text)] = embedding
+                while len(self._embeddings) > self.max_embeddings:
+                    self._embeddings.popitem(last=False)
+        if not rows:
+            return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.vstack(rows)
+
+    def get_results(self, namespace: Hashable, version, key: Hashable) -> Optional[List[Dict]]:
+        """Returns a copy of the results cached for key at this index version, or None."""
+        with self._lock:
+            if self._versions.get(namespace) != version:
+                self._drop(namespace)
+                self._versions[namespace] = version
+                results = None
+            else:
+                results = self._results.get((namespace, key))
+                if results is not None:
+                    self._results.move_to_end((namespace, key))
+        metrics.count('cache_hits_total' if results is not None else 'cache_misses_total', cache='query_results')
+        return None if results is None else [dict(result) for result in results]
+
+    def put_results(self, namespace: Hashable, version, key: Hashable, results: List[Dict]) -> None:
+        """Caches a copy of results for key, unless the index has changed since version was read."""
+        with self._lock:
+            if self._versions.get(namespace, version) != version or self.max_results <= 0:
+                return
+            self._versions[namespace] = version
+            self._results[(namespace, key)] = [dict(result) for result in results]
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def _drop(self, namespace: Hashable) -> None:
+        for cached in [cached for cached in self._results if cached[0] == namespace]:
+            del self._results[cached]
+
+    def invalidate(self, namespace: Optional[Hashable] = None) -> None:
+        """Drops the cached results of a namespace, or of all namespaces; embeddings stay valid."""
+        with self._lock:
+            if namespace is None:
+                self._results.clear()
+                self._versions.clear()
+            else:
+                self._drop(namespace)
+                self._versions.pop(namespace, None)
+
+    def clear(self) -> None:
+        """Drops all cached embeddings and results."""
+        with self._lock:
+            self._embeddings.clear()
+            self._results.clear()
+            self._versions.clear()
+
+    def stats(self) -> Dict:
+        """Returns the number of cached {'embeddings', 'results'}."""
+        with self._lock:
+            return {'embeddings': len(self._embeddings), 'results': len(self._results)}
+
+
+# Cache shared by every engine in the process
+query_cache = QueryCache()
+
+
+def encode_queries(model, queries: List[str], batch_size: int = DEFAULT_QUERY_BATCH_SIZE) -> np.ndarray:
+    """Encodes queries in batches of batch_size into one float32 matrix, timed as encode_seconds{stage="query"}."""
+    with metrics.timer('encode_seconds', stage='query'):
+        embeddings = model.encode(queries, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    metrics.count('encode_texts_total', len(queries), stage='query')
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(queries), -1)
+
+
+def cached_search(cache: Optional[QueryCache], namespace: Hashable, version, queries: Iterable[str], key: Hashable,
+                  search: Callable[[List[str]], List[List[Dict]]]) -> List[List[Dict]]:
+    """Returns the results of every query, calling search(queries) once for the distinct ones not cached.
+
+    key holds the other search parameters (k, filters...) the results
+    depend on. With cache None every query is searched.
+    """
+    queries = list(queries)
+    results = [None] * len(queries)
+    missing = {}  # Query -> its positions
+    for position, query in enumerate(queries):
+        cached = cache.get_results(namespace, version, (query, key)) if cache is not None else None
+        if cached is None:
+            missing.setdefault(query, []).append(position)
+        else:
+            results[position] = cached
+    if missing:
+        texts = list(missing)
+        for text, matches in zip(texts, search(texts)):
+            if cache is not None:
+                cache.put_results(namespace, version, (text, key), matches)
+            for position in missing[text]:
+                results[position] = [dict(match) for match in matches]
+    return results
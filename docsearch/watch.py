@@ -0,0 +1,199 @@
+"""Watching a document directory and keeping an index up to date with it.
+
+DirectoryWatcher collects the paths created, modified, moved or deleted
+under a directory. It uses watchdog's native file system events
+(inotify, FSEvents, ReadDirectoryChangesW) when watchdog is installed, and
+otherwise polls the file sizes and mtimes of the tree with os.scandir every
+poll_interval seconds. Events are debounced: changes() returns a batch of
+paths once none has arrived for `debounce` seconds, or at most max_delay
+seconds after the first, so a file that is still being copied or saved
+several times in a row is indexed once.
+
+watch_directory brings an engine's index up to date once and then passes
+every batch to engine.update(directory, paths) (see docsearch.engine),
+which only rescans, extracts and embeds the changed files. New files become
+searchable within seconds, without rescanning the whole tree.
+"""
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from docsearch.discovery import DEFAULT_EXCLUDE, is_included, iter_entries
+from docsearch.extraction import SUPPORTED_EXTENSIONS
+
+DEFAULT_DEBOUNCE = 2.0  # Seconds without new events before a batch is applied
+DEFAULT_MAX_DELAY = 30.0  # Seconds after the first event by which a batch is applied even if events keep coming
+DEFAULT_POLL_INTERVAL = 2.0  # Seconds between scans when watchdog is not installed
+
+
+class DirectoryWatcher:
+    """Collects the relative paths that change under a directory, in debounced batches.
+
+    Paths matching the exclude globs (see docsearch.discovery) are ignored.
+    With use_watchdog=None, watchdog is used if it is installed. Use it as a
+    context manager, or call start() and stop().
+    """
+
+    def __init__(self, directory: str, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 debounce: float = DEFAULT_DEBOUNCE, max_delay: float = DEFAULT_MAX_DELAY,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, use_watchdog: Optional[bool] = None):
+        self.directory = os.path.abspath(directory)
+        self.exclude = exclude
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog
+        self._pending = set()
+        self._first_event = self._last_event = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._observer = None
+        self._poller = None
+        self._snapshot = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self) -> None:
+        """Starts watching; changes made from now on are reported by changes()."""
+        self._stopped.clear()
+        use_watchdog = self.use_watchdog
+        if use_watchdog is not False:
+            try:
+                from watchdog.events import FileSystemEventHandler
+                from watchdog.observers import Observer
+            except ImportError:
+                if use_watchdog:
+                    raise
+                use_watchdog = False
+        if use_watchdog is False:
+            self._snapshot = self._scan()
+            self._poller = threading.Thread(target=self._poll, name='docsearch-watch', daemon=True)
+            self._poller.start()
+            return
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type not in ('created', 'modified', 'deleted', 'moved'):
+                    return  # Opened and closed without writing
+                if event.is_directory and event.event_type == 'modified':
+                    return  # A directory's mtime changes with its entries, which get events of their own
+                watcher._record(event.src_path)
+                if event.event_type == 'moved':
+                    watcher._record(event.dest_path)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), self.directory, recursive=True)
+        self._observer.start()
+
+    def stop(self) -> None:
+        """Stops watching and wakes up a caller waiting in changes()."""
+        self._stopped.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def _record(self, path: str) -> None:
+        relpath = os.path.relpath(os.path.abspath(path), self.directory)
+        if relpath == os.curdir or relpath.startswith(os.pardir) or not is_included(relpath, exclude=self.exclude):
+            return
+        if os.path.splitext(relpath)[1] and not relpath.endswith(SUPPORTED_EXTENSIONS) and not os.path.isdir(path):
+            return  # Temporary and other unsupported files
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event = now
+            self._last_event = now
+            self._pending.add(relpath)
+            self._condition.notify_all()
+
+    def _scan(self) -> Dict[str, tuple]:
+        """Returns the size and mtime of every supported file, as a snapshot to compare with the next one."""
+        snapshot = {}
+        for relpath, entry in iter_entries(self.directory, exclude=self.exclude, extensions=SUPPORTED_EXTENSIONS):
+            try:
+                stat = entry.stat()
+            except OSError:  # Deleted since it was listed
+                continue
+            snapshot[relpath] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _poll(self) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            snapshot = self._scan()
+            for relpath in snapshot.keys() | self._snapshot.keys():
+                if snapshot.get(relpath) != self._snapshot.get(relpath):
+                    self._record(os.path.join(self.directory, relpath))
+            self._snapshot = snapshot
+
+    def changes(self, timeout: Optional[float] = None) -> List[str]:
+        """Waits for the next debounced batch of changed paths and returns it, sorted.
+
+        Returns an empty list if timeout seconds pass first or the watcher is
+        stopped. The paths are relative to the directory and may be files or
+        directories, existing or deleted, as engine.update expects them.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._stopped.is_set():
+                now = time.monotonic()
+                wait = None
+                if self._pending:
+                    ready = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+                    if now >= ready:
+                        batch = sorted(self._pending)
+                        self._pending.clear()
+                        return batch
+                    wait = ready - now
+                if deadline is not None:
+                    if now >= deadline:
+                        break
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._condition.wait(wait)
+        return []
+
+
+def watch_directory(engine, directory: str, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                    debounce: float = DEFAULT_DEBOUNCE, max_delay: float = DEFAULT_MAX_DELAY,
+                    poll_interval: float = DEFAULT_POLL_INTERVAL,
+                    on_update: Optional[Callable[[List[str], Dict], None]] = None,
+                    stop_event: Optional[threading.Event] = None) -> None:
+    """Keeps engine's index of directory up to date until stop_event is set (or forever).
+
+    The watcher is started before the initial update, so changes made while
+    it runs are not missed. on_update(paths, report) is called after every
+    update with the changed paths (empty for the initial update) and the
+    engine's report, extended with the update's 'seconds'. An update that
+    fails is reported on stderr and the daemon carries on; its files are
+    retried with their next change or the next start.
+    """
+    with DirectoryWatcher(directory, exclude, debounce, max_delay, poll_interval) as watcher:
+        paths = []
+        while True:
+            start = time.perf_counter()
+            try:
+                report = engine.update(directory, paths or None)
+            except Exception as e:
+                print(f"Error updating the index of {directory}: {type(e).__name__}: {e}", file=sys.stderr)
+            else:
+                if on_update is not None:
+                    on_update(paths, dict(report, seconds=round(time.perf_counter() - start, 3)))
+            paths = []
+            while not paths:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                paths = watcher.changes(timeout=1.0)
@@ -0,0 +1,303 @@
+"""Keyword index of document pages built with Whoosh.
+
+Every page is its own Whoosh document, and all pages of a file share its
+path so they can be replaced or deleted together. A manifest of size,
+mtime and content hash kept next to the index lets update_index re-index
+only new or changed files. Given the paths reported by a file watcher
+(see docsearch.watch), it rescans just those instead of the whole tree.
+
+Large corpora can be indexed with Whoosh's multiprocessing writer: with
+procs > 1, pages are analysed by that many writer processes, each
+buffering at most limitmb MB before flushing a segment to disk. With
+multisegment the sub-writers' segments are kept as they are instead of
+being merged at commit, which makes commits fast; optimize_index merges
+them into one segment afterwards. Merging rewrites the whole index, so
+it is worth it after a rebuild or once segment_count has grown, not after
+every small update.
+
+Searches go through a WhooshSearcher that stays open between queries:
+open_searcher keeps one per index directory and refreshes it with
+searcher.refresh(), which only reopens segments after the index has
+changed. Parsed queries are cached, so a warm query is mostly scoring.
+"""
+import functools
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.fields import ID, NUMERIC, STORED, TEXT, Schema
+from whoosh.highlight import UppercaseFormatter
+from whoosh.index import create_in, exists_in, open_dir
+from whoosh.qparser import QueryParser
+
+from docsearch.cache import DEFAULT_CACHE_PATH
+from docsearch.discovery import DEFAULT_EXCLUDE, resolve_changes
+from docsearch.extraction import DEFAULT_FILE_TIMEOUT, SUPPORTED_EXTENSIONS, iter_documents, stream_documents
+from docsearch.manifest import MANIFEST_FILE, load_manifest, rescan_files, save_manifest, scan_files
+from docsearch.metrics import metrics
+
+DEFAULT_TOP_K = 10  # Whoosh's own default limit
+DEFAULT_PAGE_LENGTH = 10
+QUERY_CACHE_SIZE = 256  # Parsed queries kept per searcher
+DEFAULT_LIMITMB = 128  # Whoosh's default indexing buffer per writer process
+
+
+def get_schema() -> Schema:
+    """Returns the schema of the index; content is stored so results can be highlighted."""
+    return Schema(path=ID(stored=True),
+                  page=NUMERIC(stored=True),
+                  filename=ID(stored=True),
+                  size=STORED,
+                  creation_date=STORED,
+                  content=TEXT(analyzer=StemmingAnalyzer(), stored=True))
+
+
+def open_index_for_update(directory: str, manifest: Dict, document_directory: str):
+    """Opens the existing index for an incremental update, or returns None if it has to be rebuilt."""
+    if not exists_in(directory) or manifest['source_directory'] != document_directory:
+        return None
+    index = open_dir(directory)
+    if 'page' not in index.schema or not index.schema['content'].stored:  # Created by an older version
+        return None
+    return index
+
+
+def index_source_directory(directory: str) -> Optional[str]:
+    """Returns the document directory the index in directory was built from, or None if there is none."""
+    return load_manifest(os.path.join(directory, MANIFEST_FILE))['source_directory']
+
+
+class IndexUpdate:
+    """One update of the index in directory from the documents in document_directory.
+
+    Creating it opens (or recreates) the index, compares the files on disk
+    with the manifest, starts the writer and deletes the old pages of
+    changed and removed files. The pages of the files in .changed are then
+    passed to add() as they are extracted (in the (path, page, error) form
+    of stream_documents), and commit() finishes the update. This lets
+    callers feed the index from a page stream they share with other
+    indexes; update_index is the self-contained form.
+
+    Files are discovered recursively, filtered by the include and exclude
+    globs of docsearch.discovery. With paths (relative to
+    document_directory, e.g. from a file watcher), only those files and
+    directories are rescanned, unless the index has to be rebuilt anyway.
+    """
+
+    def __init__(self, directory: str, document_directory: str, incremental: bool = True,
+                 procs: Optional[int] = 1, limitmb: int = DEFAULT_LIMITMB, multisegment: bool = False,
+                 include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 paths: Optional[Iterable[str]] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.document_directory = document_directory
+        self._manifest_path = os.path.join(directory, MANIFEST_FILE)
+        manifest = load_manifest(self._manifest_path)
+        self.index = open_index_for_update(directory, manifest, document_directory) if incremental else None
+        if self.index is None:
+            close_searcher(directory)  # Its files are about to be replaced (and can't be deleted while open on Windows)
+            self.index = create_in(directory, get_schema())
+            manifest = {'source_directory': document_directory, 'files': {}}
+            paths = None
+
+        if paths is None:
+            self.files, self.changed, self.removed = scan_files(
+                document_directory, iter_documents(document_directory, include, exclude), manifest['files'])
+        else:
+            files, cleared = resolve_changes(document_directory, paths, include, exclude, SUPPORTED_EXTENSIONS)
+            self.files, self.changed, self.removed = rescan_files(document_directory, files, cleared,
+                                                                  manifest['files'])
+        self.skipped_files = []
+
+        procs = procs or os.cpu_count() or 1
+        writer_options = {'limitmb': limitmb}
+        if procs > 1:
+            writer_options.update(procs=procs, multisegment=multisegment)
+        self._writer = self.index.writer(**writer_options)
+        # Old pages of changed files are deleted up front; their new pages are added as they arrive
+        for path in self.removed + self.changed:
+            self._writer.delete_by_term('path', path)
+
+    def add(self, path: str, page: Optional[Dict], error: Optional[str]) -> None:
+        """Adds an extracted page, or records a file that failed (page None, error set)."""
+        if page is not None:
+            metrics.count('whoosh_pages_total')
+            metrics.count('whoosh_chars_total', len(page['text']))
+            self._writer.add_document(path=path,
+                                      page=page['page'],
+                                      filename=page['metadata']['filename'],
+                                      size=page['metadata']['size'],
+                                      creation_date=page['metadata']['creation_date'],
+                                      content=page['text'])
+        elif error is not None:
+            self.skipped_files.append(path)
+
+    def commit(self) -> Dict:
+        """Commits the pages and saves the manifest; returns {'indexed', 'removed', 'skipped_files'}."""
+        if self.changed or self.removed:
+            with metrics.timer('index_commit_seconds', backend='whoosh'):
+                self._writer.commit()
+        else:  # Nothing to write, e.g. only touched files; saves an empty segment generation
+            self._writer.cancel()
+
+        # Files that failed to load are dropped from the index and the manifest, so the next run retries them.
+        # Pages they produced before failing were added in the writer above and can only be deleted after its commit.
+        if self.skipped_files:
+            writer = self.index.writer()
+            for path in self.skipped_files:
+                writer.delete_by_term('path', path)
+                self.files.pop(path, None)
+            writer.commit()
+
+        save_manifest(self._manifest_path, {'source_directory': self.document_directory, 'files': self.files})
+        return {'indexed': len(self.changed) - len(self.skipped_files), 'removed': len(self.removed),
+                'skipped_files': self.skipped_files}
+
+
+def update_index(directory: str, document_directory: str, incremental: bool = True,
+                 workers: Optional[int] = None, timeout: Optional[float] = DEFAULT_FILE_TIMEOUT,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, procs: Optional[int] = 1,
+                 limitmb: int = DEFAULT_LIMITMB, multisegment: bool = False,
+                 include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = DEFAULT_EXCLUDE,
+                 paths: Optional[Iterable[str]] = None, ocr: Optional[Dict] = None) -> Dict:
+    """Creates or updates the index in directory from the documents in document_directory.
+
+    In incremental mode only new or changed files are loaded and removed
+    files are deleted; otherwise the index is rebuilt from scratch. Pages
+    are added to the writer as they are extracted, so no document is held
+    in memory as a whole. procs (None for one per CPU core), limitmb and
+    multisegment configure the writer; see the module docstring. include,
+    exclude and paths select the files to scan; see IndexUpdate. ocr
+    configures the OCR of images and scanned PDFs (see docsearch.ocr).
+    Returns {'indexed', 'removed', 'skipped_files'}.
+    """
+    update = IndexUpdate(directory, document_directory, incremental, procs, limitmb, multisegment,
+                         include, exclude, paths)
+    for path, page, error in stream_documents(document_directory, update.changed, workers=workers, timeout=timeout,
+                                              cache_path=cache_path, ocr=ocr):
+        update.add(path, page, error)
+    return update.commit()
+
+
+class WhooshSearcher:
+    """Searcher of one index that stays open across queries."""
+
+    def __init__(self, directory: str, query_cache_size: int = QUERY_CACHE_SIZE):
+        if not exists_in(directory):
+            raise FileNotFoundError(f"No index in {directory}; index the documents first")
+        self.directory = directory
+        self.index = open_dir(directory)
+        self.searcher = self.index.searcher()
+        self.highlights = self.index.schema['content'].stored
+        self._parse = functools.lru_cache(maxsize=query_cache_size)(
+            QueryParser("content", self.index.schema).parse)
+        self._lock = threading.Lock()
+
+    def _parse_query(self, query_str: str):
+        hits = self._parse.cache_info().hits
+        query = self._parse(query_str)
+        metrics.count('cache_hits_total' if self._parse.cache_info().hits > hits else 'cache_misses_total',
+                      cache='whoosh_query')
+        return query
+
+    def refresh(self) -> None:
+        """Picks up changes committed since the searcher was opened; a no-op if there were none."""
+        with self._lock:
+            self.searcher = self.searcher.refresh()
+
+    def close(self) -> None:
+        with self._lock:
+            self.searcher.close()
+
+    def _results(self, hits, highlights: bool) -> List[Dict]:
+        results = []
+        for hit in hits:
+            result = {'path': hit['path'], 'filename': hit['filename'], 'page': hit['page'], 'score': hit.score}
+            if highlights and self.highlights:
+                result['highlights'] = hit.highlights('content')
+            results.append(result)
+        return results
+
+    def search(self, query_str: str, limit: Optional[int] = DEFAULT_TOP_K, highlights: bool = True) -> List[Dict]:
+        """Returns up to limit (all if None) best matching pages as {'path', 'filename', 'page', 'score'}.
+
+        With highlights, each result also has 'highlights': the best
+        fragments of the page with the matched terms in upper case.
+        """
+        query = self._parse_query(query_str)
+        with self._lock:
+            hits = self.searcher.search(query, limit=limit)
+            hits.formatter = UppercaseFormatter()
+            return self._results(hits, highlights)
+
+    def search_page(self, query_str: str, pagenum: int = 1, pagelen: int = DEFAULT_PAGE_LENGTH,
+                    highlights: bool = True) -> Dict:
+        """Returns one page of results as {'pagenum', 'pagecount', 'total', 'results'}; pages start at 1."""
+        query = self._parse_query(query_str)
+        with self._lock:
+            hits = self.searcher.search_page(query, pagenum, pagelen=pagelen)
+            hits.results.formatter = UppercaseFormatter()
+            return {'pagenum': hits.pagenum, 'pagecount': hits.pagecount, 'total': hits.total,
+                    'results': self._results(hits, highlights)}
+
+
+_open_searchers = {}  # Absolute index directory -> WhooshSearcher
+_open_searchers_lock = threading.Lock()
+
+
+def open_searcher(directory: str) -> WhooshSearcher:
+    """Returns the open searcher of the index in directory, refreshed to its latest commit.
+
+    Raises FileNotFoundError if no index has been built in directory.
+    """
+    key = os.path.abspath(directory)
+    with _open_searchers_lock:
+        searcher = _open_searchers.get(key)
+        if searcher is None:
+            searcher = WhooshSearcher(directory)
+            _open_searchers[key] = searcher
+            return searcher
+    searcher.refresh()
+    return searcher
+
+
+def close_searcher(directory: str) -> None:
+    """Closes the open searcher of directory, if any, e.g. before the index is recreated."""
+    with _open_searchers_lock:
+        searcher = _open_searchers.pop(os.path.abspath(directory), None)
+    if searcher is not None:
+        searcher.close()
+
+
+def segment_count(directory: str) -> int:
+    """Returns the number of segments of the index in directory."""
+    if not exists_in(directory):
+        raise FileNotFoundError(f"No index in {directory}; index the documents first")
+    with open_dir(directory).reader() as reader:
+        return len(reader.leaf_readers())
+
+
+def optimize_index(directory: str) -> Dict:
+    """Merges all segments of the index in directory into one, e.g. after a multisegment rebuild.
+
+    Returns {'segments_before', 'segments_after', 'seconds'}. Open searchers
+    pick up the merged segment on their next refresh.
+    """
+    before = segment_count(directory)
+    start = time.perf_counter()
+    open_dir(directory).optimize()
+    seconds = time.perf_counter() - start
+    return {'segments_before': before, 'segments_after': segment_count(directory), 'seconds': round(seconds, 3)}
+
+
+def search_index(directory: str, query_str: str, top_k: Optional[int] = DEFAULT_TOP_K,
+                 highlights: bool = True) -> List[Dict]:
+    """Searches the index in directory with its open searcher; see WhooshSearcher.search."""
+    return open_searcher(directory).search(query_str, limit=top_k, highlights=highlights)
+
+
+def search_index_page(directory: str, query_str: str, pagenum: int = 1, pagelen: int = DEFAULT_PAGE_LENGTH,
+                      highlights: bool = True) -> Dict:
+    """Returns one page of results from the index in directory; see WhooshSearcher.search_page."""
+    return open_searcher(directory).search_page(query_str, pagenum, pagelen, highlights)
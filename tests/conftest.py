@@ -0,0 +1,63 @@
+"""Shared fixtures: a small document directory and a deterministic stand-in for the sentence-transformers models."""
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# Make the docsearch package importable when the tests are run from anywhere
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docsearch import models  # noqa: E402
+from docsearch.query_cache import query_cache  # noqa: E402
+
+DIMENSION = 32
+
+DOCUMENTS = {
+    'apples.txt': "apple orchard harvest apple cider apple pie",
+    'boats.txt': "sailing boat harbour anchor boat mast",
+    'budget.txt': "quarterly budget revenue forecast budget report",
+    'notes/travel.txt': "travel itinerary flight hotel travel visa",
+}
+
+
+class FakeModel:
+    """Embeds text as a normalized bag of hashed words, so texts sharing words are close."""
+
+    max_seq_length = 64
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return DIMENSION
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), DIMENSION), dtype=np.float32)
+        for row, text in enumerate([texts] if single else texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode('utf-8')) % DIMENSION] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(models, 'registry', models.ModelRegistry(loader=lambda model_name: FakeModel()))
+    query_cache.clear()
+    yield
+    query_cache.clear()
+
+
+def write_documents(directory, documents=None):
+    for name, text in (DOCUMENTS if documents is None else documents).items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+@pytest.fixture
+def documents(tmp_path):
+    directory = tmp_path / 'docs'
+    directory.mkdir()
+    write_documents(str(directory))
+    return str(directory)
@@ -0,0 +1,55 @@
+import os
+import time
+
+from docsearch.cache import FLUSH_INTERVAL, ExtractionCache
+
+
+def incompressible(size):
+    return os.urandom(size // 2).hex()  # Hex digits of random bytes compress to about half
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'cache.sqlite3'))
+    cache.put('hash', 'settings', "some text")
+    assert cache.get('hash', 'settings') == "some text"
+    assert cache.get('hash', 'other settings') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    cache.close()
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'cache.sqlite3'), max_bytes=1500)
+    texts = {f"hash{i}": incompressible(800) for i in range(4)}
+    for content_hash in ('hash0', 'hash1', 'hash2'):
+        cache.put(content_hash, 's', texts[content_hash])
+        time.sleep(0.01)
+    assert cache.get('hash0', 's') == texts['hash0']  # Now more recent than hash1
+    cache.put('hash3', 's', texts['hash3'])
+
+    stats = cache.stats()
+    assert stats['total_bytes'] <= 1500 and stats['evictions'] == 1
+    assert cache.get('hash1', 's') is None
+    assert all(cache.get(content_hash, 's') == texts[content_hash] for content_hash in ('hash0', 'hash2', 'hash3'))
+    cache.close()
+
+
+def test_entries_larger_than_the_limit_are_not_stored(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'cache.sqlite3'), max_bytes=100)
+    cache.put('hash', 's', incompressible(1000))
+    assert cache.get('hash', 's') is None
+    cache.close()
+
+
+def test_lookups_are_written_in_batches(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache, other = ExtractionCache(path), ExtractionCache(path)
+    cache.put('hash', 's', "text")
+    cache.get('hash', 's')
+    assert other.stats()['hits'] == 0  # Still buffered
+    for _ in range(FLUSH_INTERVAL):
+        cache.get('hash', 's')
+    assert other.stats()['hits'] == FLUSH_INTERVAL
+    cache.close()
+    assert other.stats()['hits'] == FLUSH_INTERVAL + 1
+    other.close()
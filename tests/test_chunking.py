@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import FakeModel, write_documents
+from docsearch.chunking import Chunker, chunk_pages, chunker_for_model, pool_scores
+from docsearch.engine import FaissEngine
+
+WORDS = ' '.join(f'w{number}' for number in range(10))
+
+
+class FakeTokenizer:
+    """A fast tokenizer with one token per word and two special tokens."""
+
+    is_fast = True
+
+    def __call__(self, text, **kwargs):
+        return {'offset_mapping': Chunker()._token_spans(text)}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+def test_chunks_are_token_windows_with_overlap():
+    assert Chunker(FakeTokenizer(), max_tokens=4, overlap=1).chunks(WORDS) == [
+        'w0 w1 w2 w3', 'w3 w4 w5 w6', 'w6 w7 w8 w9']
+    assert Chunker(FakeTokenizer(), max_tokens=20, overlap=2).chunks(WORDS) == [WORDS]
+    assert Chunker(FakeTokenizer()).chunks(" \n ") == []
+
+
+def test_words_stand_in_for_tokens_without_a_fast_tokenizer():
+    # 8 tokens are 6 words, and an overlap of 4 tokens is 3 words
+    assert Chunker(None, max_tokens=8, overlap=4).chunks(WORDS) == ['w0 w1 w2 w3 w4 w5', 'w3 w4 w5 w6 w7 w8',
+                                                                    'w6 w7 w8 w9']
+
+
+def test_invalid_overlap_is_rejected():
+    with pytest.raises(ValueError):
+        Chunker(max_tokens=4, overlap=4)
+
+
+def test_chunker_for_model_fits_the_model_input():
+    model = FakeModel()
+    assert chunker_for_model(model).max_tokens == 64
+    model.tokenizer = FakeTokenizer()
+    chunker = chunker_for_model(model, overlap=100)
+    assert chunker.max_tokens == 62 and chunker.overlap == 61
+    assert chunker_for_model(model, max_tokens=16).max_tokens == 16
+
+
+def test_chunk_pages_keeps_the_stream_form():
+    events = [('a.txt', {'page': 1, 'text': WORDS}, None), ('a.txt', {'page': 2, 'text': ''}, None),
+              ('a.txt', None, None), ('b.pdf', None, 'broken')]
+    chunked = list(chunk_pages(events, Chunker(FakeTokenizer(), max_tokens=6, overlap=2)))
+    assert [(path, page['page'], page['chunk'], page['text']) for path, page, _ in chunked[:2]] == [
+        ('a.txt', 1, 0, 'w0 w1 w2 w3 w4 w5'), ('a.txt', 1, 1, 'w4 w5 w6 w7 w8 w9')]
+    assert chunked[2:] == [('a.txt', None, None), ('b.pdf', None, 'broken')]
+
+
+def test_pool_scores():
+    groups = np.array([7, 3, 7, 3, 5, 7])
+    scores = np.array([0.9, 0.8, 0.1, 0.7, 0.5, 0.2])
+    pooled_groups, pooled, best, hits = pool_scores(groups, scores, 'max')
+    assert pooled_groups.tolist() == [7, 3, 5] and pooled.tolist() == [0.9, 0.8, 0.5]
+    assert best.tolist() == [0, 1, 4] and hits.tolist() == [3, 2, 1]
+
+    pooled_groups, pooled, best, hits = pool_scores(groups, scores, 'topn', pool_size=2)
+    assert pooled_groups.tolist() == [3, 7, 5]
+    assert np.allclose(pooled, [0.75, 0.55, 0.5]) and best.tolist() == [1, 0, 4]
+
+    assert [len(array) for array in pool_scores(np.array([]), np.array([]))] == [0, 0, 0, 0]
+    with pytest.raises(ValueError):
+        pool_scores(groups, scores, 'mean')
+
+
+def test_long_pages_are_searchable_beyond_the_first_chunk(tmp_path, documents):
+    text = ' '.join(['filler'] * 200 + ['zebra giraffe savanna'] * 30)
+    write_documents(documents, {'long.txt': text})
+    engine = FaissEngine(str(tmp_path / 'index'), 'fake-model', workers=0, cache_path=None, chunk_tokens=64,
+                         chunk_overlap=8)
+    engine.index(documents)
+    best = engine.search('zebra giraffe savanna', 1)[0]
+    assert best['path'] == 'long.txt' and best['page'] == 1 and best['hits'] > 1
+    assert engine.store().info['count'] == 4 + len(Chunker(None, 64, 8).chunks(text))
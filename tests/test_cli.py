@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from docsearch import cli
+from docsearch.engine import create_engine
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch, capsys):
+    # Keep the extraction cache out of the user's cache directory
+    monkeypatch.setattr(cli, 'create_engine', lambda backend, **options: create_engine(backend, cache_path=None,
+                                                                                       **options))
+
+    def run(*argv):
+        assert cli.main(['--index-dir', str(tmp_path / 'index'), '--workers', '0'] + list(argv)) == 0
+        return json.loads(capsys.readouterr().out)
+    return run
+
+
+def test_index_and_search_print_json(tmp_path, documents, run):
+    report = run('--backend', 'whoosh', 'index', documents)
+    assert report['indexed'] == 4 and report['backend'] == 'whoosh'
+
+    queries_file = tmp_path / 'queries.txt'
+    queries_file.write_text("cider\n\nharbour\n", encoding='utf-8')
+    output = run('--backend', 'whoosh', 'search', '--queries-file', str(queries_file), '-k', '1', 'budget')
+    assert output['source_directory'] == documents
+    assert [(result['query'], result['matches'][0]['path']) for result in output['results']] == [
+        ('budget', 'budget.txt'), ('cider', 'apples.txt'), ('harbour', 'boats.txt')]
+
+
+def test_faiss_backend_options(documents, run):
+    run('--backend', 'faiss', '--model', 'fake-model', '--index-type', 'hnsw', 'index', documents)
+    output = run('--backend', 'faiss', '--model', 'fake-model', 'search', '-k', '2', 'apple pie')
+    assert output['results'][0]['matches'][0]['path'] == 'apples.txt'
+
+
+def test_search_without_an_index_fails(tmp_path, capsys):
+    assert cli.main(['--backend', 'whoosh', '--index-dir', str(tmp_path / 'index'), 'search', 'anything']) == 1
+    assert 'index the documents first' in capsys.readouterr().err
+
+
+def test_search_filters(documents, run):
+    run('--backend', 'faiss', '--model', 'fake-model', 'index', documents)
+    output = run('--backend', 'faiss', '--model', 'fake-model', 'search', '--types', 'pdf,txt', '--min-size', '1000',
+                 'travel')
+    assert [match['path'] for match in output['results'][0]['matches']] == []
+    output = run('--backend', 'faiss', '--model', 'fake-model', 'search', '--types', 'pdf,txt', 'travel')
+    assert output['results'][0]['matches'][0]['path'] == os.path.join('notes', 'travel.txt')
@@ -0,0 +1,48 @@
+import os
+
+from conftest import write_documents
+from docsearch.discovery import is_included, iter_files, resolve_changes
+from docsearch.extraction import SUPPORTED_EXTENSIONS
+from docsearch.manifest import rescan_files, scan_files
+
+TRAVEL = os.path.join('notes', 'travel.txt')
+
+
+def test_files_are_found_recursively_and_filtered(documents):
+    write_documents(documents, {'.hidden/secret.txt': "secret", '~$lock.txt': "lock", 'notes/draft.txt': "draft",
+                                'notes/image.bmp': "bitmap"})
+    draft = os.path.join('notes', 'draft.txt')
+    assert sorted(iter_files(documents, extensions=SUPPORTED_EXTENSIONS)) == [
+        'apples.txt', 'boats.txt', 'budget.txt', draft, TRAVEL]
+    assert list(iter_files(documents, include=['notes/*.txt'], exclude=['draft*'])) == [TRAVEL]
+    assert list(iter_files(documents, include=['b*.txt'], exclude=['notes'])) == ['boats.txt', 'budget.txt']
+    assert not is_included(os.path.join('.hidden', 'secret.txt'))
+    assert is_included(draft, exclude=['*.pdf'], extensions=SUPPORTED_EXTENSIONS)
+
+
+def test_resolve_changes_expands_directories_and_clears_stale_paths(documents):
+    write_documents(documents, {'notes/draft.txt': "draft"})
+    files, cleared = resolve_changes(documents, ['notes', 'apples.txt', 'gone.txt', 'budget.txt'],
+                                     exclude=['budget*'], extensions=SUPPORTED_EXTENSIONS)
+    assert files == ['apples.txt', os.path.join('notes', 'draft.txt'), TRAVEL]
+    assert cleared == ['budget.txt', 'gone.txt', 'notes']
+
+
+def test_rescan_removes_files_deleted_from_a_rescanned_directory(documents):
+    write_documents(documents, {'notes/draft.txt': "draft"})
+    previous, _, _ = scan_files(documents, iter_files(documents, extensions=SUPPORTED_EXTENSIONS), {})
+    os.remove(os.path.join(documents, TRAVEL))
+    files, changed, removed = rescan_files(documents, *resolve_changes(documents, ['notes']), previous)
+    assert removed == [TRAVEL] and changed == []
+    assert sorted(files) == ['apples.txt', 'boats.txt', 'budget.txt', os.path.join('notes', 'draft.txt')]
+
+
+def test_rescan_of_files(documents):
+    previous, _, _ = scan_files(documents, iter_files(documents, extensions=SUPPORTED_EXTENSIONS), {})
+    os.remove(os.path.join(documents, 'apples.txt'))
+    write_documents(documents, {'boats.txt': "chess opening gambit", 'garden.txt': "garden tulip"})
+    files, changed, removed = rescan_files(
+        documents, *resolve_changes(documents, ['apples.txt', 'boats.txt', 'garden.txt']), previous)
+    assert removed == ['apples.txt'] and sorted(changed) == ['boats.txt', 'garden.txt']
+    assert sorted(files) == ['boats.txt', 'budget.txt', 'garden.txt', TRAVEL]
+    assert files['budget.txt'] == previous['budget.txt']
@@ -0,0 +1,27 @@
+import os
+
+from docsearch.extraction import iter_extract, load_documents
+
+
+def test_worker_pool_extracts_every_file(documents):
+    filepaths = [os.path.join(documents, name) for name in ('apples.txt', 'boats.txt', 'budget.txt')]
+    broken = os.path.join(documents, 'broken.pdf')
+    with open(broken, 'wb') as file:
+        file.write(b'not a pdf')
+    pages, finished = {}, {}
+    for filepath, page, error in iter_extract(filepaths + [broken], workers=2, cache_path=None):
+        if page is None:
+            finished[filepath] = error
+        else:
+            pages[filepath] = page['text']
+    assert set(pages) == set(filepaths)
+    assert all(finished[filepath] is None for filepath in filepaths)
+    assert finished[broken] is not None
+
+
+def test_load_documents_finds_files_recursively(documents):
+    loaded, skipped = load_documents(documents, workers=0, cache_path=None)
+    assert sorted(document['path'] for document in loaded) == ['apples.txt', 'boats.txt', 'budget.txt',
+                                                              os.path.join('notes', 'travel.txt')]
+    assert all(document['metadata']['size'] == len(document['text']) for document in loaded)
+    assert skipped == []
@@ -0,0 +1,162 @@
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from docsearch import faiss_store
+from docsearch.engine import FaissEngine
+from docsearch.query_cache import query_cache
+
+
+def make_engine(tmp_path, **options):
+    return FaissEngine(str(tmp_path / 'index'), 'fake-model', workers=0, cache_path=None, **options)
+
+
+def paths(results):
+    return [result['path'] for result in results]
+
+
+def test_index_and_search(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    report = engine.index(documents)
+    assert report['indexed'] == 4 and report['skipped_files'] == []
+    assert engine.source_directory == documents
+    assert paths(engine.search('apple cider', 1)) == ['apples.txt']
+    assert paths(engine.search('travel visa', 1)) == [os.path.join('notes', 'travel.txt')]
+
+
+def test_store_persists_across_engines(tmp_path, documents):
+    make_engine(tmp_path).index(documents)
+    engine = make_engine(tmp_path)
+    assert paths(engine.search('boat harbour', 1)) == ['boats.txt']
+    assert not [name for name in os.listdir(engine.store().directory) if name.endswith('.tmp')]
+
+
+def test_changing_search_settings_keeps_the_index(tmp_path, documents):
+    make_engine(tmp_path, config={'index_type': 'hnsw'}).index(documents)
+    engine = make_engine(tmp_path, config={'index_type': 'hnsw', 'ef_search': 8})
+    report = engine.update(documents)
+    assert report['indexed'] == 0 and report['vectors'] == 0
+    assert engine.store().config['ef_search'] == 8 and engine.store().search_params == (None, 8)
+
+    report = make_engine(tmp_path, config={'index_type': 'hnsw', 'hnsw_m': 16}).update(documents)
+    assert report['indexed'] == 4
+
+
+def test_failed_write_leaves_the_previous_store(tmp_path, documents, monkeypatch):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    directory = engine.store().directory
+
+    def fail(path, data):
+        raise OSError('disk full')
+
+    with open(os.path.join(documents, 'garden.txt'), 'w', encoding='utf-8') as file:
+        file.write("garden tulip seeds garden soil")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(faiss_store, '_save_json', fail)  # The info file is written last
+        engine.update(documents, ['garden.txt'])
+    store = faiss_store.FaissStore(directory)
+    assert store.info['count'] == store.index.ntotal == 4
+    assert paths(make_engine(tmp_path).search('apple cider', 1)) == ['apples.txt']
+
+
+def test_filters_restrict_results(tmp_path, documents):
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "apple orchard apple trees")
+    pdf.save(os.path.join(documents, 'orchard.pdf'))
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    assert set(paths(engine.search('apple orchard', 2))) == {'apples.txt', 'orchard.pdf'}
+    assert paths(engine.search('apple orchard', 5, {'types': ['pdf']})) == ['orchard.pdf']
+    assert paths(engine.search('apple orchard', 5, {'types': ['txt'], 'max_size': 100}))[0] == 'apples.txt'
+    assert 'orchard.pdf' not in paths(engine.search('apple orchard', 5, {'max_size': 100}))
+
+
+def test_update_adds_changes_and_deletes_files(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+
+    with open(os.path.join(documents, 'garden.txt'), 'w', encoding='utf-8') as file:
+        file.write("garden tulip seeds garden soil")
+    report = engine.update(documents, ['garden.txt'])
+    assert report['indexed'] == 1 and report['removed'] == 0
+    assert paths(engine.search('tulip garden', 1)) == ['garden.txt']
+
+    with open(os.path.join(documents, 'boats.txt'), 'w', encoding='utf-8') as file:
+        file.write("chess opening gambit chess endgame")
+    engine.update(documents, ['boats.txt'])
+    assert paths(engine.search('chess gambit', 1)) == ['boats.txt']
+    assert 'boats.txt' not in paths(engine.search('sailing boat anchor', 5)[:1])
+
+    os.remove(os.path.join(documents, 'garden.txt'))
+    report = engine.update(documents, ['garden.txt'])
+    assert report['removed'] == 1
+    assert 'garden.txt' not in paths(engine.search('tulip garden', 10))
+
+
+def test_deleted_files_are_tombstoned_then_compacted(tmp_path, documents, monkeypatch):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    monkeypatch.setattr(faiss_store, 'COMPACT_THRESHOLD', 0.4)
+
+    os.remove(os.path.join(documents, 'apples.txt'))
+    report = engine.update(documents)
+    store = engine.store()
+    assert report['deleted_vectors'] == 1
+    assert store.info['deleted_count'] == 1 and int(store.deleted.sum()) == 1
+    assert 'apples.txt' not in paths(engine.search('apple cider', 10))
+
+    os.remove(os.path.join(documents, 'boats.txt'))
+    report = engine.update(documents)  # 2 of 4 vectors deleted: over the threshold
+    store = engine.store()
+    assert report['deleted_vectors'] == 0
+    assert store.info['count'] == 2 and store.info['deleted_count'] == 0
+    assert sorted(paths(engine.search('budget travel', 10))) == ['budget.txt', os.path.join('notes', 'travel.txt')]
+
+
+def test_unchanged_directory_updates_nothing(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    report = engine.update(documents)
+    assert report['indexed'] == 0 and report['removed'] == 0 and report['vectors'] == 0
+
+
+def test_update_of_a_directory_removes_its_deleted_files(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    os.remove(os.path.join(documents, 'notes', 'travel.txt'))
+    report = engine.update(documents, ['notes'])
+    assert report['removed'] == 1 and report['indexed'] == 0
+    assert os.path.join('notes', 'travel.txt') not in paths(engine.search('travel visa', 10))
+
+
+@pytest.mark.parametrize('config', [{}, {'metric': 'cosine'}, {'storage': 'int8'},
+                                    {'index_type': 'hnsw', 'storage': 'float16'}])
+def test_batch_search_matches_single_searches(tmp_path, documents, config):
+    engine = make_engine(tmp_path, config=config)
+    engine.index(documents)
+    queries = ['apple pie', 'boat harbour', 'apple pie', 'budget report', 'hotel flight']
+    uncached = make_engine(tmp_path, config=config, cache_queries=False)
+    assert engine.batch_search(queries, 3) == [uncached.search(query, 3) for query in queries]
+
+
+def test_query_cache_is_invalidated_by_updates(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    assert paths(engine.search('tulip garden', 1)) != ['garden.txt']
+    assert query_cache.stats()['results'] == 1
+
+    with open(os.path.join(documents, 'garden.txt'), 'w', encoding='utf-8') as file:
+        file.write("garden tulip seeds garden soil")
+    engine.update(documents, ['garden.txt'])
+    assert paths(engine.search('tulip garden', 1)) == ['garden.txt']
+
+
+def test_query_cache_follows_search_params(tmp_path, documents):
+    engine = make_engine(tmp_path, config={'index_type': 'hnsw'})
+    engine.index(documents)
+    engine.search('apple', 2)
+    engine.store().set_search_params(ef_search=8)
+    engine.search('apple', 2)
+    assert query_cache.stats()['results'] == 2
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from docsearch.filters import FILE_DTYPE, filter_mask, normalize_filters, pinecone_filter, type_code
+
+
+@pytest.fixture
+def columns():
+    types = []
+    rows = [(type_code(name, types), size, datetime(2024, month, 1).timestamp())
+            for name, size, month in (('a.pdf', 100, 1), ('b.TXT', 5000, 3), ('c.png', 20000, 6), ('d.pdf', 800, 9))]
+    return np.array(rows, dtype=FILE_DTYPE), types
+
+
+def mask(columns, **filters):
+    return filter_mask(columns[0], columns[1], normalize_filters(filters)).tolist()
+
+
+def test_type_filter(columns):
+    assert mask(columns, types=['pdf']) == [True, False, False, True]
+    assert mask(columns, types=['.TXT', 'png']) == [False, True, True, False]
+    assert mask(columns, types='docx') == [False, False, False, False]
+
+
+def test_size_and_date_filters(columns):
+    assert mask(columns, min_size=800) == [False, True, True, True]
+    assert mask(columns, max_size=5000) == [True, True, False, True]
+    assert mask(columns, created_after='2024-03-01') == [False, True, True, True]
+    assert mask(columns, created_before='2024-06-01', created_after=datetime(2024, 2, 1)) == [False, True, True, False]
+
+
+def test_filters_combine(columns):
+    assert mask(columns, types=['pdf'], min_size=500, created_after='2024-02-01') == [False, False, False, True]
+    assert mask(columns) == [True] * 4
+
+
+def test_unknown_filter_is_rejected():
+    with pytest.raises(ValueError):
+        normalize_filters({'author': 'me'})
+
+
+def test_pinecone_filter():
+    filters = normalize_filters({'types': ['PDF'], 'min_size': 10, 'max_size': 20})
+    assert pinecone_filter(filters) == {'file_type': {'$in': ['pdf']}, 'size': {'$gte': 10, '$lte': 20}}
+    assert pinecone_filter(normalize_filters(None)) is None
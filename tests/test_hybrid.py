@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from docsearch.engine import HybridEngine
+
+
+def result(path, score, page=1):
+    return {'path': path, 'filename': path, 'page': page, 'score': score}
+
+
+@pytest.fixture
+def hybrid(tmp_path):
+    with HybridEngine(str(tmp_path / 'whoosh'), str(tmp_path / 'faiss'), 'fake-model', workers=0,
+                      cache_path=None) as engine:
+        yield engine
+
+
+def test_rrf_ranks_results_found_by_both_legs_first(hybrid):
+    fused = hybrid._fuse({'whoosh': [result('a', 9.0), result('b', 5.0), result('c', 1.0)],
+                          'faiss': [result('b', 0.9), result('c', 0.8), result('d', 0.1)]}, 4)
+    assert [entry['path'] for entry in fused] == ['b', 'c', 'a', 'd']
+    assert fused[0]['legs'] == {'whoosh': {'rank': 2, 'score': 5.0}, 'faiss': {'rank': 1, 'score': 0.9}}
+    assert fused[0]['score'] == pytest.approx(1 / (hybrid.rrf_k + 2) + 1 / (hybrid.rrf_k + 1))
+
+
+def test_rrf_weights_favour_a_leg(hybrid):
+    hybrid.weights = {'whoosh': 1.0, 'faiss': 3.0}
+    fused = hybrid._fuse({'whoosh': [result('a', 9.0), result('b', 5.0)], 'faiss': [result('b', 0.9)]}, 2)
+    assert [entry['path'] for entry in fused] == ['b', 'a']
+
+
+def test_weighted_fusion_normalises_each_leg(hybrid):
+    hybrid.fusion = 'weighted'
+    fused = hybrid._fuse({'whoosh': [result('a', 30.0), result('b', 20.0), result('c', 10.0)],
+                          'faiss': [result('c', 0.9), result('b', 0.5)]}, 3)
+    assert [entry['path'] for entry in fused][2] == 'b'
+    assert {entry['path']: entry['score'] for entry in fused} == pytest.approx({'a': 1.0, 'b': 0.5, 'c': 1.0})
+
+
+def test_pages_of_one_file_are_fused_separately(hybrid):
+    fused = hybrid._fuse({'whoosh': [result('a', 2.0, page=1), result('a', 1.0, page=2)], 'faiss': []}, 5)
+    assert [(entry['path'], entry['page']) for entry in fused] == [('a', 1), ('a', 2)]
+
+
+def test_unknown_fusion_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        HybridEngine(str(tmp_path / 'whoosh'), str(tmp_path / 'faiss'), fusion='borda')
+
+
+def test_index_and_search_both_legs(hybrid, documents):
+    report = hybrid.index(documents)
+    assert report['skipped_files'] == []
+    results = hybrid.search('apple cider', 2)
+    assert results[0]['path'] == 'apples.txt' and set(results[0]['legs']) == {'whoosh', 'faiss'}
+    queries = ['apple cider', 'travel visa']
+    assert hybrid.batch_search(queries, 2) == [hybrid.search(query, 2) for query in queries]
+    assert hybrid.search('travel visa', 1)[0]['path'] == os.path.join('notes', 'travel.txt')
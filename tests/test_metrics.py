@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from docsearch.extraction import iter_extract
+from docsearch.metrics import Metrics, metrics, profile
+
+
+def find(entries, name, **labels):
+    return next(entry for entry in entries if entry['name'] == name and entry['labels'] == labels)
+
+
+def test_counters_histograms_and_hit_rates():
+    registry = Metrics(buckets=(0.1, 1.0, float('inf')))
+    registry.count('pages_total', 2, type='pdf')
+    registry.count('pages_total', type='pdf')
+    registry.count('cache_hits_total', 3, cache='text')
+    registry.count('cache_misses_total', cache='text')
+    for seconds in (0.05, 0.5, 5.0, 0.5):
+        registry.observe('extract_seconds', seconds)
+    snapshot = registry.snapshot()
+    assert find(snapshot['counters'], 'pages_total', type='pdf')['value'] == 3
+    histogram = find(snapshot['histograms'], 'extract_seconds')
+    assert histogram['count'] == 4 and histogram['sum'] == 6.05 and histogram['mean'] == 1.5125
+    assert histogram['buckets'] == {'0.1': 1, '1.0': 3, '+Inf': 4}
+    assert snapshot['cache_hit_rates'] == {'text': 0.75}
+
+
+def test_timers_record_also_when_the_block_raises():
+    registry = Metrics()
+    with pytest.raises(ValueError):
+        with registry.timer('search_seconds', backend='whoosh'):
+            raise ValueError
+    assert list(registry.timed_iter(range(3), 'produce_seconds')) == [0, 1, 2]
+    snapshot = registry.snapshot()
+    assert find(snapshot['histograms'], 'search_seconds', backend='whoosh')['count'] == 1
+    assert find(snapshot['histograms'], 'produce_seconds')['count'] == 1
+
+
+def test_drain_and_merge():
+    worker, parent = Metrics(), Metrics()
+    for registry in (worker, parent):
+        registry.count('files_total')
+        registry.observe('extract_seconds', 0.2)
+    parent.merge(worker.drain())
+    assert worker.snapshot()['counters'] == []
+    snapshot = parent.snapshot()
+    assert find(snapshot['counters'], 'files_total')['value'] == 2
+    assert find(snapshot['histograms'], 'extract_seconds')['count'] == 2
+
+
+def test_output_formats(tmp_path):
+    registry = Metrics(buckets=(1.0, float('inf')))
+    registry.count('queries_total', backend='a "b"')
+    registry.observe('search_seconds', 0.5)
+    assert registry.to_prometheus().splitlines() == [
+        '# TYPE docsearch_queries_total counter',
+        'docsearch_queries_total{backend="a \\"b\\""} 1',
+        '# TYPE docsearch_search_seconds histogram',
+        'docsearch_search_seconds_bucket{le="1.0"} 1',
+        'docsearch_search_seconds_bucket{le="+Inf"} 1',
+        'docsearch_search_seconds_sum 0.5',
+        'docsearch_search_seconds_count 1',
+    ]
+    registry.write(str(tmp_path / 'metrics.prom'))
+    registry.write(str(tmp_path / 'metrics.json'))
+    assert (tmp_path / 'metrics.prom').read_text() == registry.to_prometheus()
+    assert json.loads((tmp_path / 'metrics.json').read_text()) == registry.snapshot()
+
+
+def test_extraction_workers_report_to_the_parent(documents):
+    metrics.reset()
+    filepaths = [os.path.join(documents, name) for name in ('apples.txt', 'boats.txt', 'budget.txt')]
+    list(iter_extract(filepaths, workers=2, cache_path=None))
+    snapshot = metrics.snapshot()
+    metrics.reset()
+    assert find(snapshot['counters'], 'extract_files_total', type='text')['value'] == 3
+    assert find(snapshot['histograms'], 'extract_seconds', type='text')['count'] == 3
+
+
+def test_profile(tmp_path):
+    with profile(str(tmp_path / 'run.pstats'), trace_memory=True, top=5) as profiled:
+        sorted(str(number) for number in range(10000))
+    assert 'function calls' in profiled['profile'] and (tmp_path / 'run.pstats').exists()
+    assert profiled['memory']['peak_bytes'] > 0 and len(profiled['memory']['top']) <= 5
@@ -0,0 +1,106 @@
+import io
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from docsearch import extraction, ocr
+from docsearch.cache import ExtractionCache
+from docsearch.ocr import (binarize, gray_histogram, looks_blank, ocr_config, ocr_image, ocr_pdf_pages,
+                           prepare_image)
+
+
+@pytest.fixture
+def tesseract(monkeypatch):
+    """Replaces the tesseract executable; returns the (image, options) of every OCR call."""
+    calls = []
+
+    def image_to_string(image, lang, config):
+        calls.append((image, config))
+        return f"scanned text {len(calls)}"
+
+    monkeypatch.setattr(ocr.pytesseract, 'image_to_string', image_to_string)
+    monkeypatch.setattr(ocr, 'tesseract_version', lambda: '5.0.0')
+    monkeypatch.setattr(extraction, 'ocr_available', lambda: True)
+    return calls
+
+
+def text_image(size=(400, 200), mode='L'):
+    image = Image.new(mode, size, 'white')
+    draw = ImageDraw.Draw(image)
+    for row in range(20, size[1] - 20, 30):
+        draw.rectangle((20, row, size[0] - 20, row + 8), fill='black')
+    return image
+
+
+def test_config_is_validated():
+    assert ocr_config(dpi=150)['dpi'] == 150
+    for settings in ({'colour': True}, {'psm': 14}, {'dpi': 0}, {'page_workers': 0}):
+        with pytest.raises(ValueError):
+            ocr_config(settings)
+
+
+def test_images_are_scaled_to_the_target_dpi():
+    config = ocr_config(dpi=300, max_pixels=10_000)
+    image = text_image((200, 100))
+    image.info['dpi'] = (600, 600)
+    prepared, dpi = prepare_image(image, config)
+    assert prepared.size == (100, 50) and dpi == 300
+    image.info['dpi'] = (150, 150)  # Not enlarged with max_upscale 1
+    assert prepare_image(image, ocr_config(dpi=300)) == (image, 150)
+    prepared, dpi = prepare_image(text_image((400, 100)), config)  # No recorded dpi: limited to max_pixels
+    assert prepared.size == (200, 50) and dpi is None
+
+
+def test_transparency_is_composited_onto_white():
+    image = Image.new('RGBA', (50, 50), (0, 0, 0, 0))
+    prepared, _ = prepare_image(image, ocr_config())
+    assert prepared.mode == 'L' and prepared.getextrema() == (255, 255)
+
+
+def test_blank_images_are_recognised():
+    config = ocr_config()
+    noise = np.random.default_rng(0).integers(230, 256, (200, 200), dtype=np.uint8)
+    assert looks_blank(gray_histogram(Image.fromarray(noise)), config)
+    specks = Image.new('L', (1000, 1000), 'white')
+    specks.putpixel((10, 10), 0)
+    assert looks_blank(gray_histogram(specks), config)
+    assert not looks_blank(gray_histogram(text_image()), config)
+
+
+def test_binarize():
+    gray = Image.fromarray(np.tile(np.arange(256, dtype=np.uint8), (10, 1)))
+    assert sorted(color for _, color in binarize(gray).getcolors()) == [0, 255]
+
+
+def test_ocr_skips_blank_images(tesseract):
+    assert ocr_image(Image.new('L', (100, 100), 'white'), ocr_config()) == ''
+    assert tesseract == []
+    assert ocr_image(text_image(), ocr_config(psm=6), dpi=300) == "scanned text 1"
+    image, options = tesseract[0]
+    assert options == '--psm 6 --dpi 300' and {color for _, color in image.getcolors()} <= {0, 255}
+
+
+def test_scanned_pdf_pages_are_ocrd_in_order(tesseract):
+    scan = io.BytesIO()
+    text_image().save(scan, format='PNG')
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "a page with a text layer of its own")
+    for _ in range(3):
+        doc.new_page().insert_image(fitz.Rect(0, 0, 400, 200), stream=scan.getvalue())
+    pages = list(ocr_pdf_pages(doc, range(doc.page_count), ocr_config(page_workers=2, dpi=72)))
+    assert [number for number, _ in pages] == [1, 2, 3, 4]
+    assert pages[0][1].strip() == "a page with a text layer of its own"
+    assert sorted(text for _, text in pages[1:]) == ["scanned text 1", "scanned text 2", "scanned text 3"]
+    assert len(tesseract) == 3
+
+
+def test_image_files_are_ocrd_once(tmp_path, tesseract):
+    path = str(tmp_path / 'scan.png')
+    text_image().save(path)
+    cache = ExtractionCache(str(tmp_path / 'cache.sqlite3'))
+    assert list(extraction.iter_pages(path, cache)) == [(1, "scanned text 1")]
+    assert list(extraction.iter_pages(path, cache)) == [(1, "scanned text 1")]
+    assert list(extraction.iter_pages(path, cache, ocr={'psm': 6})) == [(1, "scanned text 2")]
+    cache.close()
@@ -0,0 +1,53 @@
+import os
+
+from docsearch.engine import PineconeEngine
+
+
+def make_engine(tmp_path, **options):
+    return PineconeEngine('fake-model', offline=True, workers=0, cache_path=None, **options)
+
+
+def paths(results):
+    return [result['path'] for result in results]
+
+
+def test_sync_uploads_only_changes(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    report = engine.index(documents)
+    assert report['indexed'] == 4 and report['deleted'] == 0
+    assert engine.pinecone_index.describe_index_stats()['total_vector_count'] == report['vectors']
+    assert paths(engine.search('boat harbour', 1)) == ['boats.txt']
+    assert engine.update(documents)['indexed'] == 0
+
+    with open(os.path.join(documents, 'boats.txt'), 'w', encoding='utf-8') as file:
+        file.write("chess opening gambit chess endgame")
+    os.remove(os.path.join(documents, 'apples.txt'))
+    report = engine.update(documents)
+    assert report['indexed'] == 1 and report['deleted'] == 2
+    assert paths(engine.search('chess gambit', 1)) == ['boats.txt']
+    assert 'apples.txt' not in paths(engine.search('apple cider', 10))
+
+
+def test_offline_runs_leave_the_state_file_alone(tmp_path, documents):
+    state_path = tmp_path / 'pinecone_sync.json'
+    state_path.write_text('{"source_directory": "elsewhere", "files": {}}')
+    engine = make_engine(tmp_path, state_path=str(state_path))
+    engine.index(documents)
+    assert engine.source_directory == documents
+    assert state_path.read_text() == '{"source_directory": "elsewhere", "files": {}}'
+
+
+def test_filters_are_applied_by_the_index(tmp_path, documents):
+    engine = make_engine(tmp_path)
+    engine.index(documents)
+    assert paths(engine.search('apple cider', 5, {'types': ['pdf']})) == []
+    assert paths(engine.search('apple cider', 1, {'types': ['txt']})) == ['apples.txt']
+
+
+def test_batch_search_matches_single_searches(tmp_path, documents):
+    engine = make_engine(tmp_path, cache_queries=False)
+    engine.index(documents)
+    queries = ['apple pie', 'boat harbour', 'apple pie', 'hotel flight']
+    assert engine.batch_search(queries, 2) == [engine.search(query, 2) for query in queries]
+    assert [paths(results)[0] for results in engine.batch_search(queries, 2)] == [
+        'apples.txt', 'boats.txt', 'apples.txt', os.path.join('notes', 'travel.txt')]
@@ -0,0 +1,71 @@
+import pytest
+
+from docsearch import pinecone_upsert
+from docsearch.fake_pinecone import MAX_REQUEST_BYTES, MAX_VECTORS_PER_UPSERT, FakeIndex, FakePineconeError
+from docsearch.pinecone_upsert import call_with_retry, delete_vectors, iter_batches, upsert_vectors
+
+
+def make_vectors(count, dimension=4, text=''):
+    return [(f'id{number}', [float(number)] * dimension, {'text': text}) for number in range(count)]
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pinecone_upsert.time, 'sleep', lambda seconds: None)
+
+
+def test_batches_respect_count_and_payload_limits():
+    batches = list(iter_batches(make_vectors(25), batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+
+    large = make_vectors(10, text='x' * 1000)
+    batches = list(iter_batches(large, batch_size=100, max_payload_bytes=3500))
+    assert all(len(batch) <= 3 for batch in batches) and sum(len(batch) for batch in batches) == 10
+    assert [vector for batch in batches for vector in batch] == large
+
+
+def test_oversized_requests_are_split_to_fit_the_index():
+    index = FakeIndex(dimension=4)
+    vectors = make_vectors(MAX_VECTORS_PER_UPSERT + 1, text='x' * (MAX_REQUEST_BYTES // 800))
+    with pytest.raises(FakePineconeError):
+        index.upsert(vectors[:MAX_VECTORS_PER_UPSERT])
+    assert upsert_vectors(index, vectors, batch_size=MAX_VECTORS_PER_UPSERT, max_workers=2) == len(vectors)
+    assert index.describe_index_stats()['total_vector_count'] == len(vectors)
+
+
+def test_throttled_upserts_are_retried(no_backoff):
+    index = FakeIndex(dimension=4, throttle_rate=0.3)
+    assert upsert_vectors(index, make_vectors(200), batch_size=10, max_workers=4, max_retries=20) == 200
+    assert index.throttled > 0 and index.requests == 20 + index.throttled
+    assert index.describe_index_stats()['total_vector_count'] == 200
+
+
+def test_only_transient_errors_are_retried(no_backoff):
+    calls = []
+
+    def request(status):
+        calls.append(status)
+        raise FakePineconeError(status, "error")
+
+    with pytest.raises(FakePineconeError):
+        call_with_retry(lambda: request(503), max_retries=2)
+    with pytest.raises(FakePineconeError):
+        call_with_retry(lambda: request(400), max_retries=2)
+    assert calls == [503, 503, 503, 400]
+
+
+def test_delete_in_batches():
+    index = FakeIndex(dimension=4)
+    upsert_vectors(index, make_vectors(30))
+    assert delete_vectors(index, [f'id{number}' for number in range(25)], batch_size=10) == 25
+    assert index.describe_index_stats()['total_vector_count'] == 5
+    assert index.requests == 1 + 3
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'dotproduct', 'euclidean'])
+def test_fake_index_ranks_the_nearest_vectors_first(metric):
+    index = FakeIndex(dimension=2, metric=metric)
+    index.upsert([('near', [1.0, 0.1], {}), ('middle', [0.7, 0.7], {}), ('far', [-1.0, 0.2], {})])
+    matches = index.query([1.0, 0.0], top_k=3)['matches']
+    assert [match['id'] for match in matches] == ['near', 'middle', 'far']
+    assert matches[0]['score'] > matches[1]['score'] > matches[2]['score']
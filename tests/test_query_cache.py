@@ -0,0 +1,59 @@
+import numpy as np
+
+from conftest import FakeModel
+from docsearch.query_cache import QueryCache, cached_search
+
+
+def test_encode_reuses_embeddings_and_encodes_misses_once():
+    calls = []
+
+    class CountingModel(FakeModel):
+        def encode(self, texts, **kwargs):
+            calls.append(list(texts))
+            return super().encode(texts, **kwargs)
+
+    cache, model = QueryCache(), CountingModel()
+    first = cache.encode(model, 'model', ['apple', 'boat', 'apple'])
+    second = cache.encode(model, 'model', ['boat', 'cider'])
+    assert calls == [['apple', 'boat'], ['cider']]
+    assert np.array_equal(first[0], first[2]) and np.array_equal(first[1], second[0])
+    assert cache.encode(model, 'other model', ['apple']).shape == (1, model.get_sentence_embedding_dimension())
+    assert len(calls) == 3
+
+
+def test_caches_are_bounded():
+    cache = QueryCache(max_embeddings=2, max_results=2)
+    cache.encode(FakeModel(), 'model', ['a', 'b', 'c'])
+    for key in ('a', 'b', 'c'):
+        cache.put_results('namespace', 1, key, [{'score': 1.0}])
+    assert cache.stats() == {'embeddings': 2, 'results': 2}
+    assert cache.get_results('namespace', 1, 'a') is None
+    assert cache.get_results('namespace', 1, 'c') == [{'score': 1.0}]
+
+
+def test_results_are_dropped_when_the_version_changes():
+    cache = QueryCache()
+    cache.put_results('namespace', 1, 'query', [{'score': 1.0}])
+    cache.put_results('other', 1, 'query', [{'score': 2.0}])
+    assert cache.get_results('namespace', 2, 'query') is None
+    assert cache.get_results('namespace', 1, 'query') is None  # Older versions are gone too
+    assert cache.get_results('other', 1, 'query') == [{'score': 2.0}]
+    cache.invalidate('other')
+    assert cache.get_results('other', 1, 'query') is None
+
+
+def test_cached_search_searches_distinct_misses_once():
+    searched = []
+
+    def search(queries):
+        searched.append(queries)
+        return [[{'query': query}] for query in queries]
+
+    cache = QueryCache()
+    results = cached_search(cache, 'namespace', 1, ['a', 'b', 'a'], 5, search)
+    assert [result[0]['query'] for result in results] == ['a', 'b', 'a']
+    results[0][0]['query'] = 'changed'  # Callers get copies
+    assert cached_search(cache, 'namespace', 1, ['a', 'c'], 5, search)[0] == [{'query': 'a'}]
+    assert searched == [['a', 'b'], ['c']]
+    cached_search(None, 'namespace', 1, ['a'], 5, search)
+    assert searched[-1] == ['a']
@@ -0,0 +1,48 @@
+import os
+import threading
+
+from conftest import write_documents
+from docsearch.engine import WhooshEngine
+from docsearch.watch import DirectoryWatcher, watch_directory
+
+
+def polling_watcher(directory, **options):
+    return DirectoryWatcher(directory, debounce=0.1, poll_interval=0.02, use_watchdog=False, **options)
+
+
+def test_polling_watcher_reports_debounced_batches(documents):
+    with polling_watcher(documents) as watcher:
+        assert watcher.changes(timeout=0.2) == []
+        write_documents(documents, {'garden.txt': "garden tulip", 'notes/draft.txt': "draft", 'notes/~$draft.txt': "",
+                                    'download.part': "partial", '.hidden/secret.txt': "secret"})
+        os.remove(os.path.join(documents, 'boats.txt'))
+        assert watcher.changes(timeout=5) == ['boats.txt', 'garden.txt', os.path.join('notes', 'draft.txt')]
+        assert watcher.changes(timeout=0.2) == []
+
+
+def test_watch_directory_applies_changes(tmp_path, documents):
+    engine = WhooshEngine(str(tmp_path / 'index'), workers=0, cache_path=None)
+    updates = []
+    updated = threading.Condition()
+
+    def on_update(paths, report):
+        with updated:
+            updates.append((paths, report))
+            updated.notify_all()
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_directory, args=(engine, documents),
+                              kwargs={'debounce': 0.1, 'poll_interval': 0.02, 'on_update': on_update,
+                                      'stop_event': stop_event})
+    thread.start()
+    try:
+        with updated:
+            assert updated.wait_for(lambda: len(updates) == 1, timeout=10)
+            assert updates[0][0] == [] and updates[0][1]['indexed'] == 4
+            write_documents(documents, {'garden.txt': "garden tulip seeds"})
+            assert updated.wait_for(lambda: len(updates) == 2, timeout=10)
+        assert updates[1][0] == ['garden.txt'] and updates[1][1]['indexed'] == 1
+        assert [result['path'] for result in engine.search('tulip')] == ['garden.txt']
+    finally:
+        stop_event.set()
+        thread.join()
@@ -0,0 +1,113 @@
+import os
+
+from conftest import write_documents
+from docsearch import whoosh_index
+from docsearch.engine import WhooshEngine
+from docsearch.metrics import metrics
+
+
+def update(tmp_path, documents, **options):
+    return whoosh_index.update_index(str(tmp_path / 'index'), documents, workers=0, cache_path=None, **options)
+
+
+def search(tmp_path, query, top_k=10):
+    return [result['path'] for result in whoosh_index.search_index(str(tmp_path / 'index'), query, top_k)]
+
+
+def test_incremental_update_indexes_only_changes(tmp_path, documents):
+    assert update(tmp_path, documents)['indexed'] == 4
+    assert update(tmp_path, documents) == {'indexed': 0, 'removed': 0, 'skipped_files': []}
+
+    with open(os.path.join(documents, 'boats.txt'), 'w', encoding='utf-8') as file:
+        file.write("chess opening gambit chess endgame")
+    os.remove(os.path.join(documents, 'apples.txt'))
+    assert update(tmp_path, documents) == {'indexed': 1, 'removed': 1, 'skipped_files': []}
+    assert search(tmp_path, 'gambit') == ['boats.txt']
+    assert search(tmp_path, 'harbour') == [] and search(tmp_path, 'cider') == []
+
+
+def test_another_source_directory_rebuilds_the_index(tmp_path, documents):
+    update(tmp_path, documents)
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'garden.txt').write_text("garden tulip seeds", encoding='utf-8')
+    assert update(tmp_path, str(other))['indexed'] == 1
+    assert whoosh_index.index_source_directory(str(tmp_path / 'index')) == str(other)
+    assert search(tmp_path, 'apple') == [] and search(tmp_path, 'tulip') == ['garden.txt']
+
+
+def test_failed_files_are_skipped_and_retried(tmp_path, documents):
+    with open(os.path.join(documents, 'broken.pdf'), 'wb') as file:
+        file.write(b'not a pdf')
+    report = update(tmp_path, documents)
+    assert report['indexed'] == 4 and report['skipped_files'] == ['broken.pdf']
+    assert update(tmp_path, documents)['skipped_files'] == ['broken.pdf']
+
+
+def test_update_of_paths_removes_files_deleted_from_a_directory(tmp_path, documents):
+    update(tmp_path, documents)
+    write_documents(documents, {'notes/packing.txt': "packing list passport"})
+    os.remove(os.path.join(documents, 'notes', 'travel.txt'))
+    assert WhooshEngine(str(tmp_path / 'index'), workers=0, cache_path=None).update(documents, ['notes']) == {
+        'indexed': 1, 'removed': 1, 'skipped_files': []}
+    assert search(tmp_path, 'itinerary') == [] and search(tmp_path, 'passport') == [os.path.join('notes', 'packing.txt')]
+
+
+def test_update_of_paths_removes_deleted_and_excluded_files(tmp_path, documents):
+    update(tmp_path, documents)
+    os.remove(os.path.join(documents, 'apples.txt'))
+    report = update(tmp_path, documents, paths=['apples.txt', 'budget.txt'], exclude=['budget*'])
+    assert report['removed'] == 2 and report['indexed'] == 0
+    assert search(tmp_path, 'cider OR revenue') == [] and search(tmp_path, 'harbour') == ['boats.txt']
+
+
+def test_search_limit_and_highlights(tmp_path, documents):
+    update(tmp_path, documents)
+    results = whoosh_index.search_index(str(tmp_path / 'index'), 'apple OR boat OR budget', top_k=2)
+    assert len(results) == 2
+    result = whoosh_index.search_index(str(tmp_path / 'index'), 'cider')[0]
+    assert result['path'] == 'apples.txt' and result['page'] == 1 and result['score'] > 0
+    assert 'CIDER' in result['highlights']
+    assert 'highlights' not in whoosh_index.search_index(str(tmp_path / 'index'), 'cider', highlights=False)[0]
+
+
+def test_search_pages(tmp_path, documents):
+    update(tmp_path, documents)
+    query = 'apple OR boat OR budget OR travel'
+    first = whoosh_index.search_index_page(str(tmp_path / 'index'), query, 1, pagelen=3)
+    second = whoosh_index.search_index_page(str(tmp_path / 'index'), query, 2, pagelen=3)
+    assert first['total'] == 4 and first['pagecount'] == 2 and len(first['results']) == 3
+    assert second['pagenum'] == 2 and len(second['results']) == 1
+    pages = [result['path'] for result in first['results'] + second['results']]
+    assert sorted(pages) == sorted(search(tmp_path, query))
+
+
+def test_searcher_stays_open_and_sees_updates(tmp_path, documents):
+    update(tmp_path, documents)
+    searcher = whoosh_index.open_searcher(str(tmp_path / 'index'))
+    assert search(tmp_path, 'tulip') == []
+    (tmp_path / 'docs' / 'garden.txt').write_text("garden tulip seeds", encoding='utf-8')
+    update(tmp_path, documents)
+    assert search(tmp_path, 'tulip') == ['garden.txt']
+    assert whoosh_index.open_searcher(str(tmp_path / 'index')) is searcher
+
+
+def test_parsed_queries_are_cached(tmp_path, documents):
+    update(tmp_path, documents)
+    metrics.reset()
+    search(tmp_path, 'apple')
+    search(tmp_path, 'apple')
+    assert metrics.snapshot()['cache_hit_rates']['whoosh_query'] == 0.5
+    metrics.reset()
+
+
+def test_multiprocess_writer_segments_are_merged_by_optimize(tmp_path, documents):
+    # Enough files for both writer processes to get a batch of pages
+    write_documents(documents, {f'filler/{number}.txt': f"filler{number} text" for number in range(300)})
+    assert update(tmp_path, documents, procs=2, multisegment=True)['indexed'] == 304
+    assert search(tmp_path, 'filler299') == [os.path.join('filler', '299.txt')]
+    engine = WhooshEngine(str(tmp_path / 'index'))
+    assert engine.segment_count() == 2
+    report = engine.optimize()
+    assert report['segments_before'] == 2 and report['segments_after'] == engine.segment_count() == 1
+    assert sorted(search(tmp_path, 'filler299 OR cider', None)) == ['apples.txt', os.path.join('filler', '299.txt')]